@@ -1,16 +1,37 @@
+import asyncio
+import json
 import logging
-from contextlib import asynccontextmanager
+import time
+from contextlib import (
+    AsyncExitStack,
+    aclosing,
+    asynccontextmanager,
+    contextmanager,
+)
+from typing import Dict, Iterator
 
-import boto3
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
-from qdrant_client import QdrantClient
-from schemas import AskRequest
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from qdrant_client import AsyncQdrantClient
+from schemas import AskBatchRequest, AskRequest
+from secret import get_api_key
+from services.answer_cache import SemanticAnswerCache
+from services.embedding_cache import (
+    LRUTTLCache,
+    QueryEmbeddingCache,
+    SQLiteEmbeddingCache,
+)
 from services.embeddings import EmbeddingService
 from services.generation import GenerationService
+from services.metrics import RAGMetrics, RequestMetrics
 from services.prompting import PromptBuilder
 from services.rag import RAGService
-from services.retrieval import RetrievalService
+from services.retrieval import RelevanceGate, RetrievalService
+from services.streaming import MEDIA_TYPES, stream_frames
+from services.vector_index import SnapshotIndex
 from settings import Settings, load_settings
 
 
@@ -22,43 +43,248 @@ def configure_logging(level: str) -> None:
     )
 
 
+@contextmanager
+def timed(timings_ms: Dict[str, float], name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def bedrock_config(
+    settings: Settings, max_pool_connections: int, read_timeout: float
+) -> AioConfig:
+    # One profile per call type: embeddings are short requests, generation streams
+    # can pause between events (read_timeout applies to each read, not the stream)
+    return AioConfig(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=settings.bedrock_connect_timeout_seconds,
+        read_timeout=read_timeout,
+        retries={
+            "mode": settings.bedrock_retry_mode,
+            "total_max_attempts": settings.bedrock_max_attempts,
+        },
+        connector_args={"keepalive_timeout": settings.http_keepalive_seconds},
+    )
+
+
+def build_qdrant_client(
+    settings: Settings, api_key: str | None = None
+) -> AsyncQdrantClient:
+    keepalive_ms = int(settings.http_keepalive_seconds * 1000)
+    return AsyncQdrantClient(
+        url=settings.vector_db_host,
+        timeout=settings.qdrant_timeout_seconds,
+        api_key=api_key if api_key is not None else settings.qdrant_api_key,
+        prefer_grpc=settings.qdrant_prefer_grpc,
+        grpc_port=settings.qdrant_grpc_port,
+        # REST needs one connection per in-flight request, gRPC multiplexes them
+        # over the client's default channels
+        pool_size=(
+            None if settings.qdrant_prefer_grpc else settings.qdrant_max_concurrency
+        ),
+        grpc_options={
+            "grpc.keepalive_time_ms": keepalive_ms,
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+    )
+
+
+async def refresh_qdrant_client(app: FastAPI, settings: Settings) -> None:
+    """
+    Background task of the lifespan when QDRANT_API_KEY is a Secrets Manager ARN:
+    once the cached secret expires it is read again, and a rotated key means a new
+    client for the services. The old one is closed once its requests had time to
+    finish.
+    """
+    logger = logging.getLogger(__name__)
+    api_key = settings.qdrant_api_key
+    while True:
+        await asyncio.sleep(settings.secret_cache_ttl_seconds)
+        try:
+            latest = await asyncio.to_thread(
+                get_api_key,
+                settings.qdrant_api_key_secret,
+                settings.secret_cache_ttl_seconds,
+            )
+        except Exception as error:
+            logger.warning("Qdrant API key refresh failed: %s", error)
+            continue
+        if latest == api_key:
+            continue
+
+        logger.info("Qdrant API key changed, recreating the client")
+        previous = app.state.qdrant_client
+        client = build_qdrant_client(settings, api_key=latest)
+        app.state.qdrant_client = client
+        app.state.rag_service.retrieval_service.qdrant_client = client
+        if app.state.answer_cache is not None:
+            app.state.answer_cache.qdrant_client = client
+        api_key = latest
+        await asyncio.sleep(settings.qdrant_timeout_seconds)
+        await previous.close()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    settings: Settings = load_settings()
+    # Runs once per container, during the Lambda init phase (Lambda Web Adapter)
+    startup_timings_ms: Dict[str, float] = {}
+    lifespan_started = time.perf_counter()
+    with timed(startup_timings_ms, "settings"):
+        settings: Settings = load_settings()
     configure_logging(settings.log_level)
     logger = logging.getLogger(__name__)
     logger.info("Starting FastAPI RAG API")
 
-    bedrock_runtime = boto3.client(
-        "bedrock-runtime",
-        region_name=settings.aws_region,
+    exit_stack = AsyncExitStack()
+    session = get_session()
+    with timed(startup_timings_ms, "bedrock_client"):
+        # Separate clients so each call type gets its own pool and timeouts
+        bedrock_embedding_runtime = await exit_stack.enter_async_context(
+            session.create_client(
+                "bedrock-runtime",
+                region_name=settings.aws_region,
+                config=bedrock_config(
+                    settings,
+                    max_pool_connections=settings.bedrock_embedding_max_concurrency,
+                    read_timeout=settings.bedrock_embedding_read_timeout_seconds,
+                ),
+            )
+        )
+        bedrock_generation_runtime = await exit_stack.enter_async_context(
+            session.create_client(
+                "bedrock-runtime",
+                region_name=settings.aws_region,
+                config=bedrock_config(
+                    settings,
+                    max_pool_connections=settings.bedrock_generation_max_concurrency,
+                    read_timeout=settings.bedrock_generation_read_timeout_seconds,
+                ),
+            )
+        )
+    with timed(startup_timings_ms, "qdrant_client"):
+        qdrant_client = build_qdrant_client(settings)
+
+    local_index = None
+    refresh_task = None
+    if settings.retrieval_backend == "local":
+        if not settings.vector_snapshot_s3_uri:
+            raise ValueError("RETRIEVAL_BACKEND=local requires VECTOR_SNAPSHOT_S3_URI")
+        s3_client = await exit_stack.enter_async_context(
+            session.create_client(
+                "s3",
+                region_name=settings.aws_region,
+                config=AioConfig(
+                    connect_timeout=settings.bedrock_connect_timeout_seconds,
+                    retries={"mode": "adaptive", "total_max_attempts": 3},
+                ),
+            )
+        )
+        local_index = SnapshotIndex(
+            s3_client=s3_client,
+            snapshot_uri=settings.vector_snapshot_s3_uri,
+            cache_dir=settings.local_index_dir,
+            dtype=settings.local_index_dtype,
+            oversampling=settings.quantization_oversampling,
+            refresh_seconds=settings.local_index_refresh_seconds,
+        )
+        with timed(startup_timings_ms, "vector_snapshot"):
+            try:
+                await local_index.refresh()
+            except Exception as error:
+                logger.warning(
+                    "No vector snapshot loaded, retrieving from Qdrant until one is: %s",
+                    error,
+                )
+        refresh_task = asyncio.create_task(local_index.run())
+    elif settings.retrieval_backend != "qdrant":
+        raise ValueError("RETRIEVAL_BACKEND must be 'qdrant' or 'local'")
+
+    # One limit per dependency, shared by every service that calls it
+    bedrock_embedding_semaphore = asyncio.Semaphore(
+        settings.bedrock_embedding_max_concurrency
     )
-    qdrant_client = QdrantClient(
-        url=settings.vector_db_host,
-        timeout=15.0,
-        api_key=settings.qdrant_api_key,
+    bedrock_generation_semaphore = asyncio.Semaphore(
+        settings.bedrock_generation_max_concurrency
+    )
+    qdrant_semaphore = asyncio.Semaphore(settings.qdrant_max_concurrency)
+
+    shared_cache = None
+    if settings.query_embedding_cache_sqlite_path:
+        with timed(startup_timings_ms, "sqlite_embedding_cache"):
+            shared_cache = SQLiteEmbeddingCache(
+                path=settings.query_embedding_cache_sqlite_path,
+                ttl_seconds=settings.query_embedding_cache_ttl_seconds,
+            )
+    query_embedding_cache = QueryEmbeddingCache(
+        local=LRUTTLCache(
+            max_size=settings.query_embedding_cache_size,
+            ttl_seconds=settings.query_embedding_cache_ttl_seconds,
+        ),
+        shared=shared_cache,
     )
 
     embedding_service = EmbeddingService(
-        bedrock_runtime=bedrock_runtime,
+        bedrock_runtime=bedrock_embedding_runtime,
         model_id=settings.bedrock_embedding_model_id,
+        semaphore=bedrock_embedding_semaphore,
+        cache=query_embedding_cache,
     )
     retrieval_service = RetrievalService(
         qdrant_client=qdrant_client,
         collection_name=settings.qdrant_collection,
+        semaphore=qdrant_semaphore,
+        retrieval_mode=settings.retrieval_mode,
+        sparse_vector_name=settings.sparse_vector_name,
+        hybrid_prefetch_limit=settings.hybrid_prefetch_limit,
+        search_hnsw_ef=settings.search_hnsw_ef,
+        quantization_rescore=settings.quantization_rescore,
+        quantization_oversampling=settings.quantization_oversampling,
+        local_index=local_index,
+        expansion_radius=settings.context_expansion_radius,
+        relevance_gate=RelevanceGate(
+            min_score=settings.relevance_min_score,
+            min_score_gap=settings.relevance_min_score_gap,
+            gap_max_score=settings.relevance_gap_max_score,
+        ),
     )
+    with timed(startup_timings_ms, "sparse_vector_check"):
+        await retrieval_service.check_sparse_vector()
     prompt_builder = PromptBuilder(
         max_context_chunks=settings.max_context_chunks,
         max_context_chars=settings.max_context_chars,
+        max_context_tokens=settings.max_context_tokens,
     )
     generation_service = GenerationService(
-        bedrock_runtime=bedrock_runtime,
+        bedrock_runtime=bedrock_generation_runtime,
         model_id=settings.bedrock_generation_model_id,
         temperature=settings.gen_temperature,
         max_tokens=settings.gen_max_tokens,
+        semaphore=bedrock_generation_semaphore,
     )
 
+    answer_cache = None
+    if settings.answer_cache_collection:
+        answer_cache = SemanticAnswerCache(
+            qdrant_client=qdrant_client,
+            collection_name=settings.answer_cache_collection,
+            generation_model_id=settings.bedrock_generation_model_id,
+            max_distance=settings.answer_cache_max_distance,
+            ttl_seconds=settings.answer_cache_ttl_seconds,
+            semaphore=qdrant_semaphore,
+        )
+
+    metrics = RAGMetrics()
+    metrics.register_cache("query_embedding", query_embedding_cache.stats)
+    if answer_cache is not None:
+        metrics.register_cache("answer", answer_cache.stats)
+
     app.state.settings = settings
+    app.state.qdrant_client = qdrant_client
+    app.state.answer_cache = answer_cache
+    app.state.query_embedding_cache = query_embedding_cache
+    app.state.metrics = metrics
     app.state.rag_service = RAGService(
         embedding_service=embedding_service,
         retrieval_service=retrieval_service,
@@ -66,35 +292,67 @@ async def lifespan(app: FastAPI):
         generation_service=generation_service,
         top_k_default=settings.top_k_default,
         top_k_max=settings.top_k_max,
+        answer_cache=answer_cache,
+        metrics=metrics,
+        single_flight=settings.single_flight,
     )
 
+    key_refresh_task = None
+    if (settings.qdrant_api_key_secret or "").startswith("arn:aws:secretsmanager"):
+        key_refresh_task = asyncio.create_task(refresh_qdrant_client(app, settings))
+
+    startup_timings_ms["lifespan"] = round(
+        (time.perf_counter() - lifespan_started) * 1000, 1
+    )
+    app.state.startup = {"timings_ms": startup_timings_ms}
+    logger.info(f"Startup timings {json.dumps(app.state.startup)}")
+
     yield
 
     logger.info("Shutting down FastAPI RAG API")
+    if refresh_task is not None:
+        refresh_task.cancel()
+    if key_refresh_task is not None:
+        key_refresh_task.cancel()
+    await app.state.qdrant_client.close()
+    await exit_stack.aclose()
 
 
 app = FastAPI(title="RAG API", version="0.1.0", lifespan=lifespan)
 
 
 @app.post("/ask")
-def ask_stream(payload: AskRequest):
+async def ask_stream(payload: AskRequest):
     rag_service = app.state.rag_service
     logger = logging.getLogger(__name__)
 
     try:
-        generator = rag_service.stream_answer(
-            question=payload.question,
-        )
+        media_type = "text/plain; charset=utf-8"
+        headers = {
+            "Cache-Control": "no-cache",
+            # Useful if you test behind proxies. Harmless if ignored.
+            "X-Content-Type-Options": "nosniff",
+        }
+        if payload.stream_format != "text":
+            settings = app.state.settings
+            generator = stream_frames(
+                rag_service,
+                payload.question,
+                payload.stream_format,
+                flush_interval_ms=settings.stream_flush_interval_ms,
+                flush_bytes=settings.stream_flush_bytes,
+            )
+            media_type = MEDIA_TYPES[payload.stream_format]
+            # Stops nginx-style proxies from holding frames back
+            headers["X-Accel-Buffering"] = "no"
+        elif payload.include_metrics:
+            generator = _stream_with_metrics_frame(rag_service, payload.question)
+        else:
+            generator = rag_service.stream_answer(
+                question=payload.question,
+            )
 
-        return StreamingResponse(
-            generator,
-            media_type="text/plain; charset=utf-8",
-            headers={
-                "Cache-Control": "no-cache",
-                # Useful if you test behind proxies. Harmless if ignored.
-                "X-Content-Type-Options": "nosniff",
-            },
-        )
+        return StreamingResponse(generator, media_type=media_type, headers=headers)
     except ValueError as error:
         raise HTTPException(status_code=400, detail=str(error)) from error
     except Exception as error:
@@ -103,3 +361,71 @@ def ask_stream(payload: AskRequest):
             status_code=500,
             content={"detail": "Failed to process request"},
         )
+
+
+async def _stream_with_metrics_frame(rag_service, question: str):
+    # The answer is followed by one JSON frame, separated by an ASCII record
+    # separator (as in RFC 7464 JSON text sequences) so clients can split it off
+    request_metrics = RequestMetrics()
+    async for text in rag_service.stream_answer(
+        question=question, request_metrics=request_metrics
+    ):
+        yield text
+    yield "\x1e" + json.dumps(request_metrics.as_dict()) + "\n"
+
+
+@app.post("/ask/batch")
+async def ask_batch(payload: AskBatchRequest):
+    settings = app.state.settings
+    if len(payload.questions) > settings.batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.batch_max_questions} questions per batch",
+        )
+    max_concurrency = min(
+        payload.max_concurrency or settings.batch_max_concurrency,
+        settings.batch_max_concurrency,
+    )
+    return StreamingResponse(
+        _stream_batch(
+            app.state.rag_service,
+            payload.questions,
+            max_concurrency,
+            payload.include_metrics,
+        ),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Content-Type-Options": "nosniff"},
+    )
+
+
+async def _stream_batch(
+    rag_service, questions, max_concurrency: int, include_metrics: bool
+):
+    # One JSON line per question, in completion order: index is its request position
+    async with aclosing(
+        rag_service.answer_batch(questions, max_concurrency=max_concurrency)
+    ) as answers:
+        async for answer in answers:
+            line = {
+                "index": answer.index,
+                "question": answer.question,
+                "answer": answer.answer,
+                "error": answer.error,
+            }
+            if include_metrics:
+                line["metrics"] = answer.metrics.as_dict()
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=app.state.metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    answer_cache = app.state.answer_cache
+    return {
+        "query_embedding": app.state.query_embedding_cache.stats(),
+        "answer": answer_cache.stats() if answer_cache is not None else None,
+    }
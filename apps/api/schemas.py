@@ -1,8 +1,14 @@
+from typing import List, Literal
+
 from pydantic import BaseModel, Field, field_validator
 
 
 class AskRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=4000)
+    # Appends a final metrics frame to the answer stream (see README)
+    include_metrics: bool = False
+    # "ndjson" or "sse": typed frames with sources, text and metrics (see README)
+    stream_format: Literal["text", "ndjson", "sse"] = "text"
 
     @field_validator("question")
     @classmethod
@@ -11,3 +17,22 @@ class AskRequest(BaseModel):
         if not v:
             raise ValueError("question must not be blank")
         return v
+
+
+class AskBatchRequest(BaseModel):
+    # At most BATCH_MAX_QUESTIONS, checked by the endpoint
+    questions: List[str] = Field(..., min_length=1)
+    include_metrics: bool = False
+    # Answers generated at the same time, capped by BATCH_MAX_CONCURRENCY
+    max_concurrency: int | None = Field(default=None, ge=1)
+
+    @field_validator("questions")
+    @classmethod
+    def questions_must_not_be_blank(cls, v: List[str]) -> List[str]:
+        questions = [question.strip() for question in v]
+        for i, question in enumerate(questions):
+            if not question:
+                raise ValueError(f"question {i} must not be blank")
+            if len(question) > 4000:
+                raise ValueError(f"question {i} is longer than 4000 characters")
+        return questions
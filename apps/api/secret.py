@@ -1,22 +1,39 @@
 import json
 import os
+import time
+from typing import Any, Dict, Tuple
 
-import boto3
-from botocore.exceptions import ClientError
+# Secret values by name, with the time they were fetched. The API process is
+# reused across invocations, so Secrets Manager is only called again once
+# ttl_seconds passed (same cache as the embedding Lambda's secret module).
+_cache: Dict[str, Tuple[float, str]] = {}
+_secrets_manager_client: Any = None
 
 
-def get_api_key(secret_name: str) -> str:
-    secrets_manager_client = boto3.client(
-        "secretsmanager", region_name=os.getenv("AWS_REGION", "us-east-1")
-    )
-
-    if not secret_name.startswith("arn:aws:secretsmanager"):
+def get_api_key(secret_name: str | None, ttl_seconds: float = 300.0) -> str | None:
+    # Plain keys (local development) need neither boto3 nor a Secrets Manager call
+    if not secret_name or not secret_name.startswith("arn:aws:secretsmanager"):
         return secret_name
 
+    cached = _cache.get(secret_name)
+    if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+        return cached[1]
+
+    # Imported here so that it is only paid for when a secret is actually fetched
+    import boto3
+    from botocore.exceptions import ClientError
+
+    global _secrets_manager_client
+    if _secrets_manager_client is None:
+        _secrets_manager_client = boto3.client(
+            "secretsmanager", region_name=os.getenv("AWS_REGION", "us-east-1")
+        )
     try:
-        response = secrets_manager_client.get_secret_value(SecretId=secret_name)
+        response = _secrets_manager_client.get_secret_value(SecretId=secret_name)
     except ClientError as e:
         raise RuntimeError(f"Failed to retrieve secret '{secret_name}': {e}") from e
 
     secret_str = response["SecretString"]
-    return json.loads(secret_str)["api_key"]
+    api_key = json.loads(secret_str)["api_key"]
+    _cache[secret_name] = (time.monotonic(), api_key)
+    return api_key
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Sequence
+from uuid import NAMESPACE_URL, uuid5
+
+from qdrant_client.http import models as qmodels
+from services.embedding_cache import normalize_question
+from services.retrieval import RetrievedChunk, chunk_source
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    chunk_ids: List[str]
+    doc_ids: List[str]
+    distance: float
+    # Citations of the chunks the answer was built from (see chunk_source)
+    sources: List[Dict[str, Any]]
+
+
+class SemanticAnswerCache:
+    """
+    Stores answered questions in a Qdrant collection keyed by the question vector.
+    A new question within max_distance (cosine) of a cached one replays its answer.
+    Entries keep the chunk_ids/doc_ids/source_s3_uris they were built from, so the
+    embedding Lambda can delete exactly the entries affected by a re-ingestion.
+    """
+
+    def __init__(
+        self,
+        qdrant_client,
+        collection_name: str,
+        generation_model_id: str,
+        max_distance: float,
+        ttl_seconds: int,
+        semaphore: asyncio.Semaphore,
+        replay_chunk_chars: int = 64,
+    ) -> None:
+        self.qdrant_client = qdrant_client
+        self.collection_name = collection_name
+        self.generation_model_id = generation_model_id
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.semaphore = semaphore
+        self.replay_chunk_chars = replay_chunk_chars
+        self._collection_ready = False
+
+        self.hits = 0
+        self.misses = 0
+
+    async def _ensure_collection(self, vector_size: int) -> None:
+        if self._collection_ready:
+            return
+        if not await self.qdrant_client.collection_exists(self.collection_name):
+            await self.qdrant_client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=qmodels.VectorParams(
+                    size=vector_size, distance=qmodels.Distance.COSINE
+                ),
+            )
+        self._collection_ready = True
+
+    async def lookup(self, query_vector: Sequence[float]) -> CachedAnswer | None:
+        try:
+            async with self.semaphore:
+                await self._ensure_collection(len(query_vector))
+                resp = await self.qdrant_client.query_points(
+                    collection_name=self.collection_name,
+                    query=list(query_vector),
+                    query_filter=qmodels.Filter(
+                        must=[
+                            qmodels.FieldCondition(
+                                key="generation_model_id",
+                                match=qmodels.MatchValue(
+                                    value=self.generation_model_id
+                                ),
+                            ),
+                            qmodels.FieldCondition(
+                                key="created_at",
+                                range=qmodels.Range(gte=time.time() - self.ttl_seconds),
+                            ),
+                        ]
+                    ),
+                    score_threshold=1.0 - self.max_distance,
+                    limit=1,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+        except Exception as error:
+            # The cache must never break the query path
+            logger.warning("Answer cache lookup failed: %s", error)
+            self.misses += 1
+            return None
+
+        points = getattr(resp, "points", resp)
+        if not points:
+            self.misses += 1
+            return None
+
+        payload = points[0].payload or {}
+        answer = payload.get("answer")
+        if not answer:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return CachedAnswer(
+            question=payload.get("question", ""),
+            answer=answer,
+            chunk_ids=list(payload.get("chunk_ids") or []),
+            doc_ids=list(payload.get("doc_ids") or []),
+            distance=1.0 - float(points[0].score),
+            # Entries stored before sources were kept only know the chunk_ids
+            sources=payload.get("sources")
+            or [{"chunk_id": chunk_id} for chunk_id in payload.get("chunk_ids") or []],
+        )
+
+    async def store(
+        self,
+        question: str,
+        query_vector: Sequence[float],
+        answer: str,
+        chunks: List[RetrievedChunk],
+    ) -> None:
+        if not answer.strip() or not chunks:
+            return
+
+        point_id = str(
+            uuid5(
+                NAMESPACE_URL,
+                f"{self.generation_model_id}\n{normalize_question(question)}",
+            )
+        )
+        try:
+            async with self.semaphore:
+                await self._ensure_collection(len(query_vector))
+                await self.qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=[
+                        qmodels.PointStruct(
+                            id=point_id,
+                            vector=list(query_vector),
+                            payload={
+                                "question": question,
+                                "answer": answer,
+                                "chunk_ids": sorted({c.chunk_id for c in chunks}),
+                                "doc_ids": sorted({c.doc_id for c in chunks}),
+                                # Lets the embedding Lambda find the answers of a
+                                # source re-ingested under a new doc_id
+                                "source_s3_uris": sorted(
+                                    {c.source_s3_uri for c in chunks if c.source_s3_uri}
+                                ),
+                                "sources": [chunk_source(c) for c in chunks],
+                                "generation_model_id": self.generation_model_id,
+                                "created_at": time.time(),
+                            },
+                        )
+                    ],
+                    wait=False,
+                )
+        except Exception as error:
+            logger.warning("Answer cache store failed: %s", error)
+
+    async def replay(self, cached: CachedAnswer) -> AsyncGenerator[str, None]:
+        # Keep the streaming contract of GenerationService.stream_answer
+        text = cached.answer
+        for start in range(0, len(text), self.replay_chunk_chars):
+            yield text[start : start + self.replay_chunk_chars]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Protocol
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalization used for cache keys: case, surrounding punctuation and
+    whitespace differences do not change the meaning of a support question.
+    """
+    text = _WS_RE.sub(" ", text.strip().lower())
+    return text.strip(" ?!.,;:")
+
+
+def query_cache_key(model_id: str, text: str) -> str:
+    raw = f"{model_id}\n{normalize_question(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUTTLCache:
+    """
+    In-process LRU with a per-entry TTL. Thread-safe, so it can also be used
+    outside the event loop.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[str, tuple[float, List[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> List[float] | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedEmbeddingCache(Protocol):
+    """
+    Second cache tier, shared across processes/instances (e.g. SQLite, Redis).
+    """
+
+    def get(self, key: str) -> List[float] | None: ...
+
+    def set(self, key: str, value: List[float]) -> None: ...
+
+
+class SQLiteEmbeddingCache:
+    def __init__(self, path: str, ttl_seconds: float) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, vector TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> List[float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, expires_at FROM query_embeddings WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        vector, expires_at = row
+        if expires_at < time.time():
+            return None
+        return json.loads(vector)
+
+    def set(self, key: str, value: List[float]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl_seconds),
+            )
+            self._conn.commit()
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache of query vectors: in-process LRU first, then the optional
+    shared tier. Shared hits are promoted to the LRU. The shared tier may block
+    (file or network IO), so it runs in a worker thread.
+    """
+
+    def __init__(
+        self,
+        local: LRUTTLCache,
+        shared: SharedEmbeddingCache | None = None,
+    ) -> None:
+        self.local = local
+        self.shared = shared
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> List[float] | None:
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        if self.shared is not None:
+            value = await asyncio.to_thread(self.shared.get, key)
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: List[float]) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, value)
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "local_size": len(self.local),
+        }
@@ -1,23 +1,66 @@
+import asyncio
 import json
-from typing import List
+from typing import List, Sequence
+
+from services.embedding_cache import QueryEmbeddingCache, query_cache_key
 
 
 class EmbeddingService:
-    def __init__(self, bedrock_runtime, model_id: str) -> None:
+    def __init__(
+        self,
+        bedrock_runtime,
+        model_id: str,
+        semaphore: asyncio.Semaphore,
+        cache: QueryEmbeddingCache | None = None,
+    ) -> None:
         self.bedrock_runtime = bedrock_runtime
         self.model_id = model_id
+        self.semaphore = semaphore
+        self.cache = cache
 
-    def embed_query(self, text: str) -> List[float]:
-        body = {"inputText": text}
+    async def embed_query(self, text: str) -> List[float]:
+        return (await self.embed_queries([text]))[0]
 
-        response = self.bedrock_runtime.invoke_model(
-            modelId=self.model_id,
-            body=json.dumps(body),
-            contentType="application/json",
-            accept="application/json",
+    async def embed_queries(
+        self, texts: Sequence[str], return_exceptions: bool = False
+    ) -> List[List[float] | BaseException]:
+        """
+        The model embeds one text per call: the calls for texts not in the cache run
+        concurrently (bounded by the semaphore), and texts with the same cache key
+        are embedded once. With return_exceptions, a failed text gets its exception
+        in place of a vector instead of failing the others.
+        """
+        keys = [query_cache_key(self.model_id, text) for text in texts]
+        unique = dict(zip(keys, texts))
+        embeddings = await asyncio.gather(
+            *(self._embed_cached(key, text) for key, text in unique.items()),
+            return_exceptions=return_exceptions,
         )
+        by_key = dict(zip(unique, embeddings))
+        return [by_key[key] for key in keys]
+
+    async def _embed_cached(self, key: str, text: str) -> List[float]:
+        if self.cache is None:
+            return await self._invoke(text)
+
+        embedding = await self.cache.get(key)
+        if embedding is None:
+            embedding = await self._invoke(text)
+            await self.cache.set(key, embedding)
+        return embedding
+
+    async def _invoke(self, text: str) -> List[float]:
+        body = {"inputText": text}
+
+        async with self.semaphore:
+            response = await self.bedrock_runtime.invoke_model(
+                modelId=self.model_id,
+                body=json.dumps(body),
+                contentType="application/json",
+                accept="application/json",
+            )
+            payload = json.loads(await response["body"].read())
 
-        payload = json.loads(response["body"].read())
         embedding = payload.get("embedding")
 
         if embedding is None or not isinstance(embedding, list) or not embedding:
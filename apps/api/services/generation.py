@@ -1,9 +1,18 @@
+import asyncio
 import logging
-from typing import Generator
+from dataclasses import dataclass
+from typing import AsyncGenerator
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class GenerationUsage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_ms: int | None = None
+
+
 class GenerationService:
     """
     Streams text from Bedrock using ConverseStream.
@@ -17,52 +26,73 @@ class GenerationService:
         model_id: str,
         temperature: float,
         max_tokens: int,
+        semaphore: asyncio.Semaphore,
     ) -> None:
         self.bedrock_runtime = bedrock_runtime
         self.model_id = model_id
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.semaphore = semaphore
 
-    def stream_answer(
+    async def stream_answer(
         self,
         system_prompt: str,
         messages: list[dict],
-    ) -> Generator[str, None, None]:
-        response = self.bedrock_runtime.converse_stream(
-            modelId=self.model_id,
-            system=[{"text": system_prompt}],
-            messages=messages,
-            inferenceConfig={
-                "temperature": self.temperature,
-                "maxTokens": self.max_tokens,
-            },
-        )
+        usage: GenerationUsage | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Yields text deltas. If usage is given, it is filled in from the metadata
+        event that ends the stream.
+        """
+        # The semaphore bounds concurrent Bedrock streams, not open client connections
+        async with self.semaphore:
+            response = await self.bedrock_runtime.converse_stream(
+                modelId=self.model_id,
+                system=[{"text": system_prompt}],
+                messages=messages,
+                inferenceConfig={
+                    "temperature": self.temperature,
+                    "maxTokens": self.max_tokens,
+                },
+            )
 
-        stream = response.get("stream")
-        if stream is None:
-            raise RuntimeError("Bedrock converse_stream response missing 'stream'")
+            stream = response.get("stream")
+            if stream is None:
+                raise RuntimeError("Bedrock converse_stream response missing 'stream'")
 
-        # Event stream format includes multiple event types.
-        # We emit only text deltas to the client.
-        for event in stream:
-            if "contentBlockDelta" in event:
-                delta = event["contentBlockDelta"].get("delta", {})
-                text = delta.get("text")
-                if text:
-                    logger.info("Generated chunk: %s", text)
-                    yield text
-            elif "messageStop" in event:
-                # Normal end of generation
-                return
-            elif "metadata" in event:
-                # Token usage / metrics may appear here. Ignore for now.
-                continue
-            elif "internalServerException" in event:
-                raise RuntimeError(f"Bedrock internal server exception: {event}")
-            elif "validationException" in event:
-                raise RuntimeError(f"Bedrock validation exception: {event}")
-            elif "throttlingException" in event:
-                raise RuntimeError(f"Bedrock throttling exception: {event}")
-            elif "modelStreamErrorException" in event:
-                raise RuntimeError(f"Bedrock model stream error: {event}")
-            # Other events can be safely ignored for now.
+            try:
+                # Event stream format includes multiple event types.
+                # We emit only text deltas to the client.
+                async for event in stream:
+                    if "contentBlockDelta" in event:
+                        delta = event["contentBlockDelta"].get("delta", {})
+                        text = delta.get("text")
+                        if text:
+                            logger.info("Generated chunk: %s", text)
+                            yield text
+                    elif "messageStop" in event:
+                        # Normal end of generation, the metadata event follows
+                        continue
+                    elif "metadata" in event:
+                        if usage is not None:
+                            metadata = event["metadata"]
+                            tokens = metadata.get("usage", {})
+                            usage.input_tokens = tokens.get("inputTokens", 0)
+                            usage.output_tokens = tokens.get("outputTokens", 0)
+                            usage.latency_ms = metadata.get("metrics", {}).get(
+                                "latencyMs"
+                            )
+                    elif "internalServerException" in event:
+                        raise RuntimeError(
+                            f"Bedrock internal server exception: {event}"
+                        )
+                    elif "validationException" in event:
+                        raise RuntimeError(f"Bedrock validation exception: {event}")
+                    elif "throttlingException" in event:
+                        raise RuntimeError(f"Bedrock throttling exception: {event}")
+                    elif "modelStreamErrorException" in event:
+                        raise RuntimeError(f"Bedrock model stream error: {event}")
+                    # Other events can be safely ignored for now.
+            finally:
+                # Release the HTTP connection if the client disconnected mid-stream
+                stream.close()
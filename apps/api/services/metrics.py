@@ -0,0 +1,148 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from services.generation import GenerationUsage
+
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+STAGE_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Timings (ms) and Bedrock usage of one /ask request. Filled in by RAGService while
+    the answer streams.
+    """
+
+    stages_ms: Dict[str, float] = field(default_factory=dict)
+    outcome: str = "generated"
+    retrieved_chunks: int = 0
+    # Relevance gate decision and the top cosine score it was based on
+    relevance: str | None = None
+    top_score: float | None = None
+    usage: GenerationUsage = field(default_factory=GenerationUsage)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "outcome": self.outcome,
+            "stages_ms": {k: round(v, 1) for k, v in self.stages_ms.items()},
+            "retrieved_chunks": self.retrieved_chunks,
+            "relevance": self.relevance,
+            "top_score": (
+                round(self.top_score, 4) if self.top_score is not None else None
+            ),
+            "usage": asdict(self.usage),
+        }
+
+
+class _CacheStatsCollector:
+    # Reads the caches' own counters at scrape time instead of duplicating them
+    def __init__(self) -> None:
+        self.caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self):
+        lookups = CounterMetricFamily(
+            "rag_cache_lookups", "Cache lookups by result", labels=["cache", "result"]
+        )
+        hit_ratio = GaugeMetricFamily(
+            "rag_cache_hit_ratio", "Cache hit ratio since start", labels=["cache"]
+        )
+        for name, stats_fn in self.caches.items():
+            stats = stats_fn()
+            for key, value in stats.items():
+                if key.endswith("hits"):
+                    lookups.add_metric([name, key[:-1]], value)
+                elif key == "misses":
+                    lookups.add_metric([name, "miss"], value)
+            hit_ratio.add_metric([name], stats.get("hit_rate", 0.0))
+        yield lookups
+        yield hit_ratio
+
+
+class RAGMetrics:
+    """
+    Prometheus metrics of the query path: a latency histogram per stage (embed,
+    answer cache lookup, retrieval, prompt, first token, generation, total),
+    relevance gate decisions with the top retrieval scores, Bedrock token counters
+    and cache hit ratios.
+    """
+
+    def __init__(self) -> None:
+        self.registry = CollectorRegistry()
+        self.stage_seconds = Histogram(
+            "rag_stage_duration_seconds",
+            "Duration of each stage of an /ask request",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+            registry=self.registry,
+        )
+        self.requests = Counter(
+            "rag_requests",
+            "Answered /ask requests by outcome",
+            ["outcome"],
+            registry=self.registry,
+        )
+        self.relevance = Counter(
+            "rag_relevance_decisions",
+            "Relevance gate decisions, generation is skipped unless relevant",
+            ["decision"],
+            registry=self.registry,
+        )
+        self.top_score = Histogram(
+            "rag_retrieval_top_score",
+            "Cosine similarity of the best retrieved chunk",
+            buckets=SCORE_BUCKETS,
+            registry=self.registry,
+        )
+        self.tokens = Counter(
+            "bedrock_generation_tokens",
+            "Tokens reported by Bedrock ConverseStream",
+            ["direction"],
+            registry=self.registry,
+        )
+        self.bedrock_latency_seconds = Histogram(
+            "bedrock_generation_latency_seconds",
+            "Generation latency reported by Bedrock ConverseStream",
+            buckets=STAGE_BUCKETS,
+            registry=self.registry,
+        )
+        self._cache_collector = _CacheStatsCollector()
+        self.registry.register(self._cache_collector)
+
+    def register_cache(self, name: str, stats_fn: Callable[[], Dict[str, Any]]) -> None:
+        self._cache_collector.caches[name] = stats_fn
+
+    def observe(self, request_metrics: RequestMetrics) -> None:
+        for stage, value_ms in request_metrics.stages_ms.items():
+            self.stage_seconds.labels(stage=stage).observe(value_ms / 1000.0)
+        self.requests.labels(outcome=request_metrics.outcome).inc()
+        if request_metrics.relevance is not None:
+            self.relevance.labels(decision=request_metrics.relevance).inc()
+        if request_metrics.top_score is not None:
+            self.top_score.observe(request_metrics.top_score)
+
+        usage = request_metrics.usage
+        self.tokens.labels(direction="input").inc(usage.input_tokens)
+        self.tokens.labels(direction="output").inc(usage.output_tokens)
+        if usage.latency_ms is not None:
+            self.bedrock_latency_seconds.observe(usage.latency_ms / 1000.0)
+
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
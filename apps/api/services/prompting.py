@@ -1,7 +1,22 @@
+from dataclasses import dataclass
 from typing import List
 
 from services.retrieval import RetrievedChunk
 
+# What the model is told to answer without supporting context, also streamed as is
+# when the relevance gate skips generation
+FALLBACK_ANSWER = (
+    "I do not have enough information in the provided knowledge base to answer "
+    "that clearly."
+)
+
+
+# Same ratio as the chunker's estimate (TOKEN_RATIO), for chunks without a count
+CHARS_PER_TOKEN = 4.0
+# Shorter matches between neighbouring chunks are coincidences, not the splitter's
+# overlap
+MIN_OVERLAP_CHARS = 20
+
 
 def _normalize_ws(text: str) -> str:
     return "\n".join(
@@ -9,26 +24,149 @@ def _normalize_ws(text: str) -> str:
     ).strip()
 
 
+def _overlap_chars(previous: str, following: str) -> int:
+    """
+    Length of the longest suffix of previous that starts following: the text the
+    splitter repeated at the start of the next chunk.
+    """
+    # Candidate lengths are the positions where previous's tail could begin with
+    # the head of following, longest first
+    head = following[:MIN_OVERLAP_CHARS]
+    start = max(0, len(previous) - len(following))
+    position = previous.find(head, start)
+    while position != -1:
+        if following.startswith(previous[position:]):
+            return len(previous) - position
+        position = previous.find(head, position + 1)
+    return 0
+
+
+@dataclass
+class _ContextChunk:
+    chunk: RetrievedChunk
+    rank: int
+    text: str
+    tokens: float
+    # Characters shared with the next chunk of the same document (chunk_index + 1)
+    overlap_next: int = 0
+    overlap_previous: int = 0
+    selected: bool = False
+
+
 class PromptBuilder:
-    def __init__(self, max_context_chunks: int, max_context_chars: int) -> None:
+    """
+    Packs the retrieved chunks into the prompt context. Chunks are selected by
+    rank within a token budget (the chunker's estimated_token_count), then grouped
+    by document and ordered by chunk_index; consecutive chunks are stitched into
+    one passage without the text the splitter repeated between them, which is not
+    counted against the budget.
+    """
+
+    def __init__(
+        self,
+        max_context_chunks: int,
+        max_context_chars: int,
+        max_context_tokens: int = 3000,
+    ) -> None:
         self.max_context_chunks = max_context_chunks
         self.max_context_chars = max_context_chars
+        self.max_context_tokens = max_context_tokens
+
+    def _prepare(self, chunks: List[RetrievedChunk]) -> List[_ContextChunk]:
+        prepared: List[_ContextChunk] = []
+        seen: set[str] = set()
+        hits = 0
+        for chunk in chunks:
+            if chunk.chunk_id in seen:
+                continue
+            # max_context_chunks counts the hits, their expanded neighbours follow
+            if chunk.expanded_from is None:
+                if hits == self.max_context_chunks:
+                    break
+                hits += 1
+            seen.add(chunk.chunk_id)
+            text = _normalize_ws(chunk.text)
+            tokens = chunk.token_count or len(text) / CHARS_PER_TOKEN
+            prepared.append(_ContextChunk(chunk, len(prepared), text, tokens))
+
+        by_position = {
+            (item.chunk.doc_id, item.chunk.chunk_index): item
+            for item in prepared
+            if item.chunk.chunk_index is not None
+        }
+        for (doc_id, chunk_index), item in by_position.items():
+            following = by_position.get((doc_id, chunk_index + 1))
+            if following is not None:
+                overlap = _overlap_chars(item.text, following.text)
+                item.overlap_next = following.overlap_previous = overlap
+        return prepared
+
+    def _passages(self, prepared: List[_ContextChunk]) -> List[str]:
+        # Runs of consecutive selected chunks of a document, best ranked first
+        runs: List[List[_ContextChunk]] = []
+        ordered = sorted(
+            (item for item in prepared if item.selected),
+            key=lambda item: (
+                item.chunk.doc_id,
+                item.chunk.chunk_index is None,
+                item.chunk.chunk_index or 0,
+                item.rank,
+            ),
+        )
+        for item in ordered:
+            last = runs[-1][-1] if runs else None
+            if (
+                last is not None
+                and item.chunk.chunk_index is not None
+                and last.chunk.doc_id == item.chunk.doc_id
+                and last.chunk.chunk_index == item.chunk.chunk_index - 1
+            ):
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+        runs.sort(key=lambda run: min(item.rank for item in run))
+
+        passages: List[str] = []
+        for run in runs:
+            text = run[0].text
+            for previous, item in zip(run, run[1:]):
+                overlap = previous.overlap_next
+                text += item.text[overlap:] if overlap else "\n" + item.text
+            passages.append(text)
+        return passages
 
     def build_context(self, chunks: List[RetrievedChunk]) -> str:
-        selected = chunks[: self.max_context_chunks]
+        prepared = self._prepare(chunks)
 
-        parts: list[str] = []
+        current_tokens = 0.0
         current_chars = 0
+        selected: set[tuple[str, int]] = set()
+        for item in prepared:
+            # Only the text not already in the context through a selected neighbour
+            shared = 0
+            index = item.chunk.chunk_index
+            if index is not None:
+                if (item.chunk.doc_id, index - 1) in selected:
+                    shared += item.overlap_previous
+                if (item.chunk.doc_id, index + 1) in selected:
+                    shared += item.overlap_next
+            new_chars = max(0, len(item.text) - shared)
+            new_tokens = item.tokens * new_chars / max(1, len(item.text))
+            if (
+                current_tokens + new_tokens > self.max_context_tokens
+                or current_chars + new_chars > self.max_context_chars
+            ):
+                continue
+            item.selected = True
+            if index is not None:
+                selected.add((item.chunk.doc_id, index))
+            current_tokens += new_tokens
+            current_chars += new_chars
 
-        for i, chunk in enumerate(selected, start=1):
-            text = _normalize_ws(chunk.text)
-            header = f"[Context {i}]"
-            block = f"{header}\n{text}\n"
-            if current_chars + len(block) > self.max_context_chars:
-                break
-            parts.append(block)
-            current_chars += len(block)
-
+        parts = [
+            f"[Context {i}]\n{passage}\n"
+            for i, passage in enumerate(self._passages(prepared), start=1)
+        ]
         return "\n".join(parts).strip()
 
     def build_messages_for_bedrock_converse(
@@ -45,7 +183,7 @@ class PromptBuilder:
             "You are answering questions using only the provided eBay help-center context. "
             "Treat the context as the only allowed source of truth. "
             "If the answer is not clearly supported by the context, say: "
-            "'I do not have enough information in the provided knowledge base to answer that clearly.' "
+            f"'{FALLBACK_ANSWER}' "
             "Do not guess. "
             "Do not invent UI steps, actions, deadlines, or policies. "
             "Do not combine buyer and seller flows unless the context explicitly says both apply. "
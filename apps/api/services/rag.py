@@ -1,15 +1,73 @@
+import asyncio
 import logging
 import time
-from typing import Generator
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List
 
+from services.answer_cache import SemanticAnswerCache
+from services.embedding_cache import normalize_question
 from services.embeddings import EmbeddingService
 from services.generation import GenerationService
-from services.prompting import PromptBuilder
-from services.retrieval import RetrievalService
+from services.metrics import RAGMetrics, RequestMetrics
+from services.prompting import FALLBACK_ANSWER, PromptBuilder
+from services.retrieval import RetrievalService, RetrievedChunk, chunk_source
 
 logger = logging.getLogger(__name__)
 
 
+def _elapsed_ms(since: float) -> float:
+    return (time.perf_counter() - since) * 1000
+
+
+def _log_chunks(chunks: List[RetrievedChunk]) -> None:
+    for i, chunk in enumerate(chunks, start=1):
+        logger.info(f"----- Retrieved chunk #{i} -----")
+        logger.info(
+            f"score={chunk.score} | chunk_id={chunk.chunk_id} | doc_id={chunk.doc_id}"
+        )
+        logger.info("text:\n%s", chunk.text[:1000])
+
+
+@dataclass
+class AnswerSources:
+    # Yielded once before the answer text by stream_answer(with_sources=True)
+    sources: List[Dict[str, Any]]
+
+
+@dataclass
+class BatchAnswer:
+    index: int
+    question: str
+    metrics: RequestMetrics
+    answer: str | None = None
+    error: str | None = None
+
+
+class _Flight:
+    """
+    One answer being produced for every request with the same normalized question.
+    The text produced so far is kept, so a request that joins late replays it
+    before following the live stream.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.parts: list[str | AnswerSources] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.metrics = RequestMetrics()
+        self.condition = asyncio.Condition()
+        self.subscribers = 0
+        # The first request to receive the whole answer reports its cost
+        self.claimed = False
+        self.task: asyncio.Task | None = None
+
+    async def notify(self) -> None:
+        async with self.condition:
+            self.condition.notify_all()
+
+
 class RAGService:
     def __init__(
         self,
@@ -19,6 +77,9 @@ class RAGService:
         generation_service: GenerationService,
         top_k_default: int,
         top_k_max: int,
+        answer_cache: SemanticAnswerCache | None = None,
+        metrics: RAGMetrics | None = None,
+        single_flight: bool = False,
     ) -> None:
         self.embedding_service = embedding_service
         self.retrieval_service = retrieval_service
@@ -26,34 +87,212 @@ class RAGService:
         self.generation_service = generation_service
         self.top_k_default = top_k_default
         self.top_k_max = top_k_max
+        self.answer_cache = answer_cache
+        self.metrics = metrics
+        # Concurrent requests for the same question share one answer
+        self.single_flight = single_flight
+        self._flights: dict[str, _Flight] = {}
 
     def _normalize_top_k(self, top_k: int | None) -> int:
         if top_k is None:
             return self.top_k_default
         return max(1, min(int(top_k), self.top_k_max))
 
-    def stream_answer(
+    async def stream_answer(
+        self,
+        question: str,
+        request_metrics: RequestMetrics | None = None,
+        with_sources: bool = False,
+    ) -> AsyncGenerator[str | AnswerSources, None]:
+        """
+        Streams the answer text. Stage timings and token usage are recorded into
+        request_metrics (if given) and into the Prometheus metrics once the stream
+        ends, including when it fails or the client disconnects. With with_sources,
+        the chunks the answer is based on are yielded first, as AnswerSources.
+        """
+        if request_metrics is None:
+            request_metrics = RequestMetrics()
+        started = time.perf_counter()
+
+        if self.single_flight:
+            source = self._follow(question.strip(), request_metrics)
+        else:
+            source = self._stream_answer(question.strip(), request_metrics)
+
+        try:
+            async with aclosing(source) as stream:
+                async for text in stream:
+                    if isinstance(text, AnswerSources):
+                        if with_sources:
+                            yield text
+                        continue
+                    if "first_token" not in request_metrics.stages_ms:
+                        request_metrics.stages_ms["first_token"] = _elapsed_ms(started)
+                    yield text
+        except (GeneratorExit, asyncio.CancelledError):
+            request_metrics.outcome = "cancelled"
+            raise
+        except Exception:
+            request_metrics.outcome = "error"
+            raise
+        finally:
+            request_metrics.stages_ms["total"] = _elapsed_ms(started)
+            if self.metrics is not None:
+                self.metrics.observe(request_metrics)
+
+    async def _produce(self, flight: _Flight, question: str) -> None:
+        # Runs as its own task: the request that started it may leave first
+        try:
+            async with aclosing(
+                self._stream_answer(question, flight.metrics)
+            ) as stream:
+                async for text in stream:
+                    flight.parts.append(text)
+                    await flight.notify()
+        except asyncio.CancelledError as error:
+            flight.error = error
+            raise
+        except Exception as error:
+            flight.error = error
+        finally:
+            flight.done = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            await flight.notify()
+
+    async def _follow(
+        self,
+        question: str,
+        request_metrics: RequestMetrics,
+    ) -> AsyncGenerator[str | AnswerSources, None]:
+        key = normalize_question(question)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(flight, question))
+        else:
+            logger.info(
+                "Joined the answer in flight for %r (%d parts produced, %d waiting)",
+                key,
+                len(flight.parts),
+                flight.subscribers,
+            )
+        flight.subscribers += 1
+
+        try:
+            sent = 0
+            while True:
+                if sent < len(flight.parts):
+                    sent += 1
+                    yield flight.parts[sent - 1]
+                    continue
+                if flight.done:
+                    break
+                async with flight.condition:
+                    await flight.condition.wait_for(
+                        lambda: flight.done or sent < len(flight.parts)
+                    )
+            if flight.error is not None:
+                raise flight.error
+
+            shared = flight.metrics
+            request_metrics.retrieved_chunks = shared.retrieved_chunks
+            request_metrics.relevance = shared.relevance
+            request_metrics.top_score = shared.top_score
+            if flight.claimed:
+                # Stages and tokens were paid once, by the request that claimed them
+                request_metrics.outcome = "coalesced"
+            else:
+                flight.claimed = True
+                request_metrics.outcome = shared.outcome
+                request_metrics.usage = shared.usage
+                for stage, value_ms in shared.stages_ms.items():
+                    if stage not in ("first_token", "total"):
+                        request_metrics.stages_ms[stage] = value_ms
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done:
+                # Every client left: stop generating, a new request starts over
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _stream_answer(
         self,
         question: str,
-    ) -> Generator[str, None, None]:
-        question = question.strip()
+        request_metrics: RequestMetrics,
+    ) -> AsyncGenerator[str | AnswerSources, None]:
         normalized_top_k = self.top_k_default
+        stages_ms = request_metrics.stages_ms
 
         t0 = time.perf_counter()
-        query_vector = self.embedding_service.embed_query(question)
+        query_vector = await self.embedding_service.embed_query(question)
         t1 = time.perf_counter()
+        stages_ms["embed"] = (t1 - t0) * 1000
 
-        chunks = self.retrieval_service.similarity_search(
+        if self.answer_cache is not None:
+            cached = await self.answer_cache.lookup(query_vector)
+            stages_ms["answer_cache_lookup"] = _elapsed_ms(t1)
+            if cached is not None:
+                request_metrics.outcome = "answer_cache_hit"
+                logger.info(
+                    "Answer cache hit. distance=%.4f cached_question=%r embed_ms=%d lookup_ms=%d",
+                    cached.distance,
+                    cached.question,
+                    int(stages_ms["embed"]),
+                    int(stages_ms["answer_cache_lookup"]),
+                )
+                yield AnswerSources(cached.sources)
+                async for text in self.answer_cache.replay(cached):
+                    yield text
+                return
+            t1 = time.perf_counter()
+
+        chunks = await self.retrieval_service.similarity_search(
             query_vector=query_vector,
             top_k=normalized_top_k,
+            query_text=question,
         )
-        for i, chunk in enumerate(chunks, start=1):
-            logger.info(f"----- Retrieved chunk #{i} -----")
-            logger.info(
-                f"score={chunk.score} | chunk_id={chunk.chunk_id} | doc_id={chunk.doc_id}"
-            )
-            logger.info("text:\n%s", chunk.text[:1000])
+        _log_chunks(chunks)
+        stages_ms["retrieval"] = _elapsed_ms(t1)
+
+        async with aclosing(
+            self._answer_from_chunks(question, query_vector, chunks, request_metrics)
+        ) as stream:
+            async for text in stream:
+                yield text
+
+    async def _answer_from_chunks(
+        self,
+        question: str,
+        query_vector: List[float],
+        chunks: List[RetrievedChunk],
+        request_metrics: RequestMetrics,
+    ) -> AsyncGenerator[str | AnswerSources, None]:
+        # Relevance gate, prompt, generation and answer cache: shared by /ask and
+        # /ask/batch once the chunks are retrieved
+        stages_ms = request_metrics.stages_ms
         t2 = time.perf_counter()
+        request_metrics.retrieved_chunks = len(chunks)
+
+        decision = self.retrieval_service.check_relevance(chunks)
+        if decision is not None:
+            request_metrics.relevance = decision.reason
+            request_metrics.top_score = decision.top_score
+            if not decision.relevant:
+                # Nothing worth a Bedrock call: the answer the prompt would ask for
+                request_metrics.outcome = "low_relevance"
+                logger.info(
+                    "Generation skipped by the relevance gate. reason=%s top_score=%s score_gap=%s",
+                    decision.reason,
+                    decision.top_score,
+                    decision.score_gap,
+                )
+                yield AnswerSources([])
+                yield FALLBACK_ANSWER
+                return
+        yield AnswerSources([chunk_source(chunk) for chunk in chunks])
 
         system_prompt, messages = (
             self.prompt_builder.build_messages_for_bedrock_converse(
@@ -62,17 +301,150 @@ class RAGService:
             )
         )
         t3 = time.perf_counter()
+        stages_ms["prompt"] = (t3 - t2) * 1000
 
         logger.info(
             "RAG query prepared. top_k=%d retrieved=%d embed_ms=%d retrieval_ms=%d prompt_ms=%d",
-            normalized_top_k,
+            self.top_k_default,
             len(chunks),
-            int((t1 - t0) * 1000),
-            int((t2 - t1) * 1000),
-            int((t3 - t2) * 1000),
+            int(stages_ms["embed"]),
+            int(stages_ms["retrieval"]),
+            int(stages_ms["prompt"]),
         )
 
-        yield from self.generation_service.stream_answer(
-            system_prompt=system_prompt,
-            messages=messages,
+        answer_parts: list[str] = []
+        async with aclosing(
+            self.generation_service.stream_answer(
+                system_prompt=system_prompt,
+                messages=messages,
+                usage=request_metrics.usage,
+            )
+        ) as stream:
+            async for text in stream:
+                answer_parts.append(text)
+                yield text
+        stages_ms["generation"] = _elapsed_ms(t3)
+
+        # Only complete answers are cached (a disconnected client closes the generator)
+        if self.answer_cache is not None:
+            await self.answer_cache.store(
+                question=question,
+                query_vector=query_vector,
+                answer="".join(answer_parts),
+                chunks=chunks,
+            )
+
+    async def answer_batch(
+        self,
+        questions: List[str],
+        max_concurrency: int,
+    ) -> AsyncGenerator[BatchAnswer, None]:
+        """
+        Answers several questions, yielding each answer as soon as it is complete
+        (not in request order). The questions are embedded concurrently, their
+        chunks retrieved with one batch query, and at most max_concurrency answers
+        are generated at a time. A failed question yields its error, the others
+        go on.
+        """
+        questions = [question.strip() for question in questions]
+        answers = [
+            BatchAnswer(index=i, question=question, metrics=RequestMetrics())
+            for i, question in enumerate(questions)
+        ]
+        started = time.perf_counter()
+        finished: list[BatchAnswer] = []
+
+        def finish(answer: BatchAnswer, error: BaseException | None = None) -> None:
+            if error is not None:
+                logger.error("Batch question %d failed: %s", answer.index, error)
+                answer.metrics.outcome = "error"
+                # Same detail as /ask's 500, the cause is in the log
+                answer.error = "Failed to process question"
+            answer.metrics.stages_ms["total"] = _elapsed_ms(started)
+            if self.metrics is not None:
+                self.metrics.observe(answer.metrics)
+            finished.append(answer)
+
+        vectors = await self.embedding_service.embed_queries(
+            questions, return_exceptions=True
         )
+        embed_ms = _elapsed_ms(started)
+        pending: list[tuple[BatchAnswer, List[float]]] = []
+        for answer, vector in zip(answers, vectors):
+            answer.metrics.stages_ms["embed"] = embed_ms
+            if isinstance(vector, BaseException):
+                finish(answer, vector)
+            else:
+                pending.append((answer, vector))
+
+        if self.answer_cache is not None and pending:
+            t1 = time.perf_counter()
+            cached_answers = await asyncio.gather(
+                *(self.answer_cache.lookup(vector) for _, vector in pending)
+            )
+            lookup_ms = _elapsed_ms(t1)
+            misses = []
+            for (answer, vector), cached in zip(pending, cached_answers):
+                answer.metrics.stages_ms["answer_cache_lookup"] = lookup_ms
+                if cached is None:
+                    misses.append((answer, vector))
+                    continue
+                answer.metrics.outcome = "answer_cache_hit"
+                answer.answer = cached.answer
+                finish(answer)
+            pending = misses
+
+        for answer in finished:
+            yield answer
+        if not pending:
+            return
+
+        t1 = time.perf_counter()
+        try:
+            chunk_lists = await self.retrieval_service.batch_similarity_search(
+                [vector for _, vector in pending],
+                top_k=self.top_k_default,
+                query_texts=[answer.question for answer, _ in pending],
+            )
+        except Exception as error:
+            for answer, _ in pending:
+                finish(answer, error)
+                yield answer
+            return
+        retrieval_ms = _elapsed_ms(t1)
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def generate(
+            answer: BatchAnswer, vector: List[float], chunks: List[RetrievedChunk]
+        ) -> BatchAnswer:
+            answer.metrics.stages_ms["retrieval"] = retrieval_ms
+            async with semaphore:
+                try:
+                    parts = []
+                    async with aclosing(
+                        self._answer_from_chunks(
+                            answer.question, vector, chunks, answer.metrics
+                        )
+                    ) as stream:
+                        async for text in stream:
+                            if isinstance(text, str):
+                                parts.append(text)
+                    answer.answer = "".join(parts)
+                except Exception as error:
+                    finish(answer, error)
+                    return answer
+            finish(answer)
+            return answer
+
+        tasks = [
+            asyncio.create_task(generate(answer, vector, chunks))
+            for (answer, vector), chunks in zip(pending, chunk_lists)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # The client went away: stop the generations still running
+            for task in tasks:
+                task.cancel()
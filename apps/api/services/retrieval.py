@@ -1,5 +1,15 @@
-from dataclasses import dataclass
-from typing import List, Sequence
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from qdrant_client.http import models as qmodels
+from qdrant_client.http.exceptions import UnexpectedResponse
+from services.sparse import bm25_query_vector
+from services.vector_index import SnapshotIndex, VectorIndex
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -10,39 +20,461 @@ class RetrievedChunk:
     score: float
     title: str | None = None
     source_s3_uri: str | None = None
+    # Position in the document and the chunker's token estimate, for context packing
+    chunk_index: int | None = None
+    token_count: int | None = None
+    # chunk_id of the hit this chunk was added next to by neighbour expansion
+    expanded_from: str | None = None
+    # Cosine similarity to the query. Equal to score in dense mode, in hybrid mode
+    # score is the fused rank score and this is only known if it was asked for
+    dense_score: float | None = None
+
+
+def chunk_source(chunk: RetrievedChunk) -> Dict[str, Any]:
+    # What a client needs to cite a chunk, without its text
+    return {
+        "chunk_id": chunk.chunk_id,
+        "doc_id": chunk.doc_id,
+        "title": chunk.title,
+        "source_s3_uri": chunk.source_s3_uri,
+        "chunk_index": chunk.chunk_index,
+        "score": round(chunk.score, 4),
+        "expanded_from": chunk.expanded_from,
+    }
+
+
+@dataclass
+class RelevanceDecision:
+    relevant: bool
+    reason: str
+    top_score: float | None = None
+    score_gap: float | None = None
+
+
+class RelevanceGate:
+    """
+    Decides from the retrieved chunks' cosine similarities whether the knowledge
+    base has anything to answer from. Below min_score nothing is relevant. Below
+    gap_max_score, the best chunk must also stand out from the last one by at least
+    min_score_gap: an off-topic question matches every chunk about equally.
+    A threshold of 0 disables its check; with both disabled every decision is
+    relevant and only reports the scores.
+    """
+
+    def __init__(
+        self,
+        min_score: float = 0.0,
+        min_score_gap: float = 0.0,
+        gap_max_score: float = 1.0,
+    ) -> None:
+        self.min_score = min_score
+        self.min_score_gap = min_score_gap
+        self.gap_max_score = gap_max_score
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_score > 0 or self.min_score_gap > 0
+
+    def evaluate(self, chunks: List[RetrievedChunk]) -> RelevanceDecision:
+        if not chunks:
+            return RelevanceDecision(relevant=not self.enabled, reason="no_chunks")
+        scores = [c.dense_score for c in chunks if c.dense_score is not None]
+        if not scores:
+            # Nothing to judge by (e.g. hybrid results without vectors)
+            return RelevanceDecision(relevant=True, reason="unscored")
+
+        top_score = max(scores)
+        score_gap = top_score - min(scores) if len(scores) > 1 else None
+        decision = RelevanceDecision(
+            relevant=True, reason="relevant", top_score=top_score, score_gap=score_gap
+        )
+        if self.min_score > 0 and top_score < self.min_score:
+            decision.relevant, decision.reason = False, "below_min_score"
+        elif (
+            self.min_score_gap > 0
+            and score_gap is not None
+            and top_score < self.gap_max_score
+            and score_gap < self.min_score_gap
+        ):
+            decision.relevant, decision.reason = False, "low_score_gap"
+        return decision
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def _missing_sparse_vector(error: Exception) -> bool:
+    # Qdrant answers 400 "Sparse vector ... is not found" (local mode: ValueError);
+    # anything else may be transient and must not turn hybrid search off
+    if isinstance(error, UnexpectedResponse):
+        if error.status_code != 400:
+            return False
+        message = (error.content or b"").decode("utf-8", "replace")
+    elif isinstance(error, ValueError):
+        message = str(error)
+    elif callable(getattr(error, "details", None)):
+        # grpc.RpcError with QDRANT_PREFER_GRPC
+        message = error.details() or ""
+    else:
+        return False
+    message = message.lower()
+    return "sparse vector" in message and "not found" in message
 
 
 class RetrievalService:
-    def __init__(self, qdrant_client, collection_name: str) -> None:
+    def __init__(
+        self,
+        qdrant_client,
+        collection_name: str,
+        semaphore: asyncio.Semaphore,
+        retrieval_mode: str = "dense",
+        sparse_vector_name: str = "bm25",
+        hybrid_prefetch_limit: int = 20,
+        search_hnsw_ef: int | None = None,
+        quantization_rescore: bool = True,
+        quantization_oversampling: float = 2.0,
+        local_index: SnapshotIndex | None = None,
+        relevance_gate: RelevanceGate | None = None,
+        expansion_radius: int = 0,
+    ) -> None:
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError("retrieval_mode must be 'dense' or 'hybrid'")
         self.qdrant_client = qdrant_client
         self.collection_name = collection_name
+        self.semaphore = semaphore
+        self.retrieval_mode = retrieval_mode
+        self.sparse_vector_name = sparse_vector_name
+        self.hybrid_prefetch_limit = hybrid_prefetch_limit
+        # Local backend: searched in-process while a snapshot is loaded, Qdrant is
+        # only used until the first one is
+        self.local_index = local_index
+        self.relevance_gate = relevance_gate
+        # Each hit brings the chunks up to this many positions before and after it
+        self.expansion_radius = max(0, expansion_radius)
+        # Quantized vectors (if the collection has them) are searched first, then the
+        # oversampled candidates are rescored with the original vectors
+        self.search_params = qmodels.SearchParams(
+            hnsw_ef=search_hnsw_ef,
+            quantization=qmodels.QuantizationSearchParams(
+                ignore=False,
+                rescore=quantization_rescore,
+                oversampling=quantization_oversampling,
+            ),
+        )
+
+    async def check_sparse_vector(self) -> None:
+        """
+        Switches hybrid mode to dense when the collection has no sparse vector, so
+        the first requests do not have to find out. A failed check changes nothing.
+        """
+        if self.retrieval_mode != "hybrid":
+            return
+        try:
+            async with self.semaphore:
+                info = await self.qdrant_client.get_collection(self.collection_name)
+        except Exception as error:
+            logger.warning("Could not check the collection's sparse vectors: %s", error)
+            return
+        sparse_vectors = info.config.params.sparse_vectors or {}
+        if self.sparse_vector_name not in sparse_vectors:
+            logger.warning(
+                "Collection %s has no sparse vector %r, using dense only",
+                self.collection_name,
+                self.sparse_vector_name,
+            )
+            self.retrieval_mode = "dense"
 
-    def similarity_search(
+    async def similarity_search(
         self,
         query_vector: Sequence[float],
         top_k: int,
+        query_text: str | None = None,
     ) -> List[RetrievedChunk]:
-        # qdrant-client versions differ a bit. Try query_points first, fallback to search.
-        results = None
+        """
+        The top_k hits, each followed by its neighbours when expansion_radius is
+        set (at most one more request).
+        """
+        results = await self.batch_similarity_search(
+            [query_vector], top_k, [query_text]
+        )
+        return results[0]
 
-        if hasattr(self.qdrant_client, "query_points"):
-            resp = self.qdrant_client.query_points(
-                collection_name=self.collection_name,
-                query=list(query_vector),
-                limit=top_k,
-                with_payload=True,
-                with_vectors=False,
-            )
-            results = getattr(resp, "points", resp)
+    async def batch_similarity_search(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        top_k: int,
+        query_texts: Sequence[str | None] | None = None,
+    ) -> List[List[RetrievedChunk]]:
+        """
+        similarity_search for several queries: the hits of all of them come from
+        one Qdrant batch query, and their neighbours from one scroll.
+        """
+        if not query_vectors:
+            return []
+        if query_texts is None:
+            query_texts = [None] * len(query_vectors)
+
+        index = self.local_index.index if self.local_index is not None else None
+        if index is not None:
+            hit_lists = [
+                self._to_chunks(
+                    self._local_search(index, query_vector, top_k, query_text)
+                )
+                for query_vector, query_text in zip(query_vectors, query_texts)
+            ]
         else:
-            results = self.qdrant_client.search(
+            hit_lists = await self._search(query_vectors, top_k, query_texts)
+
+        if self.expansion_radius:
+            return await self._expand_neighbours(hit_lists)
+        return hit_lists
+
+    async def _search(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        top_k: int,
+        query_texts: Sequence[str | None],
+    ) -> List[List[RetrievedChunk]]:
+        if self.retrieval_mode == "hybrid":
+            hybrid = [
+                (
+                    self._hybrid_request(query_vector, query_text, top_k)
+                    if query_text
+                    else None
+                )
+                for query_vector, query_text in zip(query_vectors, query_texts)
+            ]
+            if any(hybrid):
+                requests = [
+                    request or self._dense_request(query_vector, top_k)
+                    for request, query_vector in zip(hybrid, query_vectors)
+                ]
+                try:
+                    responses = await self._query_batch(requests)
+                    return [
+                        self._to_chunks(response.points, request is None, query_vector)
+                        for response, request, query_vector in zip(
+                            responses, hybrid, query_vectors
+                        )
+                    ]
+                except Exception as error:
+                    if _missing_sparse_vector(error):
+                        # The collection has no sparse vector: stay on dense from now on
+                        logger.warning(
+                            "Hybrid search unavailable, using dense only: %s", error
+                        )
+                        self.retrieval_mode = "dense"
+                    else:
+                        # Transient (503, 429, timeout...): dense for this request only
+                        logger.warning(
+                            "Hybrid search failed, falling back to dense: %s", error
+                        )
+
+        responses = await self._query_batch(
+            [self._dense_request(query_vector, top_k) for query_vector in query_vectors]
+        )
+        return [
+            self._to_chunks(response.points, True, query_vector)
+            for response, query_vector in zip(responses, query_vectors)
+        ]
+
+    async def _query_batch(self, requests: List[qmodels.QueryRequest]) -> List[Any]:
+        async with self.semaphore:
+            return await self.qdrant_client.query_batch_points(
+                collection_name=self.collection_name, requests=requests
+            )
+
+    def _neighbour_positions(
+        self, hit_lists: List[List[RetrievedChunk]]
+    ) -> Dict[str, List[int]]:
+        # chunk_index values to fetch per doc_id, without the hits themselves
+        known = {(hit.doc_id, hit.chunk_index) for hits in hit_lists for hit in hits}
+        wanted: Dict[str, List[int]] = {}
+        for hits in hit_lists:
+            for hit in hits:
+                if hit.chunk_index is None:
+                    continue
+                for offset in range(-self.expansion_radius, self.expansion_radius + 1):
+                    position = (hit.doc_id, hit.chunk_index + offset)
+                    if position[1] < 0 or position in known:
+                        continue
+                    known.add(position)
+                    wanted.setdefault(hit.doc_id, []).append(position[1])
+        return wanted
+
+    async def _fetch_positions(self, wanted: Dict[str, List[int]]) -> List[Any]:
+        # One scroll, filtered through the doc_id and chunk_index payload indexes
+        scroll_filter = qmodels.Filter(
+            should=[
+                qmodels.Filter(
+                    must=[
+                        qmodels.FieldCondition(
+                            key="doc_id", match=qmodels.MatchValue(value=doc_id)
+                        ),
+                        qmodels.FieldCondition(
+                            key="chunk_index", match=qmodels.MatchAny(any=positions)
+                        ),
+                    ]
+                )
+                for doc_id, positions in wanted.items()
+            ]
+        )
+        async with self.semaphore:
+            points, _ = await self.qdrant_client.scroll(
                 collection_name=self.collection_name,
-                query_vector=list(query_vector),
-                limit=top_k,
+                scroll_filter=scroll_filter,
+                limit=sum(len(positions) for positions in wanted.values()),
                 with_payload=True,
                 with_vectors=False,
             )
+        return points
+
+    async def _expand_neighbours(
+        self, hit_lists: List[List[RetrievedChunk]]
+    ) -> List[List[RetrievedChunk]]:
+        wanted = self._neighbour_positions(hit_lists)
+        points: List[Any] = []
+        if wanted:
+            index = self.local_index.index if self.local_index is not None else None
+            try:
+                if index is not None:
+                    points = index.lookup(wanted)
+                else:
+                    points = await self._fetch_positions(wanted)
+            except Exception as error:
+                logger.warning(
+                    "Neighbour expansion failed, using the hits only: %s", error
+                )
+                return hit_lists
 
+        # A neighbour may also be a hit of another query of the batch
+        available = {
+            (chunk.doc_id, chunk.chunk_index): chunk
+            for chunk in [hit for hits in hit_lists for hit in hits]
+            + self._to_chunks(points)
+        }
+        # Nearest first, so a tight context budget keeps the closest neighbours
+        offsets = sorted(
+            range(-self.expansion_radius, self.expansion_radius + 1),
+            key=lambda offset: (abs(offset), offset),
+        )[1:]
+        expanded_lists: List[List[RetrievedChunk]] = []
+        for hits in hit_lists:
+            present = {(hit.doc_id, hit.chunk_index) for hit in hits}
+            expanded: List[RetrievedChunk] = []
+            for hit in hits:
+                expanded.append(hit)
+                if hit.chunk_index is None:
+                    continue
+                for offset in offsets:
+                    position = (hit.doc_id, hit.chunk_index + offset)
+                    neighbour = available.get(position)
+                    if neighbour is None or position in present:
+                        continue
+                    present.add(position)
+                    expanded.append(
+                        replace(
+                            neighbour,
+                            score=hit.score,
+                            dense_score=None,
+                            expanded_from=hit.chunk_id,
+                        )
+                    )
+            expanded_lists.append(expanded)
+        return expanded_lists
+
+    def check_relevance(self, chunks: List[RetrievedChunk]) -> RelevanceDecision | None:
+        if self.relevance_gate is None:
+            return None
+        return self.relevance_gate.evaluate(chunks)
+
+    def _local_search(
+        self,
+        index: VectorIndex,
+        query_vector: Sequence[float],
+        top_k: int,
+        query_text: str | None,
+    ) -> List[Any]:
+        # A few ms of NumPy for small collections, run inline on the event loop
+        if self.retrieval_mode == "hybrid" and query_text and index.has_sparse:
+            indices, _ = bm25_query_vector(query_text)
+            if indices:
+                hits = index.hybrid_search(
+                    query_vector,
+                    indices,
+                    top_k,
+                    prefetch_limit=max(top_k, self.hybrid_prefetch_limit),
+                )
+                return index.to_points(hits, query_vector)
+        return index.to_points(index.dense_search(query_vector, top_k), dense=True)
+
+    def _dense_request(
+        self, query_vector: Sequence[float], top_k: int
+    ) -> qmodels.QueryRequest:
+        return qmodels.QueryRequest(
+            query=list(query_vector),
+            params=self.search_params,
+            limit=top_k,
+            with_payload=True,
+            with_vector=False,
+        )
+
+    def _hybrid_request(
+        self, query_vector: Sequence[float], query_text: str, top_k: int
+    ) -> qmodels.QueryRequest | None:
+        indices, values = bm25_query_vector(query_text)
+        if not indices:
+            # Only stopwords: nothing for the lexical side to match
+            return None
+
+        limit = max(top_k, self.hybrid_prefetch_limit)
+        # Dense and sparse candidates in one request, fused with Reciprocal Rank Fusion
+        return qmodels.QueryRequest(
+            prefetch=[
+                qmodels.Prefetch(
+                    query=list(query_vector),
+                    params=self.search_params,
+                    limit=limit,
+                ),
+                qmodels.Prefetch(
+                    query=qmodels.SparseVector(indices=indices, values=values),
+                    using=self.sparse_vector_name,
+                    limit=limit,
+                ),
+            ],
+            query=qmodels.FusionQuery(fusion=qmodels.Fusion.RRF),
+            limit=top_k,
+            with_payload=True,
+            # The fused scores are ranks: the gate needs the vectors for cosines
+            with_vector=self.relevance_gate is not None and self.relevance_gate.enabled,
+        )
+
+    def _dense_score(
+        self, point: Any, score: float, dense: bool, query: np.ndarray | None
+    ) -> float | None:
+        if dense:
+            return score
+        dense_score = getattr(point, "dense_score", None)  # local index rows
+        if dense_score is not None or query is None:
+            return dense_score
+        vector = getattr(point, "vector", None)
+        if isinstance(vector, dict):
+            # Unnamed dense vector next to the named sparse one
+            vector = vector.get("")
+        if not vector:
+            return None
+        return float(np.dot(query, _unit(vector)))
+
+    def _to_chunks(
+        self,
+        results: List[Any],
+        dense: bool = False,
+        query_vector: Sequence[float] | None = None,
+    ) -> List[RetrievedChunk]:
+        query = _unit(query_vector) if query_vector is not None and not dense else None
         chunks: List[RetrievedChunk] = []
         for point in results:
             payload = getattr(point, "payload", None) or {}
@@ -50,6 +482,9 @@ class RetrievalService:
             chunk_id = payload.get("chunk_id")
             doc_id = payload.get("doc_id")
             score = float(getattr(point, "score", 0.0))
+            meta = payload.get("meta") or {}
+            chunk_index = payload.get("chunk_index")
+            token_count = meta.get("estimated_token_count")
 
             if not text or not chunk_id or not doc_id:
                 # Skip malformed payloads instead of crashing query path
@@ -61,8 +496,14 @@ class RetrievalService:
                     doc_id=str(doc_id),
                     text=str(text),
                     score=score,
-                    title=payload.get("title"),
-                    source_s3_uri=payload.get("source_s3_uri"),
+                    # Written under meta by the chunker, top level on older points
+                    title=meta.get("title") or payload.get("title"),
+                    source_s3_uri=(
+                        meta.get("source_s3_uri") or payload.get("source_s3_uri")
+                    ),
+                    chunk_index=int(chunk_index) if chunk_index is not None else None,
+                    token_count=int(token_count) if token_count else None,
+                    dense_score=self._dense_score(point, score, dense, query),
                 )
             )
 
@@ -0,0 +1,31 @@
+import re
+import zlib
+from typing import List, Tuple
+
+# Keep in sync with apps/embedding/sparse.py: documents and queries must be
+# tokenized and hashed the same way for the sparse vectors to match.
+SPARSE_MODEL_ID = "bm25-crc32-v1"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is "
+    "it its me my no not of on or our so than that the their then there these they "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def token_index(token: str) -> int:
+    # Sparse vector indices are uint32
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def bm25_query_vector(text: str) -> Tuple[List[int], List[float]]:
+    """
+    Each distinct query term gets weight 1, Qdrant multiplies it by the term IDF.
+    """
+    indices = sorted({token_index(token) for token in tokenize(text)})
+    return indices, [1.0] * len(indices)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict
+
+from services.metrics import RequestMetrics
+from services.rag import AnswerSources, RAGService
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def encode_frame(stream_format: str, frame: Dict[str, Any]) -> str:
+    data = json.dumps(frame, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {frame['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def stream_frames(
+    rag_service: RAGService,
+    question: str,
+    stream_format: str,
+    flush_interval_ms: float,
+    flush_bytes: int,
+) -> AsyncGenerator[str, None]:
+    """
+    The answer as typed frames: "sources" once retrieval is done, "token" with the
+    text generated since the previous one, then "done" with the request metrics
+    (or "error"). A stream without a final frame was cut short.
+
+    Bedrock deltas are a few characters each: they are buffered and sent when
+    flush_bytes are pending or flush_interval_ms passed since the last frame,
+    whichever comes first, also when no new delta arrives in the meantime.
+    """
+    request_metrics = RequestMetrics()
+    source = rag_service.stream_answer(
+        question=question, request_metrics=request_metrics, with_sources=True
+    )
+    interval = flush_interval_ms / 1000
+    buffer: list[str] = []
+    buffered = 0
+    last_flush = time.perf_counter()
+    pending: asyncio.Future | None = None
+
+    def flush() -> str:
+        nonlocal buffered, last_flush
+        frame = encode_frame(stream_format, {"type": "token", "text": "".join(buffer)})
+        buffer.clear()
+        buffered = 0
+        last_flush = time.perf_counter()
+        return frame
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(source))
+            timeout = None
+            if buffer:
+                timeout = max(0.0, last_flush + interval - time.perf_counter())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Nothing new within the interval: send what is buffered
+                yield flush()
+                continue
+
+            future, pending = pending, None
+            try:
+                item = future.result()
+            except StopAsyncIteration:
+                break
+
+            if isinstance(item, AnswerSources):
+                yield encode_frame(
+                    stream_format, {"type": "sources", "sources": item.sources}
+                )
+                continue
+            buffer.append(item)
+            buffered += len(item.encode("utf-8"))
+            if buffered >= flush_bytes or time.perf_counter() - last_flush >= interval:
+                yield flush()
+
+        if buffer:
+            yield flush()
+        yield encode_frame(
+            stream_format, {"type": "done", "metrics": request_metrics.as_dict()}
+        )
+    except Exception as error:
+        logger.exception("Answer stream failed: %s", error)
+        if buffer:
+            yield flush()
+        yield encode_frame(
+            stream_format, {"type": "error", "detail": "Failed to process request"}
+        )
+    finally:
+        if pending is not None:
+            # The client disconnected while a delta was awaited
+            pending.cancel()
+            await asyncio.wait({pending})
+        await source.aclose()
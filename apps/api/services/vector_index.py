@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Layout written by the embedding Lambda (apps/embedding/snapshot.py)
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.jsonl"
+SPARSE_FILE = "sparse.npz"
+POINTER_FILE = "latest.json"
+
+# Same constant as Qdrant's Reciprocal Rank Fusion: 1 / (k + 0-based rank)
+RRF_K = 2
+# Rows scored per block when the int8 copy is searched, bounds the float32 temporary
+SCORE_BLOCK_ROWS = 8192
+
+
+@dataclass
+class ScoredRow:
+    # Shaped like a Qdrant ScoredPoint for RetrievalService._to_chunks
+    payload: Dict[str, Any]
+    score: float
+    # Cosine similarity to the query, the relevance gate's input in hybrid mode
+    dense_score: float | None = None
+
+
+def top_rows(scores: np.ndarray, limit: int) -> np.ndarray:
+    # argpartition selects the best rows in O(n), only those are sorted
+    if limit >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    best = np.argpartition(-scores, limit - 1)[:limit]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class VectorIndex:
+    """
+    One snapshot of the collection in memory: the float32 vectors are memory-mapped
+    (a contiguous row-major matrix, pages are shared and loaded by the OS), the
+    payloads are kept as a list in the same row order. With dtype int8, a 4x smaller
+    quantized copy is searched and the oversampled candidates are rescored with
+    the float32 rows, like Qdrant's quantization rescoring.
+
+    The sparse BM25 vectors, if present, are kept as posting lists sorted by term
+    so a query only reads the rows of its own terms.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        version: str,
+        dtype: str = "float32",
+        oversampling: float = 2.0,
+    ) -> None:
+        if dtype not in ("float32", "int8"):
+            raise ValueError("dtype must be 'float32' or 'int8'")
+        self.directory = directory
+        self.version = version
+        self.dtype = dtype
+        self.oversampling = max(1.0, oversampling)
+
+        self.vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+        with (directory / PAYLOADS_FILE).open("r", encoding="utf-8") as f:
+            self.payloads = [json.loads(line) for line in f if line.strip()]
+        if len(self.payloads) != len(self.vectors):
+            raise ValueError(
+                f"Snapshot {version} has {len(self.vectors)} vectors and {len(self.payloads)} payloads"
+            )
+
+        # (doc_id, chunk_index) -> row, for neighbour expansion
+        self.positions = {
+            (payload.get("doc_id"), payload.get("chunk_index")): row
+            for row, payload in enumerate(self.payloads)
+        }
+
+        self.quantized = None
+        self.scales = None
+        if dtype == "int8" and len(self.vectors):
+            self._quantize()
+
+        self.has_sparse = (directory / SPARSE_FILE).is_file()
+        if self.has_sparse:
+            self._load_sparse(directory / SPARSE_FILE)
+
+    @property
+    def count(self) -> int:
+        return len(self.payloads)
+
+    def _quantize(self) -> None:
+        # Symmetric per-row scale: row ~= quantized_row * scale
+        quantized = np.empty(self.vectors.shape, dtype=np.int8)
+        scales = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + SCORE_BLOCK_ROWS])
+            block_scales = np.abs(block).max(axis=1) / 127.0
+            block_scales[block_scales == 0] = 1.0
+            quantized[start : start + len(block)] = np.rint(
+                block / block_scales[:, None]
+            ).astype(np.int8)
+            scales[start : start + len(block)] = block_scales
+        self.quantized = quantized
+        self.scales = scales
+
+    def _load_sparse(self, path: Path) -> None:
+        with np.load(path) as sparse:
+            indptr = sparse["indptr"]
+            indices = sparse["indices"]
+            values = sparse["values"]
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        self.posting_terms = indices[order]
+        self.posting_rows = rows[order]
+        self.posting_weights = values[order]
+        # Term IDF computed as Qdrant's idf modifier does, over this snapshot
+        terms, counts = np.unique(self.posting_terms, return_counts=True)
+        n = self.count
+        self.idf_terms = terms
+        self.idf = np.log((n - counts + 0.5) / (counts + 0.5) + 1.0).astype(np.float32)
+
+    def dense_search(
+        self, query_vector: Sequence[float], limit: int
+    ) -> List[Tuple[int, float]]:
+        if not self.count or limit <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        if self.quantized is None:
+            scores = self.vectors @ query
+            rows = top_rows(scores, limit)
+            return [(int(row), float(scores[row])) for row in rows]
+
+        approx = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCORE_BLOCK_ROWS):
+            block = self.quantized[start : start + SCORE_BLOCK_ROWS]
+            approx[start : start + len(block)] = (
+                block.astype(np.float32) @ query
+            ) * self.scales[start : start + len(block)]
+        # Rescore with the original float32 rows (only these pages are read)
+        candidates = np.sort(top_rows(approx, int(limit * self.oversampling)))
+        exact = np.asarray(self.vectors[candidates]) @ query
+        return [(int(candidates[i]), float(exact[i])) for i in top_rows(exact, limit)]
+
+    def sparse_search(
+        self, indices: Sequence[int], limit: int
+    ) -> List[Tuple[int, float]]:
+        if not self.has_sparse or not indices or limit <= 0:
+            return []
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in indices:
+            start = np.searchsorted(self.posting_terms, term, side="left")
+            end = np.searchsorted(self.posting_terms, term, side="right")
+            if start == end:
+                continue
+            idf = self.idf[np.searchsorted(self.idf_terms, term)]
+            # Query term weights are 1 (see services.sparse.bm25_query_vector).
+            # A term appears once per row, so the rows of a posting list are unique
+            scores[self.posting_rows[start:end]] += (
+                idf * self.posting_weights[start:end]
+            )
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        best = matched[top_rows(scores[matched], limit)]
+        return [(int(row), float(scores[row])) for row in best]
+
+    def hybrid_search(
+        self,
+        query_vector: Sequence[float],
+        sparse_indices: Sequence[int],
+        limit: int,
+        prefetch_limit: int,
+    ) -> List[Tuple[int, float]]:
+        # Dense and sparse candidates fused with Reciprocal Rank Fusion
+        fused: Dict[int, float] = {}
+        for hits in (
+            self.dense_search(query_vector, prefetch_limit),
+            self.sparse_search(sparse_indices, prefetch_limit),
+        ):
+            for rank, (row, _) in enumerate(hits):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank)
+        ranked = sorted(fused.items(), key=lambda item: -item[1])
+        return ranked[:limit]
+
+    def lookup(self, wanted: Dict[str, List[int]]) -> List[ScoredRow]:
+        # Chunks by position, like the API's Qdrant scroll on doc_id / chunk_index
+        rows = [
+            self.positions[(doc_id, position)]
+            for doc_id, positions in wanted.items()
+            for position in positions
+            if (doc_id, position) in self.positions
+        ]
+        return [ScoredRow(payload=self.payloads[row], score=0.0) for row in rows]
+
+    def to_points(
+        self,
+        hits: List[Tuple[int, float]],
+        query_vector: Sequence[float] | None = None,
+        dense: bool = False,
+    ) -> List[ScoredRow]:
+        # Dense hits are scored by cosine already, fused ones get it from their rows
+        dense_scores: List[float | None] = [None] * len(hits)
+        if dense:
+            dense_scores = [score for _, score in hits]
+        elif query_vector is not None and hits:
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+            rows = np.asarray([row for row, _ in hits])
+            dense_scores = (np.asarray(self.vectors[rows]) @ query).tolist()
+        return [
+            ScoredRow(payload=self.payloads[row], score=score, dense_score=dense_score)
+            for (row, score), dense_score in zip(hits, dense_scores)
+        ]
+
+
+class SnapshotIndex:
+    """
+    Keeps the latest published snapshot loaded. refresh() reads the latest.json
+    pointer and, when it names a new version, downloads it next to the current one,
+    loads it and swaps it in: requests keep using the old index until the swap,
+    which is a single attribute assignment.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        snapshot_uri: str,
+        cache_dir: str,
+        dtype: str = "float32",
+        oversampling: float = 2.0,
+        refresh_seconds: float = 60.0,
+    ) -> None:
+        if not snapshot_uri.startswith("s3://"):
+            raise ValueError(f"Expected s3://bucket/prefix, got: {snapshot_uri}")
+        bucket, _, prefix = snapshot_uri[len("s3://") :].partition("/")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.cache_dir = Path(cache_dir)
+        self.dtype = dtype
+        self.oversampling = oversampling
+        self.refresh_seconds = refresh_seconds
+        self.index: VectorIndex | None = None
+        self._lock = asyncio.Lock()
+
+    async def _read(self, key: str) -> bytes:
+        response = await self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        return await response["Body"].read()
+
+    async def _download(self, key: str, dest: Path) -> None:
+        response = await self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        body = response["Body"]
+        with dest.open("wb") as f:
+            while chunk := await body.read(1024 * 1024):
+                f.write(chunk)
+
+    async def refresh(self) -> bool:
+        """
+        Loads the published version if it is not the current one. Returns True when
+        a new index was swapped in.
+        """
+        async with self._lock:
+            pointer = json.loads(await self._read(f"{self.prefix}/{POINTER_FILE}"))
+            version = pointer["version"]
+            if self.index is not None and self.index.version == version:
+                return False
+
+            started = time.perf_counter()
+            directory = self.cache_dir / version
+            directory.mkdir(parents=True, exist_ok=True)
+            for name in pointer["files"]:
+                await self._download(
+                    f"{self.prefix}/{version}/{name}", directory / name
+                )
+            index = await asyncio.to_thread(
+                VectorIndex, directory, version, self.dtype, self.oversampling
+            )
+
+            previous, self.index = self.index, index
+            logger.info(
+                "Loaded vector snapshot %s points=%d dtype=%s in %dms",
+                version,
+                index.count,
+                self.dtype,
+                (time.perf_counter() - started) * 1000,
+            )
+            if previous is not None:
+                # In-flight searches hold their own reference to the old mapping
+                shutil.rmtree(previous.directory, ignore_errors=True)
+            return True
+
+    async def run(self) -> None:
+        # Background task of the API lifespan
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as error:
+                logger.warning("Vector snapshot refresh failed: %s", error)
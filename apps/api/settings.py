@@ -16,14 +16,63 @@ class Settings:
     bedrock_generation_model_id: str
 
     qdrant_api_key: str | None
+    # QDRANT_API_KEY as configured: a Secrets Manager ARN is read again once
+    # secret_cache_ttl_seconds passed, to follow rotations
+    qdrant_api_key_secret: str | None
+    secret_cache_ttl_seconds: float
     top_k_default: int
     top_k_max: int
     max_context_chunks: int
     max_context_chars: int
+    max_context_tokens: int
+
+    retrieval_mode: str
+    retrieval_backend: str
+    vector_snapshot_s3_uri: str | None
+    local_index_dir: str
+    local_index_dtype: str
+    local_index_refresh_seconds: float
+    sparse_vector_name: str
+    hybrid_prefetch_limit: int
+    context_expansion_radius: int
+    search_hnsw_ef: int | None
+    quantization_rescore: bool
+    quantization_oversampling: float
+    relevance_min_score: float
+    relevance_min_score_gap: float
+    relevance_gap_max_score: float
 
     gen_temperature: float
     gen_max_tokens: int
 
+    bedrock_embedding_max_concurrency: int
+    bedrock_generation_max_concurrency: int
+    qdrant_max_concurrency: int
+
+    bedrock_connect_timeout_seconds: float
+    bedrock_embedding_read_timeout_seconds: float
+    bedrock_generation_read_timeout_seconds: float
+    bedrock_retry_mode: str
+    bedrock_max_attempts: int
+    http_keepalive_seconds: float
+    qdrant_timeout_seconds: int
+    qdrant_prefer_grpc: bool
+    qdrant_grpc_port: int
+
+    query_embedding_cache_size: int
+    query_embedding_cache_ttl_seconds: int
+    query_embedding_cache_sqlite_path: str | None
+
+    answer_cache_collection: str | None
+    answer_cache_max_distance: float
+    answer_cache_ttl_seconds: int
+
+    single_flight: bool
+    batch_max_questions: int
+    batch_max_concurrency: int
+    stream_flush_interval_ms: float
+    stream_flush_bytes: int
+
     log_level: str
 
 
@@ -41,12 +90,75 @@ def load_settings() -> Settings:
         qdrant_collection=_required("QDRANT_COLLECTION"),
         bedrock_embedding_model_id=_required("BEDROCK_EMBEDDING_MODEL_ID"),
         bedrock_generation_model_id=_required("BEDROCK_GENERATION_MODEL_ID"),
-        qdrant_api_key=get_api_key(os.getenv("QDRANT_API_KEY")),
+        qdrant_api_key=get_api_key(
+            os.getenv("QDRANT_API_KEY"),
+            ttl_seconds=float(os.getenv("SECRET_CACHE_TTL_SECONDS", "300")),
+        ),
+        qdrant_api_key_secret=os.getenv("QDRANT_API_KEY"),
+        secret_cache_ttl_seconds=float(os.getenv("SECRET_CACHE_TTL_SECONDS", "300")),
         top_k_default=int(os.getenv("TOP_K_DEFAULT", "5")),
         top_k_max=int(os.getenv("TOP_K_MAX", "10")),
         max_context_chunks=int(os.getenv("MAX_CONTEXT_CHUNKS", "5")),
         max_context_chars=int(os.getenv("MAX_CONTEXT_CHARS", "12000")),
+        max_context_tokens=int(os.getenv("MAX_CONTEXT_TOKENS", "3000")),
+        retrieval_mode=os.getenv("RETRIEVAL_MODE", "hybrid").lower(),
+        retrieval_backend=os.getenv("RETRIEVAL_BACKEND", "qdrant").lower(),
+        vector_snapshot_s3_uri=os.getenv("VECTOR_SNAPSHOT_S3_URI"),
+        local_index_dir=os.getenv("LOCAL_INDEX_DIR", "/tmp/vector-index"),
+        local_index_dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32").lower(),
+        local_index_refresh_seconds=float(
+            os.getenv("LOCAL_INDEX_REFRESH_SECONDS", "60")
+        ),
+        sparse_vector_name=os.getenv("SPARSE_VECTOR_NAME", "bm25"),
+        hybrid_prefetch_limit=int(os.getenv("HYBRID_PREFETCH_LIMIT", "20")),
+        context_expansion_radius=int(os.getenv("CONTEXT_EXPANSION_RADIUS", "0")),
+        search_hnsw_ef=int(os.getenv("QDRANT_SEARCH_HNSW_EF", "128")) or None,
+        quantization_rescore=os.getenv("QDRANT_QUANTIZATION_RESCORE", "true").lower()
+        == "true",
+        quantization_oversampling=float(
+            os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0")
+        ),
+        relevance_min_score=float(os.getenv("RELEVANCE_MIN_SCORE", "0")),
+        relevance_min_score_gap=float(os.getenv("RELEVANCE_MIN_SCORE_GAP", "0")),
+        relevance_gap_max_score=float(os.getenv("RELEVANCE_GAP_MAX_SCORE", "1")),
         gen_temperature=float(os.getenv("GEN_TEMPERATURE", "0.2")),
         gen_max_tokens=int(os.getenv("GEN_MAX_TOKENS", "800")),
+        bedrock_embedding_max_concurrency=int(
+            os.getenv("BEDROCK_EMBEDDING_MAX_CONCURRENCY", "64")
+        ),
+        bedrock_generation_max_concurrency=int(
+            os.getenv("BEDROCK_GENERATION_MAX_CONCURRENCY", "512")
+        ),
+        qdrant_max_concurrency=int(os.getenv("QDRANT_MAX_CONCURRENCY", "64")),
+        bedrock_connect_timeout_seconds=float(
+            os.getenv("BEDROCK_CONNECT_TIMEOUT_SECONDS", "2")
+        ),
+        bedrock_embedding_read_timeout_seconds=float(
+            os.getenv("BEDROCK_EMBEDDING_READ_TIMEOUT_SECONDS", "10")
+        ),
+        bedrock_generation_read_timeout_seconds=float(
+            os.getenv("BEDROCK_GENERATION_READ_TIMEOUT_SECONDS", "60")
+        ),
+        bedrock_retry_mode=os.getenv("BEDROCK_RETRY_MODE", "adaptive").lower(),
+        bedrock_max_attempts=int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3")),
+        http_keepalive_seconds=float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60")),
+        qdrant_timeout_seconds=int(os.getenv("QDRANT_TIMEOUT_SECONDS", "15")),
+        qdrant_prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true",
+        qdrant_grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+        query_embedding_cache_size=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+        query_embedding_cache_ttl_seconds=int(
+            os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400")
+        ),
+        query_embedding_cache_sqlite_path=os.getenv(
+            "QUERY_EMBEDDING_CACHE_SQLITE_PATH"
+        ),
+        answer_cache_collection=os.getenv("QDRANT_ANSWER_CACHE_COLLECTION"),
+        answer_cache_max_distance=float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05")),
+        answer_cache_ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400")),
+        single_flight=os.getenv("SINGLE_FLIGHT", "true").lower() == "true",
+        batch_max_questions=int(os.getenv("BATCH_MAX_QUESTIONS", "100")),
+        batch_max_concurrency=int(os.getenv("BATCH_MAX_CONCURRENCY", "8")),
+        stream_flush_interval_ms=float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50")),
+        stream_flush_bytes=int(os.getenv("STREAM_FLUSH_BYTES", "256")),
         log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
     )
@@ -0,0 +1,565 @@
+import argparse
+import asyncio
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from stubs import (
+    AsyncLocalS3Client,
+    AsyncStubBedrockRuntime,
+    HashingEmbedder,
+    LocalS3Client,
+    StubBedrockRuntime,
+    tokenize,
+)
+
+APPS_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = APPS_DIR.parent
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    force=True,
+)
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.INFO)
+
+BUCKET = "benchmark"
+SNAPSHOT_URI = f"s3://{BUCKET}/snapshots/benchmark"
+STAGES = ("embed", "retrieval", "prompt", "first_token", "total")
+INGESTION_STAGES = ("extract", "chunk", "embed")
+
+# Per-question timings, one dict per asyncio task
+_current = contextvars.ContextVar("current_question")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Offline ingestion + RAG benchmark with stubbed Bedrock calls"
+    )
+    parser.add_argument("--corpus-dir", type=Path, default=REPO_DIR / "corpus")
+    parser.add_argument(
+        "--questions", type=Path, default=REPO_DIR / "self-managed-answers.txt"
+    )
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="Previous results file; exit 1 on recall drops or p95 regressions",
+    )
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument(
+        "--qdrant-url",
+        help="Qdrant server (e.g. http://localhost:6333). Default: local mode in a temp dir",
+    )
+    parser.add_argument("--qdrant-api-key", default=os.getenv("QDRANT_API_KEY", ""))
+    parser.add_argument("--collection", default="kb-benchmark")
+    parser.add_argument("--chunk-size", type=int, default=1200)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument(
+        "--chunking-strategy",
+        choices=("markdown+recursive", "sentence-window"),
+        default="markdown+recursive",
+    )
+    parser.add_argument("--sentence-window-chars", type=int, default=300)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--retrieval-mode", choices=("dense", "hybrid"), default="hybrid"
+    )
+    parser.add_argument(
+        "--retrieval-backend",
+        choices=("qdrant", "local"),
+        default="qdrant",
+        help="local: the API searches the vector snapshot exported after ingestion",
+    )
+    parser.add_argument(
+        "--local-index-dtype", choices=("float32", "int8"), default="float32"
+    )
+    parser.add_argument("--hybrid-prefetch-limit", type=int, default=20)
+    parser.add_argument(
+        "--context-expansion-radius",
+        type=int,
+        default=0,
+        help="Neighbours added before and after each hit, see CONTEXT_EXPANSION_RADIUS",
+    )
+    parser.add_argument("--search-hnsw-ef", type=int, default=128)
+    parser.add_argument(
+        "--quantization", choices=("none", "scalar", "binary"), default="scalar"
+    )
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100)
+    parser.add_argument(
+        "--relevance-min-score",
+        type=float,
+        default=0.0,
+        help="Relevance gate of the API (0 disables it), see RELEVANCE_MIN_SCORE",
+    )
+    parser.add_argument("--relevance-min-score-gap", type=float, default=0.0)
+    parser.add_argument("--relevance-gap-max-score", type=float, default=1.0)
+    parser.add_argument("--max-context-chunks", type=int, default=5)
+    parser.add_argument("--max-context-chars", type=int, default=12000)
+    parser.add_argument("--max-context-tokens", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--first-token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    # The Lambdas read their configuration at import time
+    os.environ.update(
+        {
+            "ENV": "",
+            "AWS_REGION": os.getenv("AWS_REGION", "us-east-1"),
+            "KNOWLEDGE_BASE_BUCKET": BUCKET,
+            "CHUNK_SIZE": str(args.chunk_size),
+            "CHUNK_OVERLAP": str(args.chunk_overlap),
+            "CHUNKING_STRATEGY": args.chunking_strategy,
+            "SENTENCE_WINDOW_CHARS": str(args.sentence_window_chars),
+            "EMBEDDING_DIMENSIONS": str(args.dimensions),
+            "QDRANT_URL": args.qdrant_url or "http://localhost:6333",
+            "QDRANT_API_KEY": args.qdrant_api_key,
+            "QDRANT_COLLECTION": args.collection,
+            "QDRANT_ANSWER_CACHE_COLLECTION": "",
+            "QDRANT_QUANTIZATION": args.quantization,
+            "QDRANT_HNSW_M": str(args.hnsw_m),
+            "QDRANT_HNSW_EF_CONSTRUCT": str(args.hnsw_ef_construct),
+            "VECTOR_SNAPSHOT_S3_URI": (
+                SNAPSHOT_URI if args.retrieval_backend == "local" else ""
+            ),
+        }
+    )
+    # Lambda modules first: the API has its own secret.py with another signature
+    for app in ("api", "utils", "embedding"):
+        sys.path.insert(0, str(APPS_DIR / app))
+
+
+def load_lambda(app: str):
+    # Every Lambda module is called main.py, load each one under its own name
+    spec = importlib.util.spec_from_file_location(
+        f"{app.replace('-', '_')}_main", APPS_DIR / app / "main.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        # Linear interpolation between closest ranks
+        pos = (len(ordered) - 1) * q
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(pick(0.50), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def load_questions(path: Path) -> List[Dict[str, str]]:
+    questions: List[Dict[str, str]] = []
+    for block in path.read_text(encoding="utf-8").split("=" * 50):
+        question, _, answer = block.strip().partition("\nA:")
+        if not question.startswith("Q:"):
+            continue
+        questions.append(
+            {"question": question[2:].strip(), "reference_answer": answer.strip()}
+        )
+    return questions
+
+
+def label_gold_chunks(
+    questions: List[Dict[str, str]], chunks: List[Dict[str, Any]], tokenize
+) -> None:
+    """
+    The question set has no chunk labels: the gold chunk of a question is the chunk
+    that contains the largest share of its reference answer's words.
+    """
+    chunk_tokens = [set(tokenize(chunk["text"])) for chunk in chunks]
+    for item in questions:
+        answer_tokens = {t for t in tokenize(item["reference_answer"]) if len(t) > 2}
+        best_score, best = -1.0, None
+        for chunk, tokens in zip(chunks, chunk_tokens):
+            score = len(answer_tokens & tokens) / max(1, len(answer_tokens))
+            if score > best_score:
+                best_score, best = score, chunk
+        item["gold_chunk_id"] = best["chunk_id"]
+        item["gold_doc_id"] = best["doc_id"]
+        item["gold_overlap"] = round(best_score, 3)
+
+
+def run_ingestion(args, s3, stub_runtime, qdrant_client) -> Dict[str, Any]:
+    pdf_to_text = load_lambda("pdf-to-text")
+    chunking = load_lambda("chunking")
+    embedding = load_lambda("embedding")
+    for module in (pdf_to_text, chunking, embedding):
+        module.s3_client = s3
+    embedding.bedrock_runtime = stub_runtime
+    embedding.qdrant_client = qdrant_client
+    # The Lambdas reset logging on import
+    logging.getLogger().setLevel(args.log_level.upper())
+    if qdrant_client.collection_exists(args.collection):
+        qdrant_client.delete_collection(args.collection)
+
+    timings: Dict[str, List[float]] = {stage: [] for stage in INGESTION_STAGES}
+    chunk_count = 0
+    started = time.perf_counter()
+
+    pdfs = sorted(args.corpus_dir.glob("*.pdf"))
+    for pdf in pdfs:
+        pdf_uri = s3.put_file(pdf, BUCKET, f"raw/{pdf.name}")
+
+        t0 = time.perf_counter()
+        record = pdf_to_text.process_pdf_from_s3(pdf_uri)
+        t1 = time.perf_counter()
+        chunked = chunking.process_corpus_from_s3(record["corpus_s3_uri"])
+        t2 = time.perf_counter()
+        embedded = embedding.process_chunks_from_s3(chunked["chunks_s3_uri"])
+        t3 = time.perf_counter()
+
+        timings["extract"].append((t1 - t0) * 1000)
+        timings["chunk"].append((t2 - t1) * 1000)
+        timings["embed"].append((t3 - t2) * 1000)
+        chunk_count += embedded["embedding_count"]
+        logger.info(
+            f"Ingested {pdf.name} doc_id={record['doc_id']} chunks={embedded['embedding_count']}"
+        )
+
+    if args.retrieval_backend == "local":
+        embedding.publish_vector_snapshot([])
+
+    return {
+        "documents": len(pdfs),
+        "chunks": chunk_count,
+        "total_s": round(time.perf_counter() - started, 3),
+        "stages_ms": {stage: percentiles(timings[stage]) for stage in timings},
+    }
+
+
+def load_chunks(s3_root: Path) -> List[Dict[str, Any]]:
+    chunks: List[Dict[str, Any]] = []
+    for path in sorted((s3_root / BUCKET / "chunks").glob("*/chunks.jsonl")):
+        with path.open("r", encoding="utf-8") as f:
+            chunks.extend(json.loads(line) for line in f if line.strip())
+    return chunks
+
+
+def _timed(stage: str, fn):
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        result = await fn(*args, **kwargs)
+        current = _current.get()
+        current[stage] = (time.perf_counter() - t0) * 1000
+        if stage == "retrieval":
+            current["retrieved"] = result
+        return result
+
+    return wrapper
+
+
+def _timed_sync(stage: str, fn):
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        _current.get()[stage] = (time.perf_counter() - t0) * 1000
+        return result
+
+    return wrapper
+
+
+def build_rag_service(args, qdrant_client, runtime, local_index=None):
+    from services.embeddings import EmbeddingService
+    from services.generation import GenerationService
+    from services.prompting import PromptBuilder
+    from services.rag import RAGService
+    from services.retrieval import RelevanceGate, RetrievalService
+
+    embedding_service = EmbeddingService(
+        bedrock_runtime=runtime,
+        model_id="stub-embedding",
+        semaphore=asyncio.Semaphore(args.concurrency),
+    )
+    retrieval_service = RetrievalService(
+        qdrant_client=qdrant_client,
+        collection_name=args.collection,
+        semaphore=asyncio.Semaphore(args.concurrency),
+        retrieval_mode=args.retrieval_mode,
+        hybrid_prefetch_limit=args.hybrid_prefetch_limit,
+        search_hnsw_ef=args.search_hnsw_ef or None,
+        local_index=local_index,
+        expansion_radius=args.context_expansion_radius,
+        relevance_gate=RelevanceGate(
+            min_score=args.relevance_min_score,
+            min_score_gap=args.relevance_min_score_gap,
+            gap_max_score=args.relevance_gap_max_score,
+        ),
+    )
+    prompt_builder = PromptBuilder(
+        max_context_chunks=args.max_context_chunks,
+        max_context_chars=args.max_context_chars,
+        max_context_tokens=args.max_context_tokens,
+    )
+    generation_service = GenerationService(
+        bedrock_runtime=runtime,
+        model_id="stub-generation",
+        temperature=0.0,
+        max_tokens=800,
+        semaphore=asyncio.Semaphore(args.concurrency),
+    )
+
+    # Instance-level wrappers: RAGService runs unchanged, stages are timed around it
+    embedding_service.embed_query = _timed("embed", embedding_service.embed_query)
+    retrieval_service.similarity_search = _timed(
+        "retrieval", retrieval_service.similarity_search
+    )
+    prompt_builder.build_messages_for_bedrock_converse = _timed_sync(
+        "prompt", prompt_builder.build_messages_for_bedrock_converse
+    )
+
+    return RAGService(
+        embedding_service=embedding_service,
+        retrieval_service=retrieval_service,
+        prompt_builder=prompt_builder,
+        generation_service=generation_service,
+        top_k_default=args.top_k,
+        top_k_max=max(args.top_k, 10),
+    )
+
+
+async def ask(rag_service, item: Dict[str, str]) -> Dict[str, Any]:
+    from services.metrics import RequestMetrics
+
+    current: Dict[str, Any] = {}
+    _current.set(current)
+    request_metrics = RequestMetrics()
+
+    t0 = time.perf_counter()
+    answer_parts: List[str] = []
+    async for text in rag_service.stream_answer(item["question"], request_metrics):
+        if not answer_parts:
+            current["first_token"] = (time.perf_counter() - t0) * 1000
+        answer_parts.append(text)
+    current["total"] = (time.perf_counter() - t0) * 1000
+    current["answer"] = "".join(answer_parts)
+    current["outcome"] = request_metrics.outcome
+    current["top_score"] = request_metrics.top_score
+    current["input_tokens"] = request_metrics.usage.input_tokens
+    return current
+
+
+async def run_queries(
+    args, questions, qdrant_client, runtime, local_index=None
+) -> Dict[str, Any]:
+    rag_service = build_rag_service(args, qdrant_client, runtime, local_index)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(item):
+        async with semaphore:
+            return await ask(rag_service, item)
+
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    per_question: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+
+    for round_no in range(args.repeat):
+        results = await asyncio.gather(*(bounded(item) for item in questions))
+        for item, result in zip(questions, results):
+            for stage in STAGES:
+                if stage in result:
+                    timings[stage].append(result[stage])
+            if round_no > 0:
+                continue
+
+            context = result.get("retrieved") or []
+            # Ranked hits only, the expanded neighbours are context around them
+            retrieved = [chunk for chunk in context if chunk.expanded_from is None]
+            chunk_ids = [chunk.chunk_id for chunk in retrieved]
+            doc_ids = [chunk.doc_id for chunk in retrieved]
+            rank = (
+                chunk_ids.index(item["gold_chunk_id"]) + 1
+                if item["gold_chunk_id"] in chunk_ids
+                else None
+            )
+            per_question.append(
+                {
+                    "question": item["question"],
+                    "gold_chunk_id": item["gold_chunk_id"],
+                    "gold_overlap": item["gold_overlap"],
+                    "retrieved_chunk_ids": chunk_ids,
+                    "gold_rank": rank,
+                    "doc_hit": item["gold_doc_id"] in doc_ids,
+                    "gold_in_context": any(
+                        chunk.chunk_id == item["gold_chunk_id"] for chunk in context
+                    ),
+                    "top_score": (
+                        round(result["top_score"], 4)
+                        if result["top_score"] is not None
+                        else None
+                    ),
+                    "generation_skipped": result["outcome"] == "low_relevance",
+                    "input_tokens": result["input_tokens"],
+                    **{s: round(result[s], 3) for s in STAGES if s in result},
+                }
+            )
+
+    wall_s = time.perf_counter() - started
+    n = len(per_question)
+    return {
+        "count": len(timings["total"]),
+        "wall_s": round(wall_s, 3),
+        "queries_per_s": round(len(timings["total"]) / wall_s, 3) if wall_s else 0.0,
+        "recall_at_k": round(
+            sum(q["gold_rank"] is not None for q in per_question) / n, 4
+        ),
+        "doc_recall_at_k": round(sum(q["doc_hit"] for q in per_question) / n, 4),
+        "context_recall": round(sum(q["gold_in_context"] for q in per_question) / n, 4),
+        "mrr": round(
+            sum(1 / q["gold_rank"] for q in per_question if q["gold_rank"]) / n, 4
+        ),
+        "generation_skipped": sum(q["generation_skipped"] for q in per_question),
+        "input_tokens_mean": round(sum(q["input_tokens"] for q in per_question) / n, 1),
+        "stages_ms": {stage: percentiles(timings[stage]) for stage in STAGES},
+        "per_question": per_question,
+    }
+
+
+def compare_with_baseline(
+    results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> List[str]:
+    regressions: List[str] = []
+    for metric in ("recall_at_k", "doc_recall_at_k", "mrr"):
+        old, new = baseline["queries"][metric], results["queries"][metric]
+        if new < old:
+            regressions.append(f"{metric} {old} -> {new}")
+
+    for section, stages in (("queries", STAGES), ("ingestion", INGESTION_STAGES)):
+        for stage in stages:
+            old = baseline[section]["stages_ms"].get(stage, {}).get("p95")
+            new = results[section]["stages_ms"].get(stage, {}).get("p95")
+            if old and new and new > old * (1 + max_regression):
+                regressions.append(f"{section}.{stage}.p95_ms {old} -> {new}")
+    return regressions
+
+
+def main() -> int:
+    args = parse_args()
+    configure_environment(args)
+
+    embedder = HashingEmbedder(args.dimensions)
+    with tempfile.TemporaryDirectory(prefix="rag-benchmark-") as tmp:
+        tmp_dir = Path(tmp)
+        s3 = LocalS3Client(tmp_dir / "s3")
+
+        # Sync and async clients do not share an in-memory store, local mode on a
+        # temp dir lets the async API client read what the Lambda wrote
+        if args.qdrant_url:
+            qdrant_kwargs = {
+                "url": args.qdrant_url,
+                "api_key": args.qdrant_api_key or None,
+            }
+        else:
+            qdrant_kwargs = {"path": str(tmp_dir / "qdrant")}
+
+        qdrant_client = QdrantClient(**qdrant_kwargs)
+        ingestion = run_ingestion(
+            args,
+            s3,
+            StubBedrockRuntime(embedder, latency_ms=args.embed_latency_ms),
+            qdrant_client,
+        )
+        qdrant_client.close()
+
+        questions = load_questions(args.questions)
+        label_gold_chunks(questions, load_chunks(s3.root), tokenize)
+
+        async def query_phase() -> Dict[str, Any]:
+            async_client = AsyncQdrantClient(**qdrant_kwargs)
+            local_index = None
+            if args.retrieval_backend == "local":
+                from services.vector_index import SnapshotIndex
+
+                local_index = SnapshotIndex(
+                    s3_client=AsyncLocalS3Client(s3.root),
+                    snapshot_uri=SNAPSHOT_URI,
+                    cache_dir=str(tmp_dir / "vector-index"),
+                    dtype=args.local_index_dtype,
+                )
+                await local_index.refresh()
+            try:
+                return await run_queries(
+                    args,
+                    questions,
+                    async_client,
+                    AsyncStubBedrockRuntime(
+                        embedder,
+                        embed_latency_ms=args.embed_latency_ms,
+                        first_token_latency_ms=args.first_token_latency_ms,
+                        token_latency_ms=args.token_latency_ms,
+                    ),
+                    local_index,
+                )
+            finally:
+                await async_client.close()
+
+        queries = asyncio.run(query_phase())
+
+    results = {
+        "created_at_utc": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "config": {
+            k: (str(v) if isinstance(v, Path) else v)
+            for k, v in vars(args).items()
+            if k not in ("qdrant_api_key", "baseline", "output")
+        },
+        "ingestion": ingestion,
+        "queries": queries,
+    }
+    args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    summary = {
+        "documents": ingestion["documents"],
+        "chunks": ingestion["chunks"],
+        "recall_at_k": queries["recall_at_k"],
+        "doc_recall_at_k": queries["doc_recall_at_k"],
+        "mrr": queries["mrr"],
+        "context_recall": queries["context_recall"],
+        "input_tokens_mean": queries["input_tokens_mean"],
+        **{f"{s}_p95_ms": queries["stages_ms"][s].get("p95") for s in STAGES},
+    }
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
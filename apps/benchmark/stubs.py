@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import io
+import json
+import math
+import re
+import shutil
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in for the Titan embedding model: hashed unigrams and
+    bigrams with a sign bit, L2-normalized. Texts sharing words end up close, so
+    retrieval quality is meaningful without calling Bedrock.
+    """
+
+    def __init__(self, dimensions: int) -> None:
+        self.dimensions = dimensions
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm == 0.0:
+            # Bedrock never returns a zero vector, Qdrant cosine rejects it
+            vector[0] = 1.0
+            return vector
+        return [v / norm for v in vector]
+
+
+class LocalS3Client:
+    """
+    Implements the object calls made by utils.s3 and utils.manifest on top of a
+    local directory (<root>/<bucket>/<key>).
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> Path:
+        return self.root / bucket / key
+
+    def put_file(self, src: Path, bucket: str, key: str) -> str:
+        self.upload_file(str(src), bucket, key)
+        return f"s3://{bucket}/{key}"
+
+    def _existing_path(self, bucket: str, key: str, operation: str) -> Path:
+        path = self._path(bucket, key)
+        if not path.is_file():
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": key}}, operation
+            )
+        return path
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        path = self._existing_path(Bucket, Key, "GetObject")
+        return {"Body": StreamingBody(path.open("rb"), path.stat().st_size)}
+
+    def head_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        path = self._existing_path(Bucket, Key, "HeadObject")
+        etag = hashlib.md5(path.read_bytes()).hexdigest()
+        return {"ETag": f'"{etag}"', "ContentLength": path.stat().st_size}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> None:
+        dest = self._path(Bucket, Key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(Body)
+
+    def delete_object(self, Bucket: str, Key: str) -> None:
+        self._path(Bucket, Key).unlink(missing_ok=True)
+
+    def download_file(self, bucket: str, key: str, filename: str) -> None:
+        shutil.copyfile(self._path(bucket, key), filename)
+
+    def upload_file(
+        self, filename: str, bucket: str, key: str, ExtraArgs: Dict[str, Any] = None
+    ) -> None:
+        dest = self._path(bucket, key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, dest)
+
+
+class AsyncLocalS3Client(LocalS3Client):
+    """
+    get_object of the aiobotocore S3 client, for the API's vector snapshot loader.
+    """
+
+    async def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        path = self._existing_path(Bucket, Key, "GetObject")
+        return {"Body": _AsyncBody(path.read_bytes())}
+
+
+class StubBedrockRuntime:
+    """
+    Synchronous bedrock-runtime stub for the embedding Lambda (invoke_model only).
+    """
+
+    def __init__(self, embedder: HashingEmbedder, latency_ms: float = 0.0) -> None:
+        self.embedder = embedder
+        self.latency_s = latency_ms / 1000.0
+
+    def invoke_model(self, modelId: str, body: Any, **kwargs) -> Dict[str, Any]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        text = json.loads(body)["inputText"]
+        payload = {"embedding": self.embedder.embed(text)}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+class _AsyncBody:
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._offset = 0
+
+    async def read(self, amt: int | None = None) -> bytes:
+        end = len(self._data) if amt is None else self._offset + amt
+        chunk = self._data[self._offset : end]
+        self._offset += len(chunk)
+        return chunk
+
+
+class _StubEventStream:
+    def __init__(self, events: List[Dict[str, Any]], first_latency_s, latency_s):
+        self._events = events
+        self._first_latency_s = first_latency_s
+        self._latency_s = latency_s
+
+    async def __aiter__(self):
+        first = True
+        for event in self._events:
+            if "contentBlockDelta" in event:
+                delay = self._first_latency_s if first else self._latency_s
+                first = False
+                if delay:
+                    await asyncio.sleep(delay)
+            yield event
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncStubBedrockRuntime:
+    """
+    aiobotocore bedrock-runtime stub for the API: invoke_model returns HashingEmbedder
+    vectors and converse_stream streams the first words of the top context block
+    with the same event sequence as ConverseStream.
+    """
+
+    def __init__(
+        self,
+        embedder: HashingEmbedder,
+        embed_latency_ms: float = 0.0,
+        first_token_latency_ms: float = 0.0,
+        token_latency_ms: float = 0.0,
+        answer_words: int = 60,
+    ) -> None:
+        self.embedder = embedder
+        self.embed_latency_s = embed_latency_ms / 1000.0
+        self.first_token_latency_s = first_token_latency_ms / 1000.0
+        self.token_latency_s = token_latency_ms / 1000.0
+        self.answer_words = answer_words
+
+    async def invoke_model(self, modelId: str, body: Any, **kwargs) -> Dict[str, Any]:
+        if self.embed_latency_s:
+            await asyncio.sleep(self.embed_latency_s)
+        text = json.loads(body)["inputText"]
+        payload = {"embedding": self.embedder.embed(text)}
+        return {"body": _AsyncBody(json.dumps(payload).encode("utf-8"))}
+
+    async def converse_stream(self, modelId: str, messages, **kwargs):
+        user_text = messages[-1]["content"][0]["text"]
+        _, _, context = user_text.partition("[Context 1]")
+        words = context.split("[Context 2]")[0].split()[: self.answer_words]
+        if not words:
+            words = ["I", "do", "not", "have", "enough", "information."]
+
+        events: List[Dict[str, Any]] = [{"messageStart": {"role": "assistant"}}]
+        for i, word in enumerate(words):
+            text = word if i == 0 else f" {word}"
+            events.append(
+                {"contentBlockDelta": {"contentBlockIndex": 0, "delta": {"text": text}}}
+            )
+        events += [
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {
+                "metadata": {
+                    "usage": {
+                        "inputTokens": len(user_text) // 4,
+                        "outputTokens": len(words),
+                        "totalTokens": len(user_text) // 4 + len(words),
+                    },
+                    "metrics": {"latencyMs": 0},
+                }
+            },
+        ]
+        return {
+            "stream": _StubEventStream(
+                events, self.first_token_latency_s, self.token_latency_s
+            )
+        }
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from main import percentiles
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models as qmodels
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    force=True,
+)
+logger = logging.getLogger("transport-benchmark")
+
+TRANSPORTS = ("rest", "grpc")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compares Qdrant upsert and query throughput over REST and gRPC on the same data"
+    )
+    parser.add_argument(
+        "--qdrant-url",
+        default="http://localhost:6333",
+        help="Qdrant server REST URL (gRPC needs a server, there is no local mode)",
+    )
+    parser.add_argument("--qdrant-api-key", default=os.getenv("QDRANT_API_KEY", ""))
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    parser.add_argument("--collection-prefix", default="kb-transport")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--payload-chars", type=int, default=1200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--upsert-concurrency", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--query-concurrency", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--search-hnsw-ef", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=Path("transport-results.json"))
+    return parser.parse_args()
+
+
+def unit_vectors(rng: np.random.Generator, count: int, dimensions: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, dimensions), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_points(args: argparse.Namespace) -> List[qmodels.PointStruct]:
+    """
+    Same points for every transport: random unit vectors with a payload the size
+    of a chunk record, so requests carry realistic bodies.
+    """
+    rng = np.random.default_rng(args.seed)
+    vectors = unit_vectors(rng, args.points, args.dimensions)
+    text = ("lorem ipsum " * (args.payload_chars // 12 + 1))[: args.payload_chars]
+    return [
+        qmodels.PointStruct(
+            id=i,
+            vector=vectors[i].tolist(),
+            payload={
+                "doc_id": f"doc-{i // 50:05d}",
+                "chunk_index": i % 50,
+                "text": text,
+            },
+        )
+        for i in range(args.points)
+    ]
+
+
+async def bounded_gather(concurrency: int, calls) -> List[float]:
+    # Runs the calls with at most `concurrency` in flight, returns each latency in ms
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(timed(call) for call in calls))
+
+
+async def wait_for_indexing(client: AsyncQdrantClient, collection: str) -> None:
+    # Query timings would otherwise depend on how far the optimizer got
+    while True:
+        info = await client.get_collection(collection)
+        if info.status == qmodels.CollectionStatus.GREEN:
+            return
+        await asyncio.sleep(0.5)
+
+
+async def run_transport(
+    args: argparse.Namespace,
+    transport: str,
+    points: List[qmodels.PointStruct],
+    queries: np.ndarray,
+) -> Dict[str, Any]:
+    collection = f"{args.collection_prefix}-{transport}"
+    client = AsyncQdrantClient(
+        url=args.qdrant_url,
+        api_key=args.qdrant_api_key or None,
+        prefer_grpc=transport == "grpc",
+        grpc_port=args.grpc_port,
+        timeout=60,
+        pool_size=None if transport == "grpc" else args.query_concurrency,
+    )
+    try:
+        if await client.collection_exists(collection):
+            await client.delete_collection(collection)
+        await client.create_collection(
+            collection_name=collection,
+            vectors_config=qmodels.VectorParams(
+                size=args.dimensions, distance=qmodels.Distance.COSINE
+            ),
+        )
+
+        batches = [
+            points[i : i + args.batch_size]
+            for i in range(0, len(points), args.batch_size)
+        ]
+        started = time.perf_counter()
+        upsert_ms = await bounded_gather(
+            args.upsert_concurrency,
+            [
+                lambda batch=batch: client.upsert(
+                    collection_name=collection, points=batch, wait=True
+                )
+                for batch in batches
+            ],
+        )
+        upsert_s = time.perf_counter() - started
+        await wait_for_indexing(client, collection)
+
+        search_params = qmodels.SearchParams(hnsw_ef=args.search_hnsw_ef or None)
+
+        def query_call(vector: np.ndarray):
+            return lambda: client.query_points(
+                collection_name=collection,
+                query=vector.tolist(),
+                limit=args.top_k,
+                with_payload=True,
+                search_params=search_params,
+            )
+
+        # Warm-up: connections (or gRPC channels) and caches
+        await bounded_gather(
+            args.query_concurrency, [query_call(v) for v in queries[:50]]
+        )
+        started = time.perf_counter()
+        query_ms = await bounded_gather(
+            args.query_concurrency, [query_call(v) for v in queries]
+        )
+        query_s = time.perf_counter() - started
+
+        await client.delete_collection(collection)
+    finally:
+        await client.close()
+
+    result = {
+        "upsert": {
+            "points_per_s": round(len(points) / upsert_s, 1),
+            "wall_s": round(upsert_s, 3),
+            "batch_ms": percentiles(upsert_ms),
+        },
+        "query": {
+            "queries_per_s": round(len(queries) / query_s, 1),
+            "wall_s": round(query_s, 3),
+            "latency_ms": percentiles(query_ms),
+        },
+    }
+    logger.info(
+        f"{transport}: {result['upsert']['points_per_s']} points/s, {result['query']['queries_per_s']} queries/s"
+    )
+    return result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    points = build_points(args)
+    queries = unit_vectors(
+        np.random.default_rng(args.seed + 1), args.queries, args.dimensions
+    )
+    results = {}
+    for transport in TRANSPORTS:
+        results[transport] = await run_transport(args, transport, points, queries)
+    return results
+
+
+def main() -> int:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    rest, grpc = results["rest"], results["grpc"]
+    report = {
+        "config": {
+            k: (str(v) if isinstance(v, Path) else v)
+            for k, v in vars(args).items()
+            if k not in ("qdrant_api_key", "output")
+        },
+        **results,
+        "grpc_vs_rest": {
+            "upsert_throughput": round(
+                grpc["upsert"]["points_per_s"] / rest["upsert"]["points_per_s"], 3
+            ),
+            "query_throughput": round(
+                grpc["query"]["queries_per_s"] / rest["query"]["queries_per_s"], 3
+            ),
+        },
+    }
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(json.dumps(report["grpc_vs_rest"], indent=2))
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
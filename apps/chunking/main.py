@@ -4,14 +4,18 @@ import os
 from pathlib import Path
 from typing import Any, Dict, List
 
-import boto3
 from dotenv import load_dotenv
-from langchain_text_splitters import (
-    MarkdownTextSplitter,
-    RecursiveCharacterTextSplitter,
-)
+from utils.batch import parse_s3_uris, process_batch
+from utils.clients import aws_client_config
 from utils.env_vars import validate_required_env
+from utils.manifest import (
+    load_manifest,
+    object_etag,
+    stage_fingerprint,
+    write_manifest,
+)
 from utils.s3 import download_s3_object, upload_s3_object
+from utils.startup import Lazy, lazy_import, report_startup, startup
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,12 +30,23 @@ INPUT_CORPUS_PATH = TMP_DIR / "corpus.json"
 OUTPUT_CHUNKS_PATH = TMP_DIR / "chunks.jsonl"
 
 BUCKET = os.getenv("KNOWLEDGE_BASE_BUCKET")
-s3_client = boto3.client("s3")
+# Deferred: an invocation answered from a manifest never loads the splitters
+boto3 = lazy_import("boto3")
+text_splitters = lazy_import("langchain_text_splitters")
+s3_client = Lazy("client s3", lambda: boto3.client("s3", config=aws_client_config()))
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1200"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
 MAX_EMBED_INPUT_CHARS = int(os.getenv("MAX_EMBED_INPUT_CHARS", "40000"))
 TOKEN_RATIO = float(os.getenv("TOKEN_RATIO", "4.0"))
+# "sentence-window": small windows of whole sentences for matching, the API expands
+# each hit to its neighbours for the prompt (CONTEXT_EXPANSION_RADIUS)
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "markdown+recursive")
+SENTENCE_WINDOW_CHARS = int(os.getenv("SENTENCE_WINDOW_CHARS", "300"))
+SENTENCE_SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", "; ", " ", ""]
+# Skip chunking when a completed manifest exists for the same corpus and config
+STAGE_MANIFESTS = os.getenv("STAGE_MANIFESTS", "true").lower() == "true"
+STAGE = "chunking"
 
 
 def parse_s3_uri(s3_uri: str) -> tuple[str, str]:
@@ -61,12 +76,12 @@ def split_markdown_text(text: str) -> List[str]:
     1) Markdown-aware splitter (better heading boundaries)
     2) Fallback recursive splitter if any chunk is still too large
     """
-    md_splitter = MarkdownTextSplitter(
+    md_splitter = text_splitters.MarkdownTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
 
-    recursive_splitter = RecursiveCharacterTextSplitter(
+    recursive_splitter = text_splitters.RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
@@ -94,12 +109,41 @@ def split_markdown_text(text: str) -> List[str]:
     return chunks
 
 
+def split_sentence_windows(text: str) -> List[str]:
+    """
+    Consecutive sentences grouped up to SENTENCE_WINDOW_CHARS, without overlap:
+    the context around a window comes from its neighbours at query time.
+    """
+    splitter = text_splitters.RecursiveCharacterTextSplitter(
+        chunk_size=SENTENCE_WINDOW_CHARS,
+        chunk_overlap=0,
+        separators=SENTENCE_SEPARATORS,
+        keep_separator="end",
+    )
+    return [c.strip() for c in splitter.split_text(text) if c and c.strip()]
+
+
+def split_text(text: str) -> List[str]:
+    if CHUNKING_STRATEGY == "sentence-window":
+        return split_sentence_windows(text)
+    if CHUNKING_STRATEGY == "markdown+recursive":
+        return split_markdown_text(text)
+    raise ValueError(
+        "CHUNKING_STRATEGY must be 'markdown+recursive' or 'sentence-window'"
+    )
+
+
+def chunk_id_for(doc_id: str, chunk_index: int) -> str:
+    return f"{doc_id}:{chunk_index:06d}"
+
+
 def build_chunk_records(doc: Dict[str, Any], chunks: List[str]) -> List[Dict[str, Any]]:
     doc_id = doc["doc_id"]
+    windows = CHUNKING_STRATEGY == "sentence-window"
 
     records: List[Dict[str, Any]] = []
     for i, chunk_text in enumerate(chunks):
-        chunk_id = f"{doc_id}:{i:06d}"
+        chunk_id = chunk_id_for(doc_id, i)
         records.append(
             {
                 "chunk_id": chunk_id,
@@ -111,11 +155,19 @@ def build_chunk_records(doc: Dict[str, Any], chunks: List[str]) -> List[Dict[str
                     "source_s3_uri": doc.get("source_s3_uri"),
                     "extracted_at_utc": doc.get("extracted_at_utc"),
                     "format": doc.get("format"),
-                    "chunk_size_chars": CHUNK_SIZE,
-                    "chunk_overlap_chars": CHUNK_OVERLAP,
-                    "chunking_strategy": "markdown+recursive",
+                    "chunk_size_chars": (
+                        SENTENCE_WINDOW_CHARS if windows else CHUNK_SIZE
+                    ),
+                    "chunk_overlap_chars": 0 if windows else CHUNK_OVERLAP,
+                    "chunking_strategy": CHUNKING_STRATEGY,
                     "char_count": len(chunk_text),
                     "estimated_token_count": estimate_tokens(chunk_text),
+                    # Neighbourhood links: chunk_index is contiguous within a document
+                    "chunk_count": len(chunks),
+                    "prev_chunk_id": chunk_id_for(doc_id, i - 1) if i > 0 else None,
+                    "next_chunk_id": (
+                        chunk_id_for(doc_id, i + 1) if i + 1 < len(chunks) else None
+                    ),
                 },
             }
         )
@@ -128,12 +180,40 @@ def write_chunks_jsonl(chunk_records: List[Dict[str, Any]], path: Path) -> None:
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
 
 
-def process_corpus_from_s3(s3_uri: str) -> Dict[str, Any]:
+def stage_config(corpus_etag: str) -> Dict[str, Any]:
+    # The corpus ETag changes whenever pdf-to-text rewrites the corpus
+    config = {
+        "corpus_etag": corpus_etag,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "max_embed_input_chars": MAX_EMBED_INPUT_CHARS,
+        "token_ratio": TOKEN_RATIO,
+        "chunking_strategy": CHUNKING_STRATEGY,
+    }
+    if CHUNKING_STRATEGY == "sentence-window":
+        config["sentence_window_chars"] = SENTENCE_WINDOW_CHARS
+    return config
+
+
+def process_corpus_from_s3(s3_uri: str, force: bool = False) -> Dict[str, Any]:
     bucket, key = parse_s3_uri(s3_uri)
 
     if not key.endswith("/corpus.json"):
         raise ValueError(f"Expected clean/<doc_id>/corpus.json, got: {key}")
 
+    if STAGE_MANIFESTS:
+        doc_id = Path(key).parent.name
+        config = stage_config(object_etag(s3_client, bucket, key))
+        fingerprint = stage_fingerprint(config)
+        manifest = None
+        if not force:
+            manifest = load_manifest(s3_client, BUCKET, doc_id, STAGE, fingerprint)
+        if manifest:
+            logger.info(
+                f"doc_id={doc_id} already chunked at {manifest['completed_at_utc']}, skipping"
+            )
+            return {**manifest["result"], "from_manifest": True}
+
     download_s3_object(s3_client, bucket, key, INPUT_CORPUS_PATH)
 
     doc = load_corpus_record(INPUT_CORPUS_PATH)
@@ -142,7 +222,7 @@ def process_corpus_from_s3(s3_uri: str) -> Dict[str, Any]:
         raise RuntimeError("Corpus text is empty")
 
     logger.info(f"Chunking doc_id={doc.get('doc_id')} title={doc.get('title')}")
-    chunks = split_markdown_text(text)
+    chunks = split_text(text)
     chunk_records = build_chunk_records(doc, chunks)
     lengths = [len(c["text"]) for c in chunk_records]
     if lengths:
@@ -160,26 +240,39 @@ def process_corpus_from_s3(s3_uri: str) -> Dict[str, Any]:
     chunks_key = f"chunks/{doc_id}/chunks.jsonl"
     upload_s3_object(s3_client, BUCKET, chunks_key, OUTPUT_CHUNKS_PATH)
 
-    return {
+    result = {
         "doc_id": doc_id,
         "corpus_s3_uri": s3_uri,
         "chunks_s3_uri": f"s3://{BUCKET}/{chunks_key}",
         "chunk_count": len(chunk_records),
         "chunk_size": CHUNK_SIZE,
         "chunk_overlap": CHUNK_OVERLAP,
+        "chunking_strategy": CHUNKING_STRATEGY,
     }
+    if STAGE_MANIFESTS:
+        write_manifest(s3_client, BUCKET, doc_id, STAGE, fingerprint, config, result)
+    return result
 
 
+@report_startup
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     logger.info(f"Input Event => {event}")
     validate_required_env(["KNOWLEDGE_BASE_BUCKET"])
+    force = bool(event.get("force"))
+    if "s3_uris" in event:
+        return process_batch(
+            parse_s3_uris(event),
+            lambda s3_uri: process_corpus_from_s3(s3_uri, force=force),
+        )
     s3_uri = event.get("s3_uri")
     if not isinstance(s3_uri, str) or not s3_uri:
         raise ValueError("Expected event['s3_uri'] as a non-empty string")
-    result = process_corpus_from_s3(s3_uri)
+    result = process_corpus_from_s3(s3_uri, force=force)
     return {"ok": True, "result": result}
 
 
+startup.init_done()
+
 if os.getenv("ENV", "").upper() == "DEVELOPMENT":
     event = {
         "s3_uri": "s3://knowledge-base-dev-937168356724/clean/2d9c79cb32d574af/corpus.json"
@@ -0,0 +1,129 @@
+import logging
+from typing import Any, Dict
+
+from qdrant_client.http import models as qmodels
+
+logger = logging.getLogger(__name__)
+
+# Payload fields filtered on by ingestion (incremental lookups) and by the API
+PAYLOAD_INDEXES = {
+    "doc_id": qmodels.PayloadSchemaType.KEYWORD,
+    "chunk_index": qmodels.PayloadSchemaType.INTEGER,
+    "content_hash": qmodels.PayloadSchemaType.KEYWORD,
+    # Finds the earlier doc_ids of a re-uploaded source
+    "meta.source_s3_uri": qmodels.PayloadSchemaType.KEYWORD,
+}
+
+
+def build_quantization_config(
+    quantization: str, always_ram: bool
+) -> qmodels.QuantizationConfig | None:
+    if quantization == "none":
+        return None
+    if quantization == "scalar":
+        return qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(
+                type=qmodels.ScalarType.INT8, quantile=0.99, always_ram=always_ram
+            )
+        )
+    if quantization == "binary":
+        return qmodels.BinaryQuantization(
+            binary=qmodels.BinaryQuantizationConfig(always_ram=always_ram)
+        )
+    raise ValueError("QDRANT_QUANTIZATION must be one of none, scalar, binary")
+
+
+def ensure_collection(
+    qdrant_client,
+    collection_name: str,
+    dimensions: int,
+    sparse_vector_name: str | None,
+    quantization: str,
+    quantization_always_ram: bool,
+    hnsw_m: int,
+    hnsw_ef_construct: int,
+    vectors_on_disk: bool,
+    on_disk_payload: bool,
+) -> Dict[str, Any]:
+    """
+    Creates the collection if it does not exist, otherwise verifies it: a vector size
+    or distance mismatch is an error, while HNSW/quantization/on-disk drift is
+    updated in place. Payload indexes are created in both cases (idempotent).
+    """
+    quantization_config = build_quantization_config(
+        quantization, quantization_always_ram
+    )
+    hnsw_config = qmodels.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+    created = False
+    updated = False
+
+    if not qdrant_client.collection_exists(collection_name):
+        logger.info(
+            f"Creating Qdrant collection {collection_name} dims={dimensions} quantization={quantization} hnsw_m={hnsw_m} ef_construct={hnsw_ef_construct} vectors_on_disk={vectors_on_disk} on_disk_payload={on_disk_payload}"
+        )
+        qdrant_client.create_collection(
+            collection_name=collection_name,
+            vectors_config=qmodels.VectorParams(
+                size=dimensions,
+                distance=qmodels.Distance.COSINE,
+                on_disk=vectors_on_disk,
+            ),
+            sparse_vectors_config=(
+                {
+                    sparse_vector_name: qmodels.SparseVectorParams(
+                        modifier=qmodels.Modifier.IDF
+                    )
+                }
+                if sparse_vector_name
+                else None
+            ),
+            hnsw_config=hnsw_config,
+            quantization_config=quantization_config,
+            on_disk_payload=on_disk_payload,
+        )
+        created = True
+    else:
+        config = qdrant_client.get_collection(collection_name).config
+        vectors = config.params.vectors
+        if isinstance(vectors, dict):
+            vectors = vectors.get("")
+        if vectors is None:
+            raise ValueError(
+                f"Collection {collection_name} has no unnamed dense vector"
+            )
+        if vectors.size != dimensions or vectors.distance != qmodels.Distance.COSINE:
+            raise ValueError(
+                f"Collection {collection_name} has size={vectors.size} distance={vectors.distance}, expected size={dimensions} distance=Cosine"
+            )
+
+        drift = (
+            config.hnsw_config.m != hnsw_m
+            or config.hnsw_config.ef_construct != hnsw_ef_construct
+            or config.quantization_config != quantization_config
+            or bool(vectors.on_disk) != vectors_on_disk
+            or bool(config.params.on_disk_payload) != on_disk_payload
+        )
+        if drift:
+            logger.info(
+                f"Updating Qdrant collection {collection_name} to quantization={quantization} hnsw_m={hnsw_m} ef_construct={hnsw_ef_construct} vectors_on_disk={vectors_on_disk} on_disk_payload={on_disk_payload}"
+            )
+            qdrant_client.update_collection(
+                collection_name=collection_name,
+                vectors_config={"": qmodels.VectorParamsDiff(on_disk=vectors_on_disk)},
+                hnsw_config=hnsw_config,
+                quantization_config=(quantization_config or qmodels.Disabled.DISABLED),
+                collection_params=qmodels.CollectionParamsDiff(
+                    on_disk_payload=on_disk_payload
+                ),
+            )
+            updated = True
+
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+            wait=True,
+        )
+
+    return {"created": created, "updated": updated}
@@ -0,0 +1,188 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+}
+TRANSIENT_ERROR_CODES = {
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    return False
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(
+        error, (ConnectionClosedError, EndpointConnectionError, ReadTimeoutError)
+    ):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES
+    return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limiter for in-flight Bedrock calls.
+    The limit grows by ~1 per window of successful calls and halves on throttling,
+    never going above max_concurrency or below 1.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(
+                    float(self.max_concurrency), self.limit + 1.0 / max(1.0, self.limit)
+                )
+            self._cond.notify_all()
+
+
+class ConcurrentEmbedder:
+    """
+    Runs embed_fn over chunk texts with a bounded number of in-flight requests.
+    Results are yielded in input order, so callers can keep batching as before.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        max_concurrency: int,
+        max_attempts: int,
+        backoff_base_ms: int,
+        backoff_max_ms: int,
+    ) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be >= 1")
+
+        self.embed_fn = embed_fn
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency)
+
+        self.call_count = 0
+        self.throttle_count = 0
+        self.retry_count = 0
+        self._stats_lock = threading.Lock()
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        ceiling = min(self.backoff_max_ms, self.backoff_base_ms * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling) / 1000.0
+
+    def _embed_with_retry(self, text: str) -> List[float]:
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire()
+            throttled = False
+            try:
+                with self._stats_lock:
+                    self.call_count += 1
+                return self.embed_fn(text)
+            except Exception as error:
+                throttled = is_throttling_error(error)
+                retryable = throttled or is_transient_error(error)
+                if not retryable or attempt == self.max_attempts:
+                    raise
+                with self._stats_lock:
+                    self.retry_count += 1
+                    if throttled:
+                        self.throttle_count += 1
+                logger.warning(
+                    "Bedrock call failed (attempt %d/%d, throttled=%s): %s",
+                    attempt,
+                    self.max_attempts,
+                    throttled,
+                    error,
+                )
+            finally:
+                self.limiter.release(throttled=throttled)
+
+            time.sleep(self._backoff_seconds(attempt))
+
+        raise RuntimeError("unreachable")
+
+    def embed_ordered(
+        self, chunks: Iterable[Dict[str, Any]], return_exceptions: bool = False
+    ) -> Iterator[Tuple[Dict[str, Any], List[float] | BaseException]]:
+        """
+        With return_exceptions, a chunk whose embedding failed is yielded with the
+        exception instead of raising, so the caller can fail only its document.
+        """
+        # Keep a bounded window of submitted work so memory does not grow with input size
+        window = self.max_concurrency * 2
+        pending: Deque[Tuple[Dict[str, Any], Future]] = deque()
+
+        def result(future: Future) -> List[float] | BaseException:
+            if not return_exceptions:
+                return future.result()
+            try:
+                return future.result()
+            except Exception as error:
+                return error
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="embed"
+        ) as executor:
+            try:
+                for chunk in chunks:
+                    pending.append(
+                        (chunk, executor.submit(self._embed_with_retry, chunk["text"]))
+                    )
+                    if len(pending) >= window:
+                        head_chunk, head_future = pending.popleft()
+                        yield head_chunk, result(head_future)
+
+                while pending:
+                    head_chunk, head_future = pending.popleft()
+                    yield head_chunk, result(head_future)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bedrock_calls": self.call_count,
+            "bedrock_retries": self.retry_count,
+            "bedrock_throttles": self.throttle_count,
+            "final_concurrency_limit": int(self.limiter.limit),
+        }
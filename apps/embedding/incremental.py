@@ -0,0 +1,297 @@
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from qdrant_client.http import models as qmodels
+
+logger = logging.getLogger(__name__)
+
+SCROLL_PAGE_SIZE = 256
+MATCH_ANY_BATCH_SIZE = 256
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _scroll_all(
+    qdrant_client,
+    collection_name: str,
+    scroll_filter: qmodels.Filter,
+    with_payload: Any,
+    with_vectors: bool,
+) -> Iterable[qmodels.Record]:
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=with_vectors,
+        )
+        yield from points
+        if offset is None:
+            return
+
+
+def _embedding_signature(payload: Dict[str, Any]) -> Tuple[Any, Any, Any, Any]:
+    meta = payload.get("meta") or {}
+    return (
+        meta.get("embedding_model_id"),
+        meta.get("embedding_dimensions"),
+        meta.get("embedding_normalize"),
+        meta.get("sparse_model_id"),
+    )
+
+
+def fetch_existing_chunks(
+    qdrant_client, collection_name: str, doc_id: str
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Returns chunk_index -> {"id", "chunk_id", "content_hash", "signature"} for every
+    point of doc_id.
+    """
+    existing: Dict[int, Dict[str, Any]] = {}
+    records = _scroll_all(
+        qdrant_client,
+        collection_name,
+        scroll_filter=qmodels.Filter(
+            must=[
+                qmodels.FieldCondition(
+                    key="doc_id", match=qmodels.MatchValue(value=doc_id)
+                )
+            ]
+        ),
+        with_payload=["chunk_id", "chunk_index", "content_hash", "meta"],
+        with_vectors=False,
+    )
+    for record in records:
+        payload = record.payload or {}
+        chunk_index = payload.get("chunk_index")
+        if chunk_index is None:
+            continue
+        existing[int(chunk_index)] = {
+            "id": record.id,
+            "chunk_id": payload.get("chunk_id"),
+            "content_hash": payload.get("content_hash"),
+            "signature": _embedding_signature(payload),
+        }
+    return existing
+
+
+def fetch_reusable_vectors(
+    qdrant_client,
+    collection_name: str,
+    hashes: Iterable[str],
+    signature: Tuple[str, int, bool],
+) -> Dict[str, List[float]]:
+    """
+    Looks up dense vectors already stored for the given content hashes (from any
+    doc_id), embedded with the same model, dimensions and normalization.
+    """
+    model_id, dimensions, normalize = signature
+    unique_hashes = sorted(set(hashes))
+    vectors: Dict[str, List[float]] = {}
+
+    for start in range(0, len(unique_hashes), MATCH_ANY_BATCH_SIZE):
+        batch = unique_hashes[start : start + MATCH_ANY_BATCH_SIZE]
+        records = _scroll_all(
+            qdrant_client,
+            collection_name,
+            scroll_filter=qmodels.Filter(
+                must=[
+                    qmodels.FieldCondition(
+                        key="content_hash", match=qmodels.MatchAny(any=batch)
+                    ),
+                    qmodels.FieldCondition(
+                        key="meta.embedding_model_id",
+                        match=qmodels.MatchValue(value=model_id),
+                    ),
+                    qmodels.FieldCondition(
+                        key="meta.embedding_dimensions",
+                        match=qmodels.MatchValue(value=dimensions),
+                    ),
+                    qmodels.FieldCondition(
+                        key="meta.embedding_normalize",
+                        match=qmodels.MatchValue(value=normalize),
+                    ),
+                ]
+            ),
+            with_payload=["content_hash"],
+            with_vectors=True,
+        )
+        for record in records:
+            chunk_hash = (record.payload or {}).get("content_hash")
+            vector = record.vector
+            if isinstance(vector, dict):
+                vector = vector.get("")
+            if chunk_hash and isinstance(vector, list):
+                vectors.setdefault(chunk_hash, vector)
+
+    return vectors
+
+
+def is_unchanged(
+    chunk: Dict[str, Any],
+    existing: Dict[int, Dict[str, Any]],
+    signature: Tuple[str, int, bool, str | None],
+) -> bool:
+    """
+    A chunk is unchanged when its text and its (model, dimensions, normalize,
+    sparse model) signature match the stored point with the same chunk_index.
+    """
+    current = existing.get(int(chunk["chunk_index"]))
+    return (
+        current is not None
+        and current["content_hash"] == content_hash(chunk["text"])
+        and current["signature"] == signature
+    )
+
+
+def find_stale(
+    existing: Dict[int, Dict[str, Any]], seen_chunk_indexes: Set[int]
+) -> List[Dict[str, Any]]:
+    """
+    Returns the existing entries (see fetch_existing_chunks) whose chunk_index no
+    longer exists in the document.
+    """
+    return [
+        current
+        for chunk_index, current in existing.items()
+        if chunk_index not in seen_chunk_indexes
+    ]
+
+
+def delete_points(qdrant_client, collection_name: str, point_ids: List[Any]) -> None:
+    if not point_ids:
+        return
+
+    qdrant_client.delete(
+        collection_name=collection_name,
+        points_selector=qmodels.PointIdsList(points=point_ids),
+        wait=True,
+    )
+
+
+def find_superseded_doc_ids(
+    qdrant_client,
+    collection_name: str,
+    doc_id: str,
+    source_s3_uri: str | None,
+    extracted_at_utc: str | None,
+) -> List[str]:
+    """
+    Returns the other doc_ids stored for the same source: doc_id is the hash of the
+    PDF bytes, so an edited PDF at the same S3 key is a new document. Versions
+    extracted after this one are kept (an older run finishing late).
+    """
+    if not source_s3_uri:
+        return []
+    records = _scroll_all(
+        qdrant_client,
+        collection_name,
+        scroll_filter=qmodels.Filter(
+            must=[
+                qmodels.FieldCondition(
+                    key="meta.source_s3_uri",
+                    match=qmodels.MatchValue(value=source_s3_uri),
+                )
+            ],
+            must_not=[
+                qmodels.FieldCondition(
+                    key="doc_id", match=qmodels.MatchValue(value=doc_id)
+                )
+            ],
+        ),
+        with_payload=["doc_id", "meta"],
+        with_vectors=False,
+    )
+    superseded: Set[str] = set()
+    for record in records:
+        payload = record.payload or {}
+        other_extracted_at = (payload.get("meta") or {}).get("extracted_at_utc")
+        if (
+            extracted_at_utc
+            and other_extracted_at
+            and other_extracted_at > extracted_at_utc
+        ):
+            continue
+        if payload.get("doc_id"):
+            superseded.add(payload["doc_id"])
+    return sorted(superseded)
+
+
+def delete_documents(qdrant_client, collection_name: str, doc_ids: List[str]) -> None:
+    if not doc_ids:
+        return
+
+    qdrant_client.delete(
+        collection_name=collection_name,
+        points_selector=qmodels.FilterSelector(
+            filter=qmodels.Filter(
+                must=[
+                    qmodels.FieldCondition(
+                        key="doc_id", match=qmodels.MatchAny(any=doc_ids)
+                    )
+                ]
+            )
+        ),
+        wait=True,
+    )
+
+
+def invalidate_answer_cache(
+    qdrant_client,
+    collection_name: str,
+    doc_id: str,
+    chunk_ids: List[str] | None,
+    superseded_doc_ids: List[str] | None = None,
+    source_s3_uri: str | None = None,
+) -> None:
+    """
+    Deletes the API's cached answers built from the given chunks. When chunk_ids is
+    None (changed chunks are unknown), every answer using doc_id is deleted. When
+    the source replaced earlier doc_ids, every answer using them or citing the
+    source is deleted too.
+    """
+    conditions: List[qmodels.Condition] = []
+    if chunk_ids is None:
+        conditions.append(
+            qmodels.FieldCondition(
+                key="doc_ids", match=qmodels.MatchValue(value=doc_id)
+            )
+        )
+    elif chunk_ids:
+        conditions.append(
+            qmodels.FieldCondition(
+                key="chunk_ids", match=qmodels.MatchAny(any=sorted(set(chunk_ids)))
+            )
+        )
+    if superseded_doc_ids:
+        conditions.append(
+            qmodels.FieldCondition(
+                key="doc_ids", match=qmodels.MatchAny(any=superseded_doc_ids)
+            )
+        )
+        if source_s3_uri:
+            conditions.append(
+                qmodels.FieldCondition(
+                    key="source_s3_uris",
+                    match=qmodels.MatchValue(value=source_s3_uri),
+                )
+            )
+    if not conditions:
+        return
+    if not qdrant_client.collection_exists(collection_name):
+        return
+
+    # Any of the conditions: an answer is stale if it used one of them
+    qdrant_client.delete(
+        collection_name=collection_name,
+        points_selector=qmodels.FilterSelector(
+            filter=qmodels.Filter(should=conditions)
+        ),
+        wait=True,
+    )
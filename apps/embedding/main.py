@@ -1,19 +1,44 @@
 import json
 import logging
 import os
-import time
 from datetime import datetime, timezone
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 from uuid import NAMESPACE_URL, uuid5
 
-import boto3
+from collection import ensure_collection
 from dotenv import load_dotenv
+from embedder import ConcurrentEmbedder
+from incremental import (
+    MATCH_ANY_BATCH_SIZE,
+    content_hash,
+    delete_documents,
+    delete_points,
+    fetch_existing_chunks,
+    fetch_reusable_vectors,
+    find_stale,
+    find_superseded_doc_ids,
+    invalidate_answer_cache,
+    is_unchanged,
+)
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qmodels
 from secret import get_api_key
+from snapshot import load_pointer, publish_snapshot, split_snapshot_uri
+from sparse import SPARSE_MODEL_ID, bm25_document_vector
+from utils.batch import batch_response, failure_record, parse_s3_uris
+from utils.clients import aws_client_config
 from utils.env_vars import validate_required_env
-from utils.s3 import download_s3_object, parse_s3_uri
+from utils.manifest import (
+    load_manifest,
+    object_etag,
+    stage_fingerprint,
+    write_manifest,
+)
+from utils.s3 import iter_s3_object_lines, parse_s3_uri
+from utils.startup import Lazy, lazy_import, report_startup, startup
+from writer import QdrantBatchWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,52 +48,180 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-TMP_DIR = Path("/tmp")
-INPUT_CHUNKS_PATH = TMP_DIR / "chunks.jsonl"
-
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-bedrock_runtime = boto3.client("bedrock-runtime", region_name=AWS_REGION)
-s3_client = boto3.client("s3")
-secrets_manager_client = boto3.client("secretsmanager", region_name=AWS_REGION)
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+EMBEDDING_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_MAX_ATTEMPTS", "8"))
+EMBEDDING_BACKOFF_BASE_MS = int(os.getenv("EMBEDDING_BACKOFF_BASE_MS", "200"))
+EMBEDDING_BACKOFF_MAX_MS = int(os.getenv("EMBEDDING_BACKOFF_MAX_MS", "20000"))
+BEDROCK_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("BEDROCK_CONNECT_TIMEOUT_SECONDS", "2")
+)
+BEDROCK_READ_TIMEOUT_SECONDS = float(os.getenv("BEDROCK_READ_TIMEOUT_SECONDS", "30"))
+
+# Clients are built on first use and kept for the warm container
+boto3 = lazy_import("boto3")
+# Throttling is retried by ConcurrentEmbedder (so it can shrink concurrency),
+# not silently by the SDK.
+bedrock_runtime = Lazy(
+    "client bedrock-runtime",
+    lambda: boto3.client(
+        "bedrock-runtime",
+        region_name=AWS_REGION,
+        config=aws_client_config(
+            max_pool_connections=max(10, EMBEDDING_MAX_CONCURRENCY),
+            connect_timeout=BEDROCK_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=BEDROCK_READ_TIMEOUT_SECONDS,
+            retry_mode="standard",
+            max_attempts=1,
+        ),
+    ),
+)
+s3_client = Lazy("client s3", lambda: boto3.client("s3", config=aws_client_config()))
+secrets_manager_client = Lazy(
+    "client secretsmanager",
+    lambda: boto3.client("secretsmanager", region_name=AWS_REGION),
+)
 
 EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
 EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))
 EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "true").lower() == "true"
-SLEEP_BETWEEN_CALLS_MS = int(os.getenv("SLEEP_BETWEEN_CALLS_MS", "0"))
 QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = get_api_key(secrets_manager_client, os.getenv("QDRANT_API_KEY"))
+# gRPC (port 6334 in apps/docker-compose.yaml) for upserts, counts and queries
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT_SECONDS = int(os.getenv("QDRANT_TIMEOUT_SECONDS", "30"))
+# Secret value (or plain key) cached for SECRET_CACHE_TTL_SECONDS across invocations
+SECRET_CACHE_TTL_SECONDS = float(os.getenv("SECRET_CACHE_TTL_SECONDS", "300"))
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION")
 QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "64"))
+QDRANT_FLUSH_INTERVAL_MS = int(os.getenv("QDRANT_FLUSH_INTERVAL_MS", "1000"))
+QDRANT_WRITE_QUEUE_SIZE = int(os.getenv("QDRANT_WRITE_QUEUE_SIZE", "256"))
 QDRANT_SSL_VERIFY = os.getenv("QDRANT_SSL_VERIFY", "true").lower() == "true"
+QDRANT_ANSWER_CACHE_COLLECTION = os.getenv("QDRANT_ANSWER_CACHE_COLLECTION")
+INCREMENTAL_INGESTION = os.getenv("INCREMENTAL_INGESTION", "true").lower() == "true"
+EMBEDDING_SIGNATURE = (EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS, EMBEDDING_NORMALIZE)
+SPARSE_VECTORS_ENABLED = os.getenv("SPARSE_VECTORS_ENABLED", "true").lower() == "true"
+SPARSE_VECTOR_NAME = os.getenv("SPARSE_VECTOR_NAME", "bm25")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_AVG_DOC_LEN = float(os.getenv("BM25_AVG_DOC_LEN", "150"))
+QDRANT_BOOTSTRAP_COLLECTION = (
+    os.getenv("QDRANT_BOOTSTRAP_COLLECTION", "true").lower() == "true"
+)
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "scalar").lower()
+QDRANT_QUANTIZATION_ALWAYS_RAM = (
+    os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() == "true"
+)
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "true").lower() == "true"
+QDRANT_ON_DISK_PAYLOAD = os.getenv("QDRANT_ON_DISK_PAYLOAD", "true").lower() == "true"
+# Skip embedding when a completed manifest exists for the same chunks and config
+STAGE_MANIFESTS = os.getenv("STAGE_MANIFESTS", "true").lower() == "true"
+# s3://bucket/prefix where the collection is exported for the API's local
+# retrieval backend after each run that changed it. Unset disables the export
+VECTOR_SNAPSHOT_S3_URI = os.getenv("VECTOR_SNAPSHOT_S3_URI")
+STAGE = "embedding"
 
 if EMBEDDING_DIMENSIONS not in (1024, 512, 256):
     raise ValueError("EMBEDDING_DIMENSIONS must be one of 1024, 512, 256")
 if QDRANT_UPSERT_BATCH_SIZE < 1:
     raise ValueError("QDRANT_UPSERT_BATCH_SIZE must be >= 1")
+if QDRANT_WRITE_QUEUE_SIZE < 1:
+    raise ValueError("QDRANT_WRITE_QUEUE_SIZE must be >= 1")
+if EMBEDDING_MAX_CONCURRENCY < 1:
+    raise ValueError("EMBEDDING_MAX_CONCURRENCY must be >= 1")
+if EMBEDDING_MAX_ATTEMPTS < 1:
+    raise ValueError("EMBEDDING_MAX_ATTEMPTS must be >= 1")
+if QDRANT_QUANTIZATION not in ("none", "scalar", "binary"):
+    raise ValueError("QDRANT_QUANTIZATION must be one of none, scalar, binary")
+
+
+def qdrant_api_key() -> str:
+    return get_api_key(
+        secrets_manager_client,
+        os.getenv("QDRANT_API_KEY"),
+        ttl_seconds=SECRET_CACHE_TTL_SECONDS,
+    )
 
-qdrant_client = QdrantClient(
-    url=QDRANT_URL, api_key=QDRANT_API_KEY, verify=bool(QDRANT_SSL_VERIFY)
-)
 
+def build_qdrant_client() -> QdrantClient:
+    global qdrant_client_api_key
+    with startup.measure("secret QDRANT_API_KEY"):
+        qdrant_client_api_key = qdrant_api_key()
+    return QdrantClient(
+        url=QDRANT_URL,
+        api_key=qdrant_client_api_key,
+        verify=bool(QDRANT_SSL_VERIFY),
+        timeout=QDRANT_TIMEOUT_SECONDS,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        grpc_options={
+            "grpc.keepalive_time_ms": 30_000,
+            "grpc.keepalive_permit_without_calls": 1,
+        },
+    )
 
-def read_jsonl(path: Path) -> List[Dict[str, Any]]:
-    records: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line_no, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rec = json.loads(line)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSONL at line {line_no}: {e}") from e
 
-            if not isinstance(rec, dict):
+def refresh_qdrant_client() -> None:
+    # Once the cached secret expires it is fetched again: a rotated key means a
+    # new client. Skipped when the client was replaced (e.g. by the benchmark).
+    if isinstance(qdrant_client, Lazy) and qdrant_client.loaded:
+        if qdrant_api_key() != qdrant_client_api_key:
+            logger.info("Qdrant API key changed, recreating the client")
+            qdrant_client.reset()
+
+
+qdrant_client = Lazy("client qdrant", build_qdrant_client)
+qdrant_client_api_key: str | None = None
+# Set once the collection has been verified by this (warm) container
+collection_ready = False
+
+
+def iter_jsonl_records(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSONL at line {line_no}: {e}") from e
+
+        if not isinstance(rec, dict):
+            raise ValueError(
+                f"Expected JSON object at line {line_no}, got {type(rec).__name__}"
+            )
+        yield rec
+
+
+class ChunkStats:
+    """
+    Validates that every chunk belongs to doc_id and collects length stats while the
+    chunks stream through, so the input is only read once.
+    """
+
+    def __init__(self, doc_id: str) -> None:
+        self.doc_id = doc_id
+        self.count = 0
+        self.total_chars = 0
+        self.min_chars = 0
+        self.max_chars = 0
+        self.seen_chunk_indexes: set[int] = set()
+
+    def track(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for chunk in chunks:
+            if chunk["doc_id"] != self.doc_id:
                 raise ValueError(
-                    f"Expected JSON object at line {line_no}, got {type(rec).__name__}"
+                    f"Expected one doc_id in input, got: {sorted({self.doc_id, chunk['doc_id']})}"
                 )
-            records.append(rec)
-    return records
+            length = len(chunk["text"])
+            self.min_chars = length if self.count == 0 else min(self.min_chars, length)
+            self.max_chars = max(self.max_chars, length)
+            self.total_chars += length
+            self.count += 1
+            self.seen_chunk_indexes.add(int(chunk["chunk_index"]))
+            yield chunk
 
 
 def invoke_embedding_model(text: str) -> List[float]:
@@ -105,8 +258,35 @@ def qdrant_point_id_from_chunk_id(chunk_id: str) -> str:
     return str(uuid5(NAMESPACE_URL, chunk_id))
 
 
+def collection_has_sparse_vector(name: str) -> bool:
+    info = qdrant_client.get_collection(QDRANT_COLLECTION)
+    sparse_vectors = info.config.params.sparse_vectors or {}
+    return name in sparse_vectors
+
+
+def bootstrap_collection() -> None:
+    global collection_ready
+    if collection_ready or not QDRANT_BOOTSTRAP_COLLECTION:
+        return
+
+    result = ensure_collection(
+        qdrant_client,
+        QDRANT_COLLECTION,
+        dimensions=EMBEDDING_DIMENSIONS,
+        sparse_vector_name=SPARSE_VECTOR_NAME if SPARSE_VECTORS_ENABLED else None,
+        quantization=QDRANT_QUANTIZATION,
+        quantization_always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM,
+        hnsw_m=QDRANT_HNSW_M,
+        hnsw_ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+        vectors_on_disk=QDRANT_VECTORS_ON_DISK,
+        on_disk_payload=QDRANT_ON_DISK_PAYLOAD,
+    )
+    logger.info(f"Qdrant collection {QDRANT_COLLECTION} ready {result}")
+    collection_ready = True
+
+
 def build_qdrant_point(
-    chunk: Dict[str, Any], embedding: List[float]
+    chunk: Dict[str, Any], embedding: List[float], with_sparse: bool = False
 ) -> qmodels.PointStruct:
     chunk_meta = chunk.get("meta")
     if chunk_meta is None:
@@ -121,6 +301,7 @@ def build_qdrant_point(
         "doc_id": chunk["doc_id"],
         "chunk_index": chunk["chunk_index"],
         "text": chunk["text"],
+        "content_hash": content_hash(chunk["text"]),
         "meta": {
             **chunk_meta,
             "embedding_model_id": EMBEDDING_MODEL_ID,
@@ -130,9 +311,22 @@ def build_qdrant_point(
         },
     }
 
+    vector: Any = embedding
+    if with_sparse:
+        # Dense stays the unnamed default vector, BM25 term weights go to a named
+        # sparse vector so retrieval can fuse both in one query
+        indices, values = bm25_document_vector(
+            chunk["text"], k1=BM25_K1, b=BM25_B, avg_doc_len=BM25_AVG_DOC_LEN
+        )
+        payload["meta"]["sparse_model_id"] = SPARSE_MODEL_ID
+        vector = {
+            "": embedding,
+            SPARSE_VECTOR_NAME: qmodels.SparseVector(indices=indices, values=values),
+        }
+
     return qmodels.PointStruct(
         id=qdrant_point_id_from_chunk_id(chunk["chunk_id"]),
-        vector=embedding,
+        vector=vector,
         payload=payload,
     )
 
@@ -148,80 +342,477 @@ def upsert_points(points: List[qmodels.PointStruct]) -> None:
     )
 
 
-def process_chunks_from_s3(s3_uri: str) -> Dict[str, Any]:
-    in_bucket, in_key = parse_s3_uri(s3_uri)
-
-    if not in_key.endswith("/chunks.jsonl"):
-        raise ValueError(f"Expected chunks/<doc_id>/chunks.jsonl, got: {in_key}")
-
-    download_s3_object(s3_client, in_bucket, in_key, INPUT_CHUNKS_PATH)
+def _pair_with_stored_vectors(
+    batch: List[Dict[str, Any]],
+) -> Iterator[Tuple[Dict[str, Any], List[float] | None]]:
+    hashes = [content_hash(chunk["text"]) for chunk in batch]
+    vectors = fetch_reusable_vectors(
+        qdrant_client, QDRANT_COLLECTION, hashes, EMBEDDING_SIGNATURE
+    )
+    for chunk, chunk_hash in zip(batch, hashes):
+        yield chunk, vectors.get(chunk_hash)
+
+
+def with_reusable_vectors(
+    chunks: Iterable[Dict[str, Any]],
+) -> Iterator[Tuple[Dict[str, Any], List[float] | None]]:
+    """
+    Pairs each chunk with the dense vector already stored for an identical text
+    (under any doc_id, see fetch_reusable_vectors), or None. Lookups are batched,
+    starting small so the first Bedrock call is not delayed by a large read-ahead.
+    """
+    batch_size = 16
+    batch: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield from _pair_with_stored_vectors(batch)
+            batch = []
+            batch_size = min(batch_size * 2, MATCH_ANY_BATCH_SIZE)
+    yield from _pair_with_stored_vectors(batch)
 
-    chunks = read_jsonl(INPUT_CHUNKS_PATH)
-    if not chunks:
-        raise RuntimeError("Input chunks.jsonl is empty")
 
-    doc_ids = {rec["doc_id"] for rec in chunks}
-    if len(doc_ids) != 1:
-        raise ValueError(f"Expected one doc_id in input, got: {sorted(doc_ids)}")
-    doc_id = next(iter(doc_ids))
+def stage_config(chunks_etag: str) -> Dict[str, Any]:
+    # The chunks ETag changes whenever chunking rewrites chunks.jsonl
+    return {
+        "chunks_etag": chunks_etag,
+        "qdrant_collection": QDRANT_COLLECTION,
+        "embedding_model_id": EMBEDDING_MODEL_ID,
+        "embedding_dimensions": EMBEDDING_DIMENSIONS,
+        "embedding_normalize": EMBEDDING_NORMALIZE,
+        "sparse": (
+            [SPARSE_MODEL_ID, SPARSE_VECTOR_NAME, BM25_K1, BM25_B, BM25_AVG_DOC_LEN]
+            if SPARSE_VECTORS_ENABLED
+            else None
+        ),
+    }
 
-    logger.info(
-        f"Embedding+Upsert doc_id={doc_id} chunk_count={len(chunks)} model={EMBEDDING_MODEL_ID} dims={EMBEDDING_DIMENSIONS} normalize={EMBEDDING_NORMALIZE} qdrant_collection={QDRANT_COLLECTION}"
-    )
 
-    text_lengths = [len(r["text"]) for r in chunks]
+def count_doc_points(doc_id: str) -> int:
+    return qdrant_client.count(
+        collection_name=QDRANT_COLLECTION,
+        count_filter=qmodels.Filter(
+            must=[
+                qmodels.FieldCondition(
+                    key="doc_id", match=qmodels.MatchValue(value=doc_id)
+                )
+            ]
+        ),
+        exact=True,
+    ).count
+
+
+def completed_result(
+    bucket: str, doc_id: str, fingerprint: str
+) -> Dict[str, Any] | None:
+    manifest = load_manifest(s3_client, bucket, doc_id, STAGE, fingerprint)
+    if not manifest:
+        return None
+    # The points live outside S3: the manifest only counts if they are still there
+    # (e.g. the collection was not recreated since)
+    expected = manifest["result"]["chunk_count"]
+    if not qdrant_client.collection_exists(QDRANT_COLLECTION):
+        return None
+    stored = count_doc_points(doc_id)
+    if stored != expected:
+        logger.info(
+            f"Manifest for doc_id={doc_id} expects {expected} points, collection has {stored}"
+        )
+        return None
     logger.info(
-        f"Input chunk lengths (chars): min={min(text_lengths)} avg={sum(text_lengths) // len(text_lengths)} max={max(text_lengths)}",
+        f"doc_id={doc_id} already embedded at {manifest['completed_at_utc']}, skipping"
     )
+    return {**manifest["result"], "from_manifest": True}
+
+
+class DocumentRun:
+    """
+    One chunks.jsonl of a batch. Its chunks stream through the embedder and writer
+    shared by the batch, and it keeps the per-document counts. A failure (bad input,
+    Bedrock error) is recorded on the run and only fails this document.
+
+    records can hold chunk records produced in memory (see apps/pipeline): s3_uri
+    then only names the source, and no manifest is read or written.
+    """
+
+    def __init__(
+        self,
+        s3_uri: str,
+        force: bool = False,
+        records: Iterable[Dict[str, Any]] | None = None,
+    ) -> None:
+        self.s3_uri = s3_uri
+        self.force = force
+        self.records = records
+        self.bucket = ""
+        self.doc_id = ""
+        self.source_s3_uri: str | None = None
+        self.extracted_at_utc: str | None = None
+        self.config: Dict[str, Any] = {}
+        self.fingerprint = ""
+        self.chunk_stats: ChunkStats | None = None
+        self.existing: Dict[int, Dict[str, Any]] = {}
+        self.counts = {"skipped": 0, "reused": 0, "embedded": 0}
+        self.changed_chunk_ids: List[str] = []
+        self.result: Dict[str, Any] | None = None
+        self.error: BaseException | None = None
+
+    @property
+    def pending(self) -> bool:
+        return self.result is None and self.error is None
+
+    def fail(self, error: BaseException) -> None:
+        if self.error is None:
+            logger.error(f"Could not embed {self.s3_uri}: {error!r}")
+            self.error = error
+
+    def open(self) -> Iterator[Dict[str, Any]]:
+        """
+        Returns the chunks of the document, or nothing if a completed manifest
+        already covers it (self.result is then set).
+        """
+        if self.records is not None:
+            # Drop the reference so records are freed once embedded
+            records, self.records = iter(self.records), None
+            return self._open_records(records)
+
+        self.bucket, key = parse_s3_uri(self.s3_uri)
+        if not key.endswith("/chunks.jsonl"):
+            raise ValueError(f"Expected chunks/<doc_id>/chunks.jsonl, got: {key}")
+
+        if STAGE_MANIFESTS:
+            self.config = stage_config(object_etag(s3_client, self.bucket, key))
+            self.fingerprint = stage_fingerprint(self.config)
+            if not self.force:
+                self.result = completed_result(
+                    self.bucket, Path(key).parent.name, self.fingerprint
+                )
+                if self.result:
+                    return iter(())
 
-    # Process sequentially for embeddings, batch only for Qdrant upsert
-    pending_points: List[qmodels.PointStruct] = []
-    upserted_count = 0
-
-    for chunk in chunks:
-        embedding = invoke_embedding_model(chunk["text"])
-        point = build_qdrant_point(chunk, embedding)
-        pending_points.append(point)
+        # Chunks are parsed as the object body streams in and flow through the
+        # pipeline one by one: memory does not grow with the document size
+        return self._open_records(
+            iter_jsonl_records(iter_s3_object_lines(s3_client, self.bucket, key))
+        )
 
-        if len(pending_points) >= QDRANT_UPSERT_BATCH_SIZE:
-            upsert_points(pending_points)
-            upserted_count += len(pending_points)
-            logger.info(f"Upserted {upserted_count}/{len(chunks)} points to Qdrant")
-            pending_points = []
+    def _open_records(
+        self, records: Iterator[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        first = next(records, None)
+        if first is None:
+            raise RuntimeError("Input chunks.jsonl is empty")
+        self.doc_id = first["doc_id"]
+        first_meta = first.get("meta") or {}
+        self.source_s3_uri = first_meta.get("source_s3_uri")
+        self.extracted_at_utc = first_meta.get("extracted_at_utc")
+        self.chunk_stats = ChunkStats(self.doc_id)
+
+        logger.info(
+            f"Embedding+Upsert doc_id={self.doc_id} model={EMBEDDING_MODEL_ID} dims={EMBEDDING_DIMENSIONS} normalize={EMBEDDING_NORMALIZE} qdrant_collection={QDRANT_COLLECTION}"
+        )
+        if INCREMENTAL_INGESTION:
+            self.existing = fetch_existing_chunks(
+                qdrant_client, QDRANT_COLLECTION, self.doc_id
+            )
+        return self.chunk_stats.track(chain([first], records))
+
+    def changed_chunks(
+        self, chunks: Iterable[Dict[str, Any]], point_signature: Tuple
+    ) -> Iterator[Dict[str, Any]]:
+        # Only chunks that are new or changed (text, model or dimensions) need work
+        for chunk in chunks:
+            if is_unchanged(chunk, self.existing, point_signature):
+                self.counts["skipped"] += 1
+                continue
+            self.changed_chunk_ids.append(chunk["chunk_id"])
+            yield chunk
+
+    def chunks_to_embed(
+        self, writer: QdrantBatchWriter, with_sparse: bool, point_signature: Tuple
+    ) -> Iterator[Dict[str, Any]]:
+        changed = self.changed_chunks(self.open(), point_signature)
+        if not INCREMENTAL_INGESTION:
+            yield from changed
+            return
+        # A re-uploaded PDF gets a new doc_id, so also reuse vectors of identical
+        # chunk texts stored under any doc_id. Those go straight to the writer.
+        for chunk, vector in with_reusable_vectors(changed):
+            if vector is None:
+                yield chunk
+            else:
+                self.counts["reused"] += 1
+                writer.put(build_qdrant_point(chunk, vector, with_sparse))
+
+    def finish(self, with_sparse: bool) -> None:
+        # Runs after the writer's durability barrier: the points of this document
+        # are in Qdrant, so stale points can go and the manifest can be written
+        chunk_stats = self.chunk_stats
+        logger.info(
+            f"Input chunk lengths doc_id={self.doc_id} (chars): min={chunk_stats.min_chars} avg={chunk_stats.total_chars // chunk_stats.count} max={chunk_stats.max_chars}",
+        )
 
-        if SLEEP_BETWEEN_CALLS_MS > 0:
-            time.sleep(SLEEP_BETWEEN_CALLS_MS / 1000.0)
+        stale: List[Dict[str, Any]] = []
+        if INCREMENTAL_INGESTION:
+            stale = find_stale(self.existing, chunk_stats.seen_chunk_indexes)
+            logger.info(
+                f"Incremental update doc_id={self.doc_id} existing={len(self.existing)} unchanged={self.counts['skipped']} embedded={self.counts['embedded']} reused={self.counts['reused']} stale={len(stale)}"
+            )
+        delete_points(qdrant_client, QDRANT_COLLECTION, [p["id"] for p in stale])
+
+        # An edited PDF at the same S3 key has a new doc_id: the points of the
+        # versions it replaces are removed
+        superseded = find_superseded_doc_ids(
+            qdrant_client,
+            QDRANT_COLLECTION,
+            self.doc_id,
+            self.source_s3_uri,
+            self.extracted_at_utc,
+        )
+        if superseded:
+            logger.info(
+                f"doc_id={self.doc_id} replaces doc_ids={superseded} of {self.source_s3_uri}"
+            )
+            delete_documents(qdrant_client, QDRANT_COLLECTION, superseded)
+
+        if QDRANT_ANSWER_CACHE_COLLECTION:
+            # Cached API answers built from re-embedded or removed chunks are now stale
+            invalidated_chunk_ids = None
+            if INCREMENTAL_INGESTION:
+                invalidated_chunk_ids = self.changed_chunk_ids + [
+                    p["chunk_id"] for p in stale if p["chunk_id"]
+                ]
+            invalidate_answer_cache(
+                qdrant_client,
+                QDRANT_ANSWER_CACHE_COLLECTION,
+                self.doc_id,
+                invalidated_chunk_ids,
+                superseded_doc_ids=superseded,
+                source_s3_uri=self.source_s3_uri,
+            )
+
+        result = {
+            "doc_id": self.doc_id,
+            "input_chunks_s3_uri": self.s3_uri,
+            "qdrant_collection": QDRANT_COLLECTION,
+            "chunk_count": chunk_stats.count,
+            "embedding_count": self.counts["embedded"] + self.counts["reused"],
+            "skipped_count": self.counts["skipped"],
+            "embedded_count": self.counts["embedded"],
+            "reused_count": self.counts["reused"],
+            "deleted_count": len(stale),
+            "superseded_doc_ids": superseded,
+            "embedding_model_id": EMBEDDING_MODEL_ID,
+            "embedding_dimensions": EMBEDDING_DIMENSIONS,
+            "embedding_normalize": EMBEDDING_NORMALIZE,
+            "sparse_vector": SPARSE_VECTOR_NAME if with_sparse else None,
+        }
+        if STAGE_MANIFESTS and self.fingerprint:
+            write_manifest(
+                s3_client,
+                self.bucket,
+                self.doc_id,
+                STAGE,
+                self.fingerprint,
+                self.config,
+                result,
+            )
+        self.result = result
+
+
+def process_chunks_batch(
+    s3_uris: List[str], force: bool = False
+) -> Tuple[List[DocumentRun], Dict[str, Any]]:
+    """
+    Embeds several chunks.jsonl in one pass: the Bedrock calls of consecutive
+    documents share the same concurrency window and their points are upserted in
+    shared batches, so small documents do not each pay for a ramp-up and a flush.
+    """
+    return embed_documents([DocumentRun(s3_uri, force) for s3_uri in s3_uris])
+
+
+def embed_documents(
+    documents: Iterable[DocumentRun],
+) -> Tuple[List[DocumentRun], Dict[str, Any]]:
+    """
+    Embeds the documents as they are pulled from documents, which can be a lazy
+    iterator (e.g. fed by the extraction workers of apps/pipeline).
+    """
+    runs: List[DocumentRun] = []
+
+    bootstrap_collection()
+    with_sparse = SPARSE_VECTORS_ENABLED and collection_has_sparse_vector(
+        SPARSE_VECTOR_NAME
+    )
+    if SPARSE_VECTORS_ENABLED and not with_sparse:
+        logger.warning(
+            f"Collection {QDRANT_COLLECTION} has no sparse vector '{SPARSE_VECTOR_NAME}', upserting dense vectors only"
+        )
+    point_signature = EMBEDDING_SIGNATURE + (SPARSE_MODEL_ID if with_sparse else None,)
+
+    # Embeddings run concurrently but come back in chunk order, batch for Qdrant upsert
+    embedder = ConcurrentEmbedder(
+        embed_fn=invoke_embedding_model,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        max_attempts=EMBEDDING_MAX_ATTEMPTS,
+        backoff_base_ms=EMBEDDING_BACKOFF_BASE_MS,
+        backoff_max_ms=EMBEDDING_BACKOFF_MAX_MS,
+    )
+    # Embedding (producer) and Qdrant upserts (consumer) overlap through a bounded queue
+    writer = QdrantBatchWriter(
+        upsert_fn=upsert_points,
+        batch_size=QDRANT_UPSERT_BATCH_SIZE,
+        flush_interval_ms=QDRANT_FLUSH_INTERVAL_MS,
+        max_queue_size=QDRANT_WRITE_QUEUE_SIZE,
+    )
+    # Embedded chunks find their document back by doc_id
+    runs_by_doc_id: Dict[str, DocumentRun] = {}
 
-    if pending_points:
-        upsert_points(pending_points)
-        upserted_count += len(pending_points)
+    def chunks_to_embed() -> Iterator[Dict[str, Any]]:
+        # Documents are opened one after the other, only one S3 stream is open
+        for run in documents:
+            runs.append(run)
+            try:
+                for chunk in run.chunks_to_embed(writer, with_sparse, point_signature):
+                    runs_by_doc_id.setdefault(run.doc_id, run)
+                    if run.error is not None:
+                        # A chunk of this document failed to embed, skip the rest
+                        break
+                    yield chunk
+            except Exception as error:
+                # A dead writer fails the whole batch, see below
+                if writer.failed:
+                    raise
+                run.fail(error)
+
+    try:
+        with writer:
+            for chunk, embedding in embedder.embed_ordered(
+                chunks_to_embed(), return_exceptions=True
+            ):
+                run = runs_by_doc_id[chunk["doc_id"]]
+                if isinstance(embedding, BaseException):
+                    run.fail(embedding)
+                elif run.error is None:
+                    writer.put(build_qdrant_point(chunk, embedding, with_sparse))
+                    run.counts["embedded"] += 1
+    except Exception as error:
+        # The writer could not flush: no pending document is durably stored
+        for run in runs:
+            if run.pending:
+                run.fail(error)
+
+    for run in runs:
+        if run.pending:
+            try:
+                run.finish(with_sparse)
+            except Exception as error:
+                run.fail(error)
+
+    stats = {
+        "embedding_max_concurrency": EMBEDDING_MAX_CONCURRENCY,
+        "embedding_max_attempts": EMBEDDING_MAX_ATTEMPTS,
+        **embedder.stats(),
+        **writer.stats(),
+    }
+    logger.info(
+        f"Generated and upserted {writer.flushed_points} embeddings to Qdrant for {len(runs)} documents stats={stats}"
+    )
+    return runs, stats
+
+
+def publish_vector_snapshot(results: List[Dict[str, Any]]) -> str | None:
+    """
+    Exports the collection to VECTOR_SNAPSHOT_S3_URI when this run changed it, or
+    when the last snapshot is missing or does not hold as many points as the
+    collection (e.g. its publication failed). Returns the published version, or
+    None if there is none: a failure is logged, not raised.
+    """
+    if not VECTOR_SNAPSHOT_S3_URI:
+        return None
+    try:
+        return _publish_vector_snapshot(results)
+    except Exception as error:
+        # The points and manifests are stored: the ingestion result stands, and the
+        # next run publishes since the snapshot count no longer matches
+        logger.error(f"Could not publish vector snapshot: {error!r}")
+        return None
+
+
+def _publish_vector_snapshot(results: List[Dict[str, Any]]) -> str:
+    changed = any(
+        result["embedded_count"]
+        or result["reused_count"]
+        or result["deleted_count"]
+        or result.get("superseded_doc_ids")
+        for result in results
+        if not result.get("from_manifest")
+    )
+    if not changed:
+        bucket, prefix = split_snapshot_uri(VECTOR_SNAPSHOT_S3_URI)
+        pointer = load_pointer(s3_client, bucket, prefix)
+        total = qdrant_client.count(QDRANT_COLLECTION, exact=True).count
+        if pointer is not None and pointer["count"] == total:
+            logger.info(f"Vector snapshot {pointer['version']} is up to date")
+            return pointer["version"]
+
+    with_sparse = SPARSE_VECTORS_ENABLED and collection_has_sparse_vector(
+        SPARSE_VECTOR_NAME
+    )
+    pointer = publish_snapshot(
+        qdrant_client,
+        s3_client,
+        VECTOR_SNAPSHOT_S3_URI,
+        QDRANT_COLLECTION,
+        SPARSE_VECTOR_NAME if with_sparse else None,
+        {
+            "embedding_model_id": EMBEDDING_MODEL_ID,
+            "embedding_dimensions": EMBEDDING_DIMENSIONS,
+            "sparse_model_id": SPARSE_MODEL_ID if with_sparse else None,
+        },
+    )
+    return pointer["version"]
 
-    logger.info(f"Generated and upserted {upserted_count} embeddings to Qdrant")
 
-    return {
-        "doc_id": doc_id,
-        "input_chunks_s3_uri": s3_uri,
-        "qdrant_collection": QDRANT_COLLECTION,
-        "embedding_count": upserted_count,
-        "embedding_model_id": EMBEDDING_MODEL_ID,
-        "embedding_dimensions": EMBEDDING_DIMENSIONS,
-        "embedding_normalize": EMBEDDING_NORMALIZE,
-        "sdk_retry_mode": "standard",
-        "sdk_max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", "5")),
-    }
+def process_chunks_from_s3(s3_uri: str, force: bool = False) -> Dict[str, Any]:
+    [run], stats = process_chunks_batch([s3_uri], force)
+    if run.error is not None:
+        raise run.error
+    if run.result.get("from_manifest"):
+        return run.result
+    return {**run.result, **stats}
 
 
+@report_startup
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     logger.info("Input Event => %s", event)
     validate_required_env(["QDRANT_URL", "QDRANT_API_KEY", "QDRANT_COLLECTION"])
+    refresh_qdrant_client()
+    force = bool(event.get("force"))
+
+    if "s3_uris" in event:
+        runs, stats = process_chunks_batch(parse_s3_uris(event), force)
+        results = [run.result for run in runs if run.error is None]
+        return batch_response(
+            results,
+            [failure_record(run.s3_uri, run.error) for run in runs if run.error],
+            stats=stats,
+            vector_snapshot=publish_vector_snapshot(results),
+        )
 
     s3_uri = event.get("s3_uri")
     if not isinstance(s3_uri, str) or not s3_uri:
         raise ValueError("Expected event['s3_uri'] as a non-empty string")
 
-    result = process_chunks_from_s3(s3_uri)
-    return {"ok": True, "result": result}
+    result = process_chunks_from_s3(s3_uri, force=force)
+    return {
+        "ok": True,
+        "result": result,
+        "vector_snapshot": publish_vector_snapshot([result]),
+    }
+
 
+startup.init_done()
 
 if os.getenv("ENV", "").upper() == "DEVELOPMENT":
     event = {
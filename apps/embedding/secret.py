@@ -1,17 +1,31 @@
 import json
+import time
+from typing import Dict, Tuple
 
 from botocore.client import BaseClient
 from botocore.exceptions import ClientError
 
+# Secret values by name, with the time they were fetched. Module state survives
+# warm invocations, so Secrets Manager is only called again once ttl_seconds passed.
+_cache: Dict[str, Tuple[float, str]] = {}
 
-def get_api_key(secrets_manager_client: BaseClient, secret_name: str) -> str:
+
+def get_api_key(
+    secrets_manager_client: BaseClient, secret_name: str, ttl_seconds: float = 300.0
+) -> str:
     if not secret_name.startswith("arn:aws:secretsmanager"):
         return secret_name
 
+    cached = _cache.get(secret_name)
+    if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+        return cached[1]
+
     try:
         response = secrets_manager_client.get_secret_value(SecretId=secret_name)
     except ClientError as e:
         raise RuntimeError(f"Failed to retrieve secret '{secret_name}': {e}") from e
 
     secret_str = response["SecretString"]
-    return json.loads(secret_str)["api_key"]
+    api_key = json.loads(secret_str)["api_key"]
+    _cache[secret_name] = (time.monotonic(), api_key)
+    return api_key
@@ -0,0 +1,242 @@
+import json
+import logging
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+from qdrant_client.http import models as qmodels
+
+logger = logging.getLogger(__name__)
+
+# Files of one snapshot version, under <prefix>/<version>/
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.jsonl"
+SPARSE_FILE = "sparse.npz"
+POINTER_FILE = "latest.json"
+# Concurrent publishers (Step Functions fan-out) race on the pointer
+POINTER_WRITE_ATTEMPTS = 5
+# S3 answers a conditional write that lost the race with one of these
+CONFLICT_ERROR_CODES = ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def split_snapshot_uri(snapshot_uri: str) -> Tuple[str, str]:
+    if not snapshot_uri.startswith("s3://"):
+        raise ValueError(f"Expected s3://bucket/prefix, got: {snapshot_uri}")
+    bucket, _, prefix = snapshot_uri[len("s3://") :].partition("/")
+    return bucket, prefix.strip("/")
+
+
+def _split_vector(
+    vector: Any, sparse_vector_name: str | None
+) -> Tuple[List[float], qmodels.SparseVector | None]:
+    # Unnamed dense vector alone, or next to named (sparse) vectors
+    if isinstance(vector, dict):
+        sparse = vector.get(sparse_vector_name) if sparse_vector_name else None
+        return vector[""], sparse
+    return vector, None
+
+
+def export_collection(
+    qdrant_client, collection_name: str, sparse_vector_name: str | None
+) -> Dict[str, Any]:
+    """
+    Reads every point of the collection: dense vectors as one L2-normalized float32
+    matrix, payloads in the same row order and, if the collection has the sparse
+    vector, its term weights in CSR form (indptr, indices, values).
+    """
+    blocks: List[np.ndarray] = []
+    payloads: List[Dict[str, Any]] = []
+    indptr = [0]
+    indices: List[int] = []
+    values: List[float] = []
+    has_sparse = False
+    offset = None
+
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name,
+            limit=256,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        dense: List[List[float]] = []
+        for point in points:
+            vector, sparse = _split_vector(point.vector, sparse_vector_name)
+            dense.append(vector)
+            payloads.append(point.payload or {})
+            if sparse is not None:
+                has_sparse = True
+                indices.extend(sparse.indices)
+                values.extend(sparse.values)
+            indptr.append(len(indices))
+        if dense:
+            blocks.append(np.asarray(dense, dtype=np.float32))
+        if offset is None:
+            break
+
+    vectors = np.concatenate(blocks) if blocks else np.zeros((0, 0), np.float32)
+    if len(vectors):
+        # Cosine collections store normalized vectors, dot products are cosines
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+    sparse_arrays = None
+    if has_sparse:
+        sparse_arrays = {
+            "indptr": np.asarray(indptr, dtype=np.int64),
+            "indices": np.asarray(indices, dtype=np.uint32),
+            "values": np.asarray(values, dtype=np.float32),
+        }
+    return {"vectors": vectors, "payloads": payloads, "sparse": sparse_arrays}
+
+
+def read_pointer(
+    s3_client: BaseClient, bucket: str, prefix: str
+) -> Tuple[Dict[str, Any] | None, str | None]:
+    # The pointer and its ETag, for a conditional overwrite
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=f"{prefix}/{POINTER_FILE}")
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None, None
+        raise
+    return json.loads(response["Body"].read()), response["ETag"]
+
+
+def load_pointer(
+    s3_client: BaseClient, bucket: str, prefix: str
+) -> Dict[str, Any] | None:
+    return read_pointer(s3_client, bucket, prefix)[0]
+
+
+def write_pointer(
+    s3_client: BaseClient,
+    bucket: str,
+    prefix: str,
+    pointer: Dict[str, Any],
+    etag: str | None,
+) -> bool:
+    """
+    Writes the pointer only if it is still the one read (ETag), or still absent.
+    Returns False when another publisher wrote it in the meantime.
+    """
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=f"{prefix}/{POINTER_FILE}",
+            Body=json.dumps(pointer, indent=2).encode("utf-8"),
+            ContentType="application/json; charset=utf-8",
+            **condition,
+        )
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in CONFLICT_ERROR_CODES:
+            return False
+        raise
+    return True
+
+
+def list_versions(s3_client: BaseClient, bucket: str, prefix: str) -> List[str]:
+    versions: List[str] = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/", Delimiter="/"):
+        for common in page.get("CommonPrefixes", []):
+            versions.append(common["Prefix"][len(prefix) + 1 :].rstrip("/"))
+    return versions
+
+
+def _delete_version(
+    s3_client: BaseClient, bucket: str, prefix: str, version: str
+) -> None:
+    for name in (VECTORS_FILE, PAYLOADS_FILE, SPARSE_FILE):
+        try:
+            s3_client.delete_object(Bucket=bucket, Key=f"{prefix}/{version}/{name}")
+        except ClientError as error:
+            logger.warning(f"Could not delete snapshot {version}/{name}: {error}")
+
+
+def publish_snapshot(
+    qdrant_client,
+    s3_client: BaseClient,
+    snapshot_uri: str,
+    collection_name: str,
+    sparse_vector_name: str | None,
+    metadata: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Exports the collection to s3://bucket/prefix/<version>/ for the API's local
+    retrieval backend. The latest.json pointer is written last, so readers only
+    ever see complete versions, and only if it did not change since it was read:
+    with concurrent runs, the latest export wins and the others delete their
+    version. Every version older than the previous one is then deleted (the
+    previous one may still be downloading).
+    """
+    bucket, prefix = split_snapshot_uri(snapshot_uri)
+    exported = export_collection(qdrant_client, collection_name, sparse_vector_name)
+    vectors = exported["vectors"]
+    # Versions sort by export time, which decides between concurrent publishers
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        np.save(tmp_dir / VECTORS_FILE, vectors)
+        with (tmp_dir / PAYLOADS_FILE).open("w", encoding="utf-8") as f:
+            for payload in exported["payloads"]:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        files = [VECTORS_FILE, PAYLOADS_FILE]
+        if exported["sparse"] is not None:
+            np.savez(tmp_dir / SPARSE_FILE, **exported["sparse"])
+            files.append(SPARSE_FILE)
+        for name in files:
+            s3_client.upload_file(
+                str(tmp_dir / name), bucket, f"{prefix}/{version}/{name}"
+            )
+
+    metadata = {
+        "collection": collection_name,
+        "count": int(vectors.shape[0]),
+        "dimensions": int(vectors.shape[1]) if vectors.size else 0,
+        "files": files,
+        "sparse_vector": sparse_vector_name if exported["sparse"] else None,
+        **metadata,
+    }
+    for _ in range(POINTER_WRITE_ATTEMPTS):
+        previous, etag = read_pointer(s3_client, bucket, prefix)
+        if previous and previous["version"] > version:
+            # A concurrent run exported later than this one: its snapshot wins
+            logger.info(
+                f"Vector snapshot {previous['version']} is newer than {version}, discarding {version}"
+            )
+            _delete_version(s3_client, bucket, prefix, version)
+            return previous
+        pointer = {
+            "version": version,
+            "previous_version": previous["version"] if previous else None,
+            "created_at_utc": datetime.now(timezone.utc)
+            .isoformat()
+            .replace("+00:00", "Z"),
+            **metadata,
+        }
+        if write_pointer(s3_client, bucket, prefix, pointer, etag):
+            break
+        logger.info(f"Snapshot pointer changed while publishing {version}, retrying")
+    else:
+        _delete_version(s3_client, bucket, prefix, version)
+        raise RuntimeError(
+            f"Could not publish vector snapshot {version}: pointer kept changing"
+        )
+    logger.info(
+        f"Published vector snapshot {version} of {collection_name} to s3://{bucket}/{prefix} points={pointer['count']}"
+    )
+
+    # The previous version may still be downloading, anything older is unreferenced
+    # (including versions of runs that lost the race or failed before the pointer)
+    if pointer["previous_version"]:
+        for old_version in list_versions(s3_client, bucket, prefix):
+            if old_version < pointer["previous_version"]:
+                _delete_version(s3_client, bucket, prefix, old_version)
+    return pointer
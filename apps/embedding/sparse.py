@@ -0,0 +1,43 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Keep in sync with apps/api/services/sparse.py: documents and queries must be
+# tokenized and hashed the same way for the sparse vectors to match.
+SPARSE_MODEL_ID = "bm25-crc32-v1"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is "
+    "it its me my no not of on or our so than that the their then there these they "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def token_index(token: str) -> int:
+    # Sparse vector indices are uint32
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def bm25_document_vector(
+    text: str, k1: float = 1.2, b: float = 0.75, avg_doc_len: float = 150.0
+) -> Tuple[List[int], List[float]]:
+    """
+    BM25 term-frequency part of a chunk. The IDF part is applied by Qdrant at query
+    time (sparse vector configured with modifier=idf).
+    """
+    tokens = tokenize(text)
+    doc_len = len(tokens)
+    weights: Dict[int, float] = {}
+    for token, tf in Counter(tokens).items():
+        score = tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_doc_len))
+        index = token_index(token)
+        weights[index] = weights.get(index, 0.0) + score
+
+    indices = sorted(weights)
+    return indices, [weights[i] for i in indices]
@@ -0,0 +1,142 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from qdrant_client.http import models as qmodels
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class QdrantBatchWriter:
+    """
+    Drains points from a bounded queue into Qdrant upserts on a background thread.
+    A batch is flushed when it reaches batch_size or when its oldest point has waited
+    flush_interval_ms. close() is the durability barrier: it flushes what is left,
+    waits for the writer thread and re-raises any upsert error.
+    """
+
+    def __init__(
+        self,
+        upsert_fn: Callable[[List[qmodels.PointStruct]], None],
+        batch_size: int,
+        flush_interval_ms: int,
+        max_queue_size: int,
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be >= 1")
+
+        self.upsert_fn = upsert_fn
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="qdrant-writer", daemon=True
+        )
+        self._error: Optional[BaseException] = None
+
+        self.flushed_points = 0
+        self.flush_count = 0
+        self.peak_queue_depth = 0
+
+    def __enter__(self) -> "QdrantBatchWriter":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not mask the original error, but still stop the writer thread
+            try:
+                self.close()
+            except Exception as error:
+                logger.error(f"Qdrant writer failed while aborting: {error}")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def put(self, point: qmodels.PointStruct) -> None:
+        # Blocks when the queue is full (backpressure on the embedding stage), but
+        # wakes up periodically so a dead writer does not hang the producer.
+        while True:
+            self._raise_if_failed()
+            try:
+                self._queue.put(point, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self.peak_queue_depth = max(self.peak_queue_depth, self._queue.qsize())
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            while self._thread.is_alive():
+                try:
+                    self._queue.put(_CLOSE, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join()
+        self._raise_if_failed()
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flushed_points": self.flushed_points,
+            "flush_count": self.flush_count,
+            "peak_queue_depth": self.peak_queue_depth,
+        }
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Qdrant writer failed: {self._error}") from self._error
+
+    def _flush(self, batch: List[qmodels.PointStruct]) -> None:
+        if not batch:
+            return
+        self.upsert_fn(batch)
+        self.flushed_points += len(batch)
+        self.flush_count += 1
+        logger.info(f"Upserted {self.flushed_points} points to Qdrant")
+
+    def _run(self) -> None:
+        batch: List[qmodels.PointStruct] = []
+        batch_started_at = 0.0
+
+        try:
+            while True:
+                timeout = None
+                if batch:
+                    elapsed = time.monotonic() - batch_started_at
+                    timeout = max(0.0, self.flush_interval_s - elapsed)
+
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    # Time-based flush
+                    self._flush(batch)
+                    batch = []
+                    continue
+
+                if item is _CLOSE:
+                    self._flush(batch)
+                    return
+
+                if not batch:
+                    batch_started_at = time.monotonic()
+                batch.append(item)
+
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+        except BaseException as error:
+            # The producer checks this on every put() and close()
+            self._error = error
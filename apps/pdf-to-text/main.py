@@ -3,18 +3,28 @@ from __future__ import annotations
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import re
+from collections import deque
 from datetime import datetime, timezone
+from importlib import metadata
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 from urllib.parse import unquote_plus
 
-import boto3
-import pymupdf4llm
 from dotenv import load_dotenv
+from utils.batch import parse_s3_uris, process_batch
+from utils.clients import aws_client_config
 from utils.env_vars import validate_required_env
-from utils.s3 import download_s3_object, parse_s3_uri, upload_s3_object
+from utils.manifest import load_manifest, stage_fingerprint, write_manifest
+from utils.s3 import (
+    S3MultipartWriter,
+    download_s3_object,
+    parse_s3_uri,
+    upload_s3_object,
+)
+from utils.startup import Lazy, lazy_import, report_startup, startup
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,7 +39,28 @@ TMP_DIR = Path("/tmp")
 CORPUS_PATH = TMP_DIR / "corpus.json"
 MD_PATH = TMP_DIR / "extracted.md"
 BUCKET = os.getenv("KNOWLEDGE_BASE_BUCKET")
-s3_client = boto3.client("s3")
+# Page-parallel extraction: worker processes (0 = one per vCPU) and the minimum
+# number of pages per worker below which extraction stays serial
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+PDF_MIN_PAGES_PER_WORKER = max(1, int(os.getenv("PDF_MIN_PAGES_PER_WORKER", "8")))
+# Documents with at least this many pages (0 = never) are extracted in batches of
+# PDF_STREAMING_BATCH_PAGES and streamed to S3 instead of being held in memory
+PDF_STREAMING_MIN_PAGES = int(os.getenv("PDF_STREAMING_MIN_PAGES", "200"))
+PDF_STREAMING_BATCH_PAGES = max(1, int(os.getenv("PDF_STREAMING_BATCH_PAGES", "32")))
+# Skip extraction when a completed manifest exists for the same doc_id and config
+STAGE_MANIFESTS = os.getenv("STAGE_MANIFESTS", "true").lower() == "true"
+STAGE = "pdf-to-text"
+MD_CONTENT_TYPE = "text/markdown; charset=utf-8"
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+_WHITESPACE_RE = re.compile(r"\s+")
+_NON_WHITESPACE_RE = re.compile(r"\S")
+
+# Deferred: an invocation answered from a manifest never loads the extractor
+boto3 = lazy_import("boto3")
+pymupdf = lazy_import("pymupdf")
+pymupdf4llm = lazy_import("pymupdf4llm")
+document_layout = lazy_import("pymupdf4llm.helpers.document_layout")
+s3_client = Lazy("client s3", lambda: boto3.client("s3", config=aws_client_config()))
 
 
 def safe_name(name: str, max_len: int = 160) -> str:
@@ -47,6 +78,101 @@ def normalize_md(text: str) -> str:
     return text.strip()
 
 
+class MarkdownStreamNormalizer:
+    """
+    Incremental normalize_md: text can be fed in pieces of any size, the
+    concatenated return values of feed() and finish() equal normalize_md of the
+    concatenated input. Only the current line is buffered.
+    """
+
+    def __init__(self) -> None:
+        self._carry = ""
+        self._started = False
+        self._blank_lines = 0
+
+    def feed(self, text: str) -> str:
+        text = self._carry + text
+        held = ""
+        if text.endswith("\r"):
+            # May be the first half of a \r\n split across pieces
+            text, held = text[:-1], "\r"
+        lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        self._carry = lines.pop() + held
+        return "".join(self._line(line) for line in lines)
+
+    def finish(self) -> str:
+        text = self._carry.replace("\r\n", "\n").replace("\r", "\n")
+        self._carry = ""
+        return "".join(self._line(line) for line in text.split("\n"))
+
+    def _line(self, line: str) -> str:
+        line = line.rstrip()
+        if not line:
+            self._blank_lines += 1
+            return ""
+        if not self._started:
+            # Leading blank lines and indentation are stripped
+            self._started = True
+            out = line.lstrip()
+        else:
+            # Runs of blank lines collapse to a single one
+            out = "\n" * min(self._blank_lines + 1, 2) + line
+        self._blank_lines = 0
+        return out
+
+
+class PageOffsetTracker:
+    """
+    Maps each page to its [start, end) character range in the normalized text.
+    Normalization only removes whitespace, so the n-th non-whitespace character of
+    the output is the n-th one of the concatenated pages. Pages and normalized
+    output are both added incrementally.
+    """
+
+    def __init__(self) -> None:
+        self.pages: List[Dict[str, Any]] = []
+        # (page, first non-whitespace index, index after the last one)
+        self._pending: deque = deque()
+        self._input_chars = 0
+        self._output_chars = 0
+        self.length = 0
+
+    def add_page(self, text: str) -> None:
+        page = {"page": len(self.pages) + 1, "start": None, "end": None}
+        self.pages.append(page)
+        count = len(_WHITESPACE_RE.sub("", text))
+        if count:
+            self._pending.append((page, self._input_chars, self._input_chars + count))
+            self._input_chars += count
+
+    def add_output(self, text: str) -> None:
+        count = len(_WHITESPACE_RE.sub("", text))
+        limit = self._output_chars + count
+        if self._pending and self._pending[0][1] < limit:
+            positions = [m.start() for m in _NON_WHITESPACE_RE.finditer(text)]
+            while self._pending:
+                page, first, stop = self._pending[0]
+                if page["start"] is None:
+                    if first >= limit:
+                        break
+                    page["start"] = self.length + positions[first - self._output_chars]
+                if stop > limit:
+                    break
+                page["end"] = self.length + positions[stop - 1 - self._output_chars] + 1
+                self._pending.popleft()
+        self._output_chars = limit
+        self.length += len(text)
+
+    def finish(self) -> List[Dict[str, int]]:
+        # Pages without text get an empty range at the end of the previous page
+        end = 0
+        for page in self.pages:
+            if page["start"] is None:
+                page["start"] = page["end"] = end
+            end = page["end"]
+        return self.pages
+
+
 def sha256_file(path: Path) -> str:
     h = hashlib.sha256()
     with path.open("rb") as f:
@@ -55,11 +181,185 @@ def sha256_file(path: Path) -> str:
     return h.hexdigest()
 
 
-def pdf_to_markdown(pdf_path: Path) -> str:
-    logging.info("Extracting PDF content to Markdown")
-    md = pymupdf4llm.to_markdown(str(pdf_path), page_chunks=False)
+def split_pages(pages: range, workers: int) -> List[range]:
+    size, extra = divmod(len(pages), workers)
+    ranges = []
+    start = pages.start
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(range(start, end))
+        start = end
+    return ranges
+
+
+def _parse_pages(pdf_path: Path, pages: range):
+    return document_layout.parse_document(
+        str(pdf_path), pages=list(pages), force_text=True
+    )
+
+
+def _parse_pages_worker(conn, pdf_path: Path, pages: range) -> None:
+    try:
+        conn.send((True, _parse_pages(pdf_path, pages).pages))
+    except BaseException as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def extract_pages_parallel(pdf_path: Path, pages: range, workers: int) -> List[str]:
+    """
+    Runs the layout analysis of each page range in its own process (the first range
+    in this one), then renders the reassembled document. Uses Process + Pipe since
+    Lambda has no /dev/shm for the semaphores of multiprocessing.Pool.
+    """
+    ranges = split_pages(pages, workers)
+    # fork: spawn would re-import this module (clients, DEVELOPMENT event)
+    ctx = multiprocessing.get_context("fork")
+    children = []
+    for child_pages in ranges[1:]:
+        recv_conn, send_conn = ctx.Pipe(duplex=False)
+        proc = ctx.Process(
+            target=_parse_pages_worker,
+            args=(send_conn, pdf_path, child_pages),
+            daemon=True,
+        )
+        proc.start()
+        send_conn.close()
+        children.append((proc, recv_conn, child_pages))
+
+    try:
+        document = _parse_pages(pdf_path, ranges[0])
+        for _, conn, child_pages in children:
+            ok, payload = conn.recv()
+            if not ok:
+                raise RuntimeError(
+                    f"Extraction of pages {child_pages.start + 1}-{child_pages.stop} failed: {payload}"
+                )
+            document.pages.extend(payload)
+    finally:
+        for proc, conn, _ in children:
+            conn.close()
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+    if hasattr(document_layout, "update_header_tags"):
+        # Newer pymupdf4llm ranks header levels on the font sizes of the whole
+        # document, each worker only saw its own pages
+        header_fontsizes = {
+            box.max_fontsize
+            for page in document.pages
+            for box in page.boxes
+            if box.boxclass in ("title", "section-header")
+        }
+        document_layout.update_header_tags(document.pages, header_fontsizes)
+
+    return [chunk["text"] for chunk in document.to_markdown(page_chunks=True)]
+
+
+def layout_active() -> bool:
+    # Importing pymupdf4llm activates the layout engine if pymupdf-layout is installed
+    pymupdf4llm.get()
+    return pymupdf._get_layout is not None
+
+
+def layout_installed() -> bool:
+    try:
+        metadata.distribution("pymupdf-layout")
+    except metadata.PackageNotFoundError:
+        return False
+    return True
+
+
+def extract_pages(pdf_path: Path, pages: range) -> List[str]:
+    """
+    Markdown of each page of the range, in page order.
+    """
+    workers = min(PDF_EXTRACT_WORKERS, len(pages) // PDF_MIN_PAGES_PER_WORKER)
+
+    # Page ranges are only independent with the layout engine (pymupdf-layout)
+    if workers > 1 and layout_active():
+        logging.info(
+            f"Extracting pages {pages.start + 1}-{pages.stop} to Markdown workers={workers}"
+        )
+        return extract_pages_parallel(pdf_path, pages, workers)
+
+    logging.info(f"Extracting pages {pages.start + 1}-{pages.stop} to Markdown")
+    return [
+        chunk["text"]
+        for chunk in pymupdf4llm.to_markdown(
+            str(pdf_path), pages=list(pages), page_chunks=True
+        )
+    ]
+
+
+def pdf_to_markdown(
+    pdf_path: Path, page_count: int
+) -> Tuple[str, List[Dict[str, int]]]:
+    page_texts = extract_pages(pdf_path, range(page_count))
     logging.info("PDF content extracted to Markdown successfully")
-    return normalize_md(md)
+
+    md = normalize_md("".join(page_texts))
+    tracker = PageOffsetTracker()
+    for page_text in page_texts:
+        tracker.add_page(page_text)
+    for line in md.splitlines(keepends=True):
+        tracker.add_output(line)
+    return md, tracker.finish()
+
+
+def stream_pdf_to_s3(
+    pdf_path: Path,
+    page_count: int,
+    record: Dict[str, Any],
+    md_key: str,
+    corpus_key: str,
+) -> Dict[str, Any]:
+    """
+    Bounded-memory variant of pdf_to_markdown + upload: pages are extracted in
+    batches, normalized incrementally and written to both S3 objects through
+    multipart uploads, so only one batch of pages and one upload part per object
+    are held in memory. corpus.json is byte-identical to json.dumps of the record.
+    """
+    normalizer = MarkdownStreamNormalizer()
+    tracker = PageOffsetTracker()
+
+    with S3MultipartWriter(
+        s3_client, BUCKET, md_key, MD_CONTENT_TYPE
+    ) as md_writer, S3MultipartWriter(
+        s3_client, BUCKET, corpus_key, JSON_CONTENT_TYPE
+    ) as corpus_writer:
+        # The record is written around the text: "text" and "pages" are its last keys
+        head = json.dumps(record, ensure_ascii=False)
+        corpus_writer.write(head[:-1] + ', "text": "')
+
+        def write(piece: str) -> None:
+            if piece:
+                md_writer.write(piece)
+                corpus_writer.write(json.dumps(piece, ensure_ascii=False)[1:-1])
+                tracker.add_output(piece)
+
+        for start in range(0, page_count, PDF_STREAMING_BATCH_PAGES):
+            batch = range(start, min(start + PDF_STREAMING_BATCH_PAGES, page_count))
+            for page_text in extract_pages(pdf_path, batch):
+                tracker.add_page(page_text)
+                write(normalizer.feed(page_text))
+        write(normalizer.finish())
+
+        if not tracker.length:
+            # Raising inside the block aborts both uploads
+            raise RuntimeError("No text extracted. PDF may be scanned or protected.")
+        pages = tracker.finish()
+        corpus_writer.write(
+            '", "pages": ' + json.dumps(pages, ensure_ascii=False) + "}\n"
+        )
+
+    logging.info(
+        f"PDF content streamed to S3 pages={page_count} chars={tracker.length}"
+    )
+    # The text stays in S3, the result only carries the metadata
+    return {**record, "page_count": page_count, "text_chars": tracker.length}
 
 
 def extract_s3_uri_from_event(event: Dict[str, Any]) -> str:
@@ -77,27 +377,49 @@ def extract_s3_uri_from_event(event: Dict[str, Any]) -> str:
     )
 
 
-def process_pdf_from_s3(s3_uri: str) -> Dict[str, Any]:
+def stage_config(s3_uri: str) -> Dict[str, Any]:
+    # Everything besides the PDF bytes (doc_id) that changes the outputs. Read from
+    # package metadata, so checking the manifest does not import the extractor
+    return {
+        "source_s3_uri": s3_uri,
+        "extractor": "pymupdf4llm",
+        "extractor_version": metadata.version("pymupdf4llm"),
+        "layout": layout_installed(),
+    }
+
+
+def process_pdf_from_s3(s3_uri: str, force: bool = False) -> Dict[str, Any]:
     bucket, key = parse_s3_uri(s3_uri)
     if not key.lower().endswith(".pdf"):
         raise ValueError(f"Object is not a PDF (key={key})")
 
-    # Put the downloaded PDF in /tmp
+    # Put the downloaded PDF in /tmp, removed once processed so that a batch of
+    # documents does not fill the Lambda's ephemeral storage
     local_pdf = TMP_DIR / safe_name(Path(key).name)
     download_s3_object(s3_client, bucket, key, local_pdf)
+    try:
+        return process_local_pdf(local_pdf, s3_uri, key, force)
+    finally:
+        local_pdf.unlink(missing_ok=True)
 
+
+def process_local_pdf(
+    local_pdf: Path, s3_uri: str, key: str, force: bool
+) -> Dict[str, Any]:
     doc_id = sha256_file(local_pdf)[:16]
+    config = stage_config(s3_uri)
+    fingerprint = stage_fingerprint(config)
+    if STAGE_MANIFESTS and not force:
+        manifest = load_manifest(s3_client, BUCKET, doc_id, STAGE, fingerprint)
+        if manifest:
+            logging.info(
+                f"doc_id={doc_id} already extracted at {manifest['completed_at_utc']}, skipping"
+            )
+            return {**manifest["result"], "from_manifest": True}
+
     title = Path(key).stem
     extracted_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
-    md = pdf_to_markdown(local_pdf)
-    if not md:
-        raise RuntimeError("No text extracted. PDF may be scanned or protected.")
-
-    # Write markdown file (overwrite)
-    MD_PATH.write_text(md, encoding="utf-8")
-
-    # Write single record to corpus.json (overwrite)
     md_key = f"clean/{doc_id}/extract_text.md"
     corpus_key = f"clean/{doc_id}/corpus.json"
     record = {
@@ -107,8 +429,44 @@ def process_pdf_from_s3(s3_uri: str) -> Dict[str, Any]:
         "corpus_s3_uri": f"s3://{BUCKET}/{corpus_key}",
         "extracted_at_utc": extracted_at,
         "format": "markdown",
-        "text": md,
     }
+
+    with pymupdf.open(local_pdf) as doc:
+        page_count = doc.page_count
+    if PDF_STREAMING_MIN_PAGES and page_count >= PDF_STREAMING_MIN_PAGES:
+        result = stream_pdf_to_s3(local_pdf, page_count, record, md_key, corpus_key)
+    else:
+        result = extract_to_s3(local_pdf, page_count, record, md_key, corpus_key)
+
+    if STAGE_MANIFESTS:
+        # The text is already in S3, the manifest only keeps the metadata
+        write_manifest(
+            s3_client, BUCKET, doc_id, STAGE, fingerprint, config, summarize(result)
+        )
+    return result
+
+
+def summarize(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in result.items() if k not in ("text", "pages")}
+
+
+def extract_to_s3(
+    pdf_path: Path,
+    page_count: int,
+    record: Dict[str, Any],
+    md_key: str,
+    corpus_key: str,
+) -> Dict[str, Any]:
+    md, pages = pdf_to_markdown(pdf_path, page_count)
+    if not md:
+        raise RuntimeError("No text extracted. PDF may be scanned or protected.")
+
+    # Write markdown file (overwrite)
+    MD_PATH.write_text(md, encoding="utf-8")
+
+    # Write single record to corpus.json (overwrite)
+    record["text"] = md
+    record["pages"] = pages
     CORPUS_PATH.write_text(
         json.dumps(record, ensure_ascii=False) + "\n", encoding="utf-8"
     )
@@ -119,16 +477,27 @@ def process_pdf_from_s3(s3_uri: str) -> Dict[str, Any]:
     return record
 
 
+@report_startup
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     logger.info(f"Input Event => {event}")
     validate_required_env(["KNOWLEDGE_BASE_BUCKET"])
+    force = bool(event.get("force"))
+    if "s3_uris" in event:
+        # Batch mode: the text of each document stays in S3, results only carry
+        # the metadata to keep the response small
+        return process_batch(
+            parse_s3_uris(event),
+            lambda s3_uri: summarize(process_pdf_from_s3(s3_uri, force=force)),
+        )
     s3_uri = event.get("s3_uri")
     if not isinstance(s3_uri, str) or not s3_uri:
         raise ValueError("Expected event['s3_uri'] as a non-empty string")
-    result = process_pdf_from_s3(s3_uri)
+    result = process_pdf_from_s3(s3_uri, force=force)
     return {"result": result}
 
 
+startup.init_done()
+
 if os.getenv("ENV", "").upper() == "DEVELOPMENT":
     event = {"s3_uri": "s3://knowledge-base-dev-937168356724/raw/Buying-as-a-guest.pdf"}
     lambda_handler(
@@ -0,0 +1,336 @@
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import boto3
+import pymupdf
+
+APPS_DIR = Path(__file__).resolve().parent.parent
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    force=True,
+)
+logger = logging.getLogger("pipeline")
+logger.setLevel(logging.INFO)
+
+# Loaded by load_stages() in every worker process
+pdf_to_text = None
+chunking = None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Runs pdf-to-text, chunking and embedding in-process over a directory of PDFs or an S3 prefix"
+    )
+    parser.add_argument(
+        "source", help="Local directory (e.g. ../../corpus) or s3://bucket/prefix"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes extracting and chunking PDFs (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=0,
+        help="Documents extracted ahead of the embedding stage (default: 2 per worker)",
+    )
+    parser.add_argument(
+        "--source-prefix",
+        help="URI recorded as source_s3_uri of local PDFs, followed by their path in the source directory (e.g. s3://bucket/raw/). Default: file:// URI",
+    )
+    parser.add_argument("--embedding-concurrency", type=int)
+    parser.add_argument(
+        "--collection", help="Qdrant collection (default: QDRANT_COLLECTION)"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Write the report to this JSON file"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    # The Lambdas read their configuration at import time
+    overrides = {"ENV": ""}
+    if args.workers > 1:
+        # Documents already run in parallel, do not fork page workers as well
+        overrides["PDF_EXTRACT_WORKERS"] = "1"
+    if args.embedding_concurrency:
+        overrides["EMBEDDING_MAX_CONCURRENCY"] = str(args.embedding_concurrency)
+    if args.collection:
+        overrides["QDRANT_COLLECTION"] = args.collection
+    os.environ.update(overrides)
+    for app in ("utils", "embedding"):
+        sys.path.insert(0, str(APPS_DIR / app))
+
+
+def load_lambda(app: str):
+    # Every Lambda module is called main.py, load each one under its own name
+    spec = importlib.util.spec_from_file_location(
+        f"{app.replace('-', '_')}_main", APPS_DIR / app / "main.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_stages(log_level: str) -> None:
+    global pdf_to_text, chunking
+    sys.path.insert(0, str(APPS_DIR / "utils"))
+    pdf_to_text = load_lambda("pdf-to-text")
+    chunking = load_lambda("chunking")
+    # The Lambdas reset logging on import
+    logging.getLogger().setLevel(log_level.upper())
+
+
+def split_s3_uri(s3_uri: str) -> tuple[str, str]:
+    bucket, _, key = s3_uri[len("s3://") :].partition("/")
+    return bucket, key
+
+
+def list_sources(source: str) -> List[str]:
+    if source.startswith("s3://"):
+        bucket, prefix = split_s3_uri(source)
+        paginator = boto3.client("s3").get_paginator("list_objects_v2")
+        return [
+            f"s3://{bucket}/{obj['Key']}"
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+            if obj["Key"].lower().endswith(".pdf")
+        ]
+
+    directory = Path(source)
+    if not directory.is_dir():
+        raise ValueError(f"Expected a directory or s3://bucket/prefix, got: {source}")
+    return [
+        str(path)
+        for path in sorted(directory.rglob("*"))
+        if path.is_file() and path.suffix.lower() == ".pdf"
+    ]
+
+
+def extract_and_chunk(source: str, source_uri: str) -> Dict[str, Any]:
+    """
+    Runs in a worker process: the pdf-to-text and chunking steps of one PDF. The
+    Markdown and the chunk records stay in memory, nothing is written to S3.
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        if source.startswith("s3://"):
+            bucket, key = split_s3_uri(source)
+            title = Path(key).stem
+            pdf_path = Path(tmp) / pdf_to_text.safe_name(Path(key).name)
+            pdf_to_text.s3_client.download_file(bucket, key, str(pdf_path))
+        else:
+            pdf_path = Path(source)
+            title = pdf_path.stem
+
+        doc_id = pdf_to_text.sha256_file(pdf_path)[:16]
+        with pymupdf.open(pdf_path) as doc:
+            page_count = doc.page_count
+        text, _ = pdf_to_text.pdf_to_markdown(pdf_path, page_count)
+    if not text:
+        raise RuntimeError("No text extracted. PDF may be scanned or protected.")
+    extracted = time.perf_counter()
+
+    record = {
+        "doc_id": doc_id,
+        "title": title,
+        "source_s3_uri": source_uri,
+        "extracted_at_utc": datetime.now(timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z"),
+        "format": "markdown",
+    }
+    chunks = chunking.build_chunk_records(record, chunking.split_text(text))
+    return {
+        "doc_id": doc_id,
+        "page_count": page_count,
+        "chunks": chunks,
+        "extract_s": extracted - started,
+        "chunk_s": time.perf_counter() - extracted,
+    }
+
+
+def source_uri(source: str, args: argparse.Namespace) -> str:
+    if source.startswith("s3://"):
+        return source
+    if args.source_prefix:
+        return args.source_prefix + Path(source).relative_to(args.source).as_posix()
+    return Path(source).resolve().as_uri()
+
+
+class PipelineReport:
+    """
+    Counts what went through each stage, for the throughput report.
+    """
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.started = time.perf_counter()
+        self.extracted = 0
+        self.pages = 0
+        self.chunks = 0
+        self.extract_s = 0.0
+        self.chunk_s = 0.0
+        self.duplicates: List[str] = []
+        self.failures: List[Dict[str, Any]] = []
+
+    def add_extracted(self, source: str, doc: Dict[str, Any]) -> None:
+        self.extracted += 1
+        self.pages += doc["page_count"]
+        self.chunks += len(doc["chunks"])
+        self.extract_s += doc["extract_s"]
+        self.chunk_s += doc["chunk_s"]
+        logger.info(
+            f"[{self.extracted + len(self.failures)}/{self.total}] {source} doc_id={doc['doc_id']} pages={doc['page_count']} chunks={len(doc['chunks'])} extract={doc['extract_s']:.2f}s chunk={doc['chunk_s']:.2f}s"
+        )
+
+    def add_failure(self, source: str, stage: str, error: BaseException) -> None:
+        logger.error(f"{stage} failed for {source}: {error!r}")
+        self.failures.append(
+            {
+                "source": source,
+                "stage": stage,
+                "error_type": type(error).__name__,
+                "error": str(error),
+            }
+        )
+
+    def summary(
+        self, runs: List[Any], embedding_stats: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        wall_s = time.perf_counter() - self.started
+        results = [run.result for run in runs if run.error is None]
+        vectors = sum(r["embedding_count"] for r in results)
+
+        def rate(count: int) -> float:
+            return round(count / wall_s, 2) if wall_s else 0.0
+
+        return {
+            "documents": self.total,
+            "succeeded": len(results),
+            "failed": len(self.failures),
+            "duplicates": len(self.duplicates),
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "vectors": vectors,
+            "embedded": sum(r["embedded_count"] for r in results),
+            "reused": sum(r["reused_count"] for r in results),
+            "skipped": sum(r["skipped_count"] for r in results),
+            "deleted": sum(r["deleted_count"] for r in results),
+            "wall_s": round(wall_s, 3),
+            "pages_per_s": rate(self.pages),
+            "chunks_per_s": rate(self.chunks),
+            "vectors_per_s": rate(vectors),
+            "extract_cpu_s": round(self.extract_s, 3),
+            "chunk_cpu_s": round(self.chunk_s, 3),
+            "embedding": embedding_stats,
+            "failures": self.failures,
+        }
+
+
+def extracted_documents(
+    executor: ProcessPoolExecutor,
+    sources: List[str],
+    args: argparse.Namespace,
+    report: PipelineReport,
+    document_run,
+) -> Iterator[Any]:
+    """
+    Feeds the embedding stage with documents as the workers finish them (in
+    completion order). At most max_pending documents are in the workers or waiting
+    for embedding, so memory is bounded when embedding is the slower stage.
+    """
+    max_pending = args.max_pending or 2 * args.workers
+    queued = iter(sources)
+    pending: Dict[Future, str] = {}
+    seen_doc_ids: set[str] = set()
+
+    def submit_next() -> None:
+        for source in queued:
+            future = executor.submit(
+                extract_and_chunk, source, source_uri(source, args)
+            )
+            pending[future] = source
+            return
+
+    for _ in range(max_pending):
+        submit_next()
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            source = pending.pop(future)
+            submit_next()
+            try:
+                doc = future.result()
+            except Exception as error:
+                report.add_failure(source, "extract", error)
+                continue
+
+            report.add_extracted(source, doc)
+            if doc["doc_id"] in seen_doc_ids:
+                # Same PDF content under another name: same doc_id and points
+                logger.info(f"{source} duplicates doc_id={doc['doc_id']}, skipping")
+                report.duplicates.append(source)
+                continue
+            seen_doc_ids.add(doc["doc_id"])
+            yield document_run(source, records=doc["chunks"])
+
+
+def main() -> int:
+    args = parse_args()
+    configure_environment(args)
+    embedding = load_lambda("embedding")
+    embedding.validate_required_env(["QDRANT_URL", "QDRANT_COLLECTION"])
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    sources = list_sources(args.source)
+    logger.info(
+        f"Indexing {len(sources)} PDFs from {args.source} into {embedding.QDRANT_COLLECTION} with {args.workers} workers"
+    )
+    report = PipelineReport(len(sources))
+
+    # spawn: the parent already runs the Qdrant client and writer threads
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=load_stages,
+        initargs=(args.log_level,),
+    ) as executor:
+        runs, stats = embedding.embed_documents(
+            extracted_documents(executor, sources, args, report, embedding.DocumentRun)
+        )
+    for run in runs:
+        if run.error is not None:
+            report.add_failure(run.s3_uri, "embed", run.error)
+
+    summary = report.summary(runs, stats)
+    summary["vector_snapshot"] = embedding.publish_vector_snapshot(
+        [run.result for run in runs if run.error is None]
+    )
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        logger.info(f"Report written to {args.output}")
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import logging
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def parse_s3_uris(event: Dict[str, Any]) -> List[str]:
+    """
+    Returns the documents of a batch event ({"s3_uris": [...]}) in order, without
+    duplicates, so each document is processed once per invocation.
+    """
+    s3_uris = event.get("s3_uris")
+    if not isinstance(s3_uris, list) or not all(
+        isinstance(s3_uri, str) and s3_uri for s3_uri in s3_uris
+    ):
+        raise ValueError("Expected event['s3_uris'] as a list of non-empty strings")
+    return list(dict.fromkeys(s3_uris))
+
+
+def failure_record(s3_uri: str, error: BaseException) -> Dict[str, Any]:
+    return {
+        "s3_uri": s3_uri,
+        "error_type": type(error).__name__,
+        "error": str(error),
+    }
+
+
+def batch_response(
+    results: List[Dict[str, Any]], failures: List[Dict[str, Any]], **extra: Any
+) -> Dict[str, Any]:
+    return {"ok": not failures, "results": results, "failures": failures, **extra}
+
+
+def process_batch(
+    s3_uris: List[str], process_fn: Callable[[str], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Runs process_fn for each document in turn. A failing document is recorded and
+    the batch goes on, so one bad input does not fail the others.
+    """
+    results: List[Dict[str, Any]] = []
+    failures: List[Dict[str, Any]] = []
+    for s3_uri in s3_uris:
+        try:
+            results.append(process_fn(s3_uri))
+        except Exception as error:
+            logger.exception(f"Could not process {s3_uri}")
+            failures.append(failure_record(s3_uri, error))
+
+    logger.info(
+        f"Processed batch of {len(s3_uris)} documents: {len(results)} succeeded, {len(failures)} failed"
+    )
+    return batch_response(results, failures)
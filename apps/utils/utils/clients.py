@@ -0,0 +1,28 @@
+import importlib
+from typing import Any
+
+
+def aws_client_config(
+    max_pool_connections: int = 10,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 60.0,
+    retry_mode: str = "adaptive",
+    max_attempts: int = 5,
+    **kwargs: Any,
+):
+    """
+    botocore Config shared by the Lambdas' AWS clients: a connection pool sized for
+    the calls that run in parallel, TCP keep-alive so a warm container reuses its
+    connections, explicit timeouts and the adaptive retry mode (client-side rate
+    limiting on throttling).
+    """
+    # Imported on first client creation, like boto3 (see utils.startup)
+    config = importlib.import_module("botocore.config")
+    return config.Config(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries={"mode": retry_mode, "total_max_attempts": max_attempts},
+        tcp_keepalive=True,
+        **kwargs,
+    )
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PREFIX = "manifests"
+
+
+def manifest_key(doc_id: str, stage: str) -> str:
+    return f"{MANIFEST_PREFIX}/{doc_id}/{stage}.json"
+
+
+def stage_fingerprint(config: Dict[str, Any]) -> str:
+    # Stable across runs and key order: any change of a value means new work
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def object_etag(s3_client: BaseClient, bucket: str, key: str) -> str:
+    return s3_client.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+
+
+def load_manifest(
+    s3_client: BaseClient, bucket: str, doc_id: str, stage: str, fingerprint: str
+) -> Dict[str, Any] | None:
+    """
+    Returns the manifest of a completed run of stage for doc_id with the same
+    fingerprint, or None if the stage has to run.
+    """
+    key = manifest_key(doc_id, stage)
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as error:
+        if error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+
+    manifest = json.loads(body)
+    if manifest.get("status") != "completed":
+        return None
+    if manifest.get("fingerprint") != fingerprint:
+        logger.info(
+            f"Manifest {key} was written with another configuration, running {stage}"
+        )
+        return None
+    return manifest
+
+
+def write_manifest(
+    s3_client: BaseClient,
+    bucket: str,
+    doc_id: str,
+    stage: str,
+    fingerprint: str,
+    config: Dict[str, Any],
+    result: Dict[str, Any],
+) -> None:
+    """
+    Records a completed run. Must be the last step of the stage: the manifest is a
+    single PutObject, so it is either absent or complete, and it only exists once
+    every output has been written.
+    """
+    manifest = {
+        "doc_id": doc_id,
+        "stage": stage,
+        "status": "completed",
+        "fingerprint": fingerprint,
+        "config": config,
+        "completed_at_utc": datetime.now(timezone.utc)
+        .isoformat()
+        .replace("+00:00", "Z"),
+        "result": result,
+    }
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=manifest_key(doc_id, stage),
+        Body=json.dumps(manifest, ensure_ascii=False, default=str).encode("utf-8"),
+        ContentType="application/json; charset=utf-8",
+    )
+    logger.info(f"Wrote {stage} manifest for doc_id={doc_id}")
@@ -1,35 +1,42 @@
 import logging
 import mimetypes
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, Iterator, List, Tuple
 
 from botocore.client import BaseClient
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
-    force=True,
-)
-
 logger = logging.getLogger(__name__)
 
 
 def download_s3_object(
     s3_client: BaseClient, bucket: str, key: str, dest_path: Path
 ) -> None:
-    logging.info(f"Downloading file '{key}' from S3 bucket '{bucket}'...")
+    logger.info(f"Downloading file '{key}' from S3 bucket '{bucket}'...")
     dest_path.parent.mkdir(parents=True, exist_ok=True)
     try:
         s3_client.download_file(bucket, key, str(dest_path))
-        logging.info("Downloaded file completed")
+        logger.info("Downloaded file completed")
     except Exception as error:
-        logging.error(f"Could not download file from S3 Bucket because of: {error}")
+        logger.error(f"Could not download file from S3 Bucket because of: {error}")
+        raise
+
+
+def iter_s3_object_lines(
+    s3_client: BaseClient, bucket: str, key: str, chunk_size: int = 1024 * 1024
+) -> Iterator[bytes]:
+    # Reads the object body incrementally, only chunk_size bytes are buffered
+    logger.info(f"Streaming file '{key}' from S3 bucket '{bucket}'...")
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        yield from body.iter_lines(chunk_size=chunk_size)
+    finally:
+        body.close()
 
 
 def upload_s3_object(
     s3_client: BaseClient, bucket: str, key: str, file_path: Path
 ) -> None:
-    logging.info(
+    logger.info(
         f"Uploading file '{file_path}' to S3 bucket '{bucket}' using key '{key}'..."
     )
     suffix = file_path.suffix.lower()
@@ -51,9 +58,107 @@ def upload_s3_object(
                 "ContentDisposition": "inline",
             },
         )
-        logging.info("Upload completed")
+        logger.info("Upload completed")
     except Exception as error:
-        logging.error(f"Could not upload file to S3 Bucket because of: {error}")
+        logger.error(f"Could not upload file to S3 Bucket because of: {error}")
+        raise
+
+
+class S3MultipartWriter:
+    """
+    Writable S3 object: data is buffered up to part_size and sent as a multipart
+    upload part, so memory stays bounded whatever the object size. Objects smaller
+    than one part are sent with a single put_object. Use as a context manager: the
+    upload is completed on exit, or aborted if the block raised.
+    """
+
+    def __init__(
+        self,
+        s3_client: BaseClient,
+        bucket: str,
+        key: str,
+        content_type: str,
+        part_size: int = 8 * 1024 * 1024,
+    ) -> None:
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError("S3 multipart parts must be at least 5 MiB")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: List[Dict[str, Any]] = []
+
+    def write(self, data: str | bytes) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                ContentDisposition="inline",
+            )["UploadId"]
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def close(self) -> None:
+        if self._upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type,
+                ContentDisposition="inline",
+            )
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buffer.clear()
+        logger.info(
+            f"Uploaded {self.bytes_written} bytes to S3 bucket '{self.bucket}' using key '{self.key}' parts={max(len(self._parts), 1)}"
+        )
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            logger.error(f"Aborting multipart upload of '{self.key}'")
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+            self._upload_id = None
+
+    def __enter__(self) -> "S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
 
 def parse_s3_uri(s3_uri: str) -> Tuple[str, str]:
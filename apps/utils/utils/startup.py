@@ -0,0 +1,133 @@
+import functools
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Generic, Iterator, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def process_age_ms() -> float | None:
+    # Time since the process (the Lambda runtime) started, from /proc on Linux
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime_s = float(f.read().split()[0])
+        started_s = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+    return round((uptime_s - started_s) * 1000, 1)
+
+
+class StartupTimer:
+    """
+    Collects how long the module init took and how long each deferred import,
+    client and secret took to load, and logs the breakdown once, after the first
+    invocation of the container.
+    """
+
+    def __init__(self) -> None:
+        self.timings_ms: Dict[str, float] = {}
+        self.init_ms: float | None = None
+        self._reported = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self.timings_ms[name] = elapsed_ms
+            logger.info(f"Loaded {name} in {elapsed_ms}ms")
+
+    def init_done(self) -> None:
+        # Called at the end of the Lambda module: its imports and eager setup
+        self.init_ms = process_age_ms()
+
+    def report(self) -> Dict[str, Any] | None:
+        with self._lock:
+            if self._reported:
+                return None
+            self._reported = True
+            report = {
+                "init_ms": self.init_ms,
+                "timings_ms": dict(
+                    sorted(self.timings_ms.items(), key=lambda item: -item[1])
+                ),
+            }
+        logger.info(f"Cold start timings {json.dumps(report)}")
+        return report
+
+
+startup = StartupTimer()
+
+
+def report_startup(handler: Callable[..., T]) -> Callable[..., T]:
+    """
+    Decorates a Lambda handler to log the startup breakdown after its first call,
+    which includes what the first invocation loaded lazily.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event: Any, context: Any) -> T:
+        try:
+            return handler(event, context)
+        finally:
+            startup.report()
+
+    return wrapper
+
+
+class Lazy(Generic[T]):
+    """
+    Stands for the object built by factory, which only runs on first attribute
+    access (once, thread-safe). Module-level clients and heavy modules can keep
+    their names and call sites while an invocation that does not use them does
+    not pay for them.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]) -> None:
+        self._name = name
+        self._factory = factory
+        self._value: T | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    with startup.measure(self._name):
+                        self._value = self._factory()
+        return self._value
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def reset(self) -> None:
+        # The next access builds a new object (e.g. after a credential rotation)
+        with self._lock:
+            self._value = None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.get(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._value is not None else "not loaded"
+        return f"<Lazy {self._name} ({state})>"
+
+
+def lazy_import(name: str) -> Any:
+    # The module is imported (and timed) on first attribute access
+    return Lazy(f"import {name}", lambda: importlib.import_module(name))
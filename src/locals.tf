@@ -13,5 +13,7 @@ locals {
 
   vector_index_name = "bedrock-kb-index"
 
+  vector_snapshot_s3_uri = "s3://${aws_s3_bucket.knowledge_base.id}/snapshots/kb"
+
   kb_web_crawler_url_chunks = chunklist(distinct(var.kb_web_crawler_urls), 10)
 }
@@ -217,7 +217,8 @@ module "pdf_to_text" {
         Action = [
           "s3:Listbucket",
           "s3:GetObject",
-          "s3:PutObject"
+          "s3:PutObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = [
           aws_s3_bucket.knowledge_base.arn,
@@ -281,6 +282,21 @@ module "embedding" {
           "${aws_s3_bucket.knowledge_base.arn}/*"
         ]
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject"
+        ]
+        Resource = ["${aws_s3_bucket.knowledge_base.arn}/manifests/*"]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = ["${aws_s3_bucket.knowledge_base.arn}/snapshots/*"]
+      },
       {
         Effect = "Allow"
         Action = [
@@ -297,11 +313,18 @@ module "embedding" {
       },
     ]
   })
-  environment_variables = {
-    QDRANT_URL        = "http://${local.qdrant_hostname}.${var.cloud_map_namespace_name}:6333"
-    QDRANT_API_KEY    = aws_secretsmanager_secret.qdrant_api_key.arn
-    QDRANT_COLLECTION = "kb"
-  }
+  environment_variables = merge(
+    {
+      QDRANT_URL                     = "http://${local.qdrant_hostname}.${var.cloud_map_namespace_name}:6333"
+      QDRANT_API_KEY                 = aws_secretsmanager_secret.qdrant_api_key.arn
+      QDRANT_COLLECTION              = "kb"
+      QDRANT_ANSWER_CACHE_COLLECTION = "kb-answers"
+    },
+    # Snapshots are a full export of the collection, only worth it if the API reads them
+    var.retrieval_backend == "local" ? { VECTOR_SNAPSHOT_S3_URI = local.vector_snapshot_s3_uri } : {}
+  )
+  # Embeds every document of a pipe batch in one invocation
+  timeout     = 300
   vpc_enabled = true
   vpc_id      = module.vpc.vpc_id
   subnet_ids  = module.vpc.private_subnets
@@ -335,22 +358,32 @@ module "api" {
           "arn:aws:bedrock:${var.aws_region}::foundation-model/${var.llm_model_id}"
         ]
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject"
+        ]
+        Resource = ["${aws_s3_bucket.knowledge_base.arn}/snapshots/*"]
+      },
     ]
   })
   environment_variables = {
-    VECTOR_DB_HOST              = "http://${local.qdrant_hostname}.${var.cloud_map_namespace_name}:6333"
-    QDRANT_API_KEY              = aws_secretsmanager_secret.qdrant_api_key.arn
-    QDRANT_COLLECTION           = "kb"
-    BEDROCK_EMBEDDING_MODEL_ID  = var.embedding_model_id
-    BEDROCK_GENERATION_MODEL_ID = var.llm_model_id
-    TOP_K_DEFAULT               = "3"
-    TOP_K_MAX                   = "10"
-    MAX_CONTEXT_CHUNKS          = "3"
-    MAX_CONTEXT_CHARS           = "12000"
-    GEN_TEMPERATURE             = "0.2"
-    GEN_MAX_TOKENS              = "800"
-    LOG_LEVEL                   = "INFO"
-    AWS_LWA_INVOKE_MODE         = "response_stream" # Ref: https://github.com/awslabs/aws-lambda-web-adapter
+    VECTOR_DB_HOST                 = "http://${local.qdrant_hostname}.${var.cloud_map_namespace_name}:6333"
+    QDRANT_API_KEY                 = aws_secretsmanager_secret.qdrant_api_key.arn
+    QDRANT_COLLECTION              = "kb"
+    BEDROCK_EMBEDDING_MODEL_ID     = var.embedding_model_id
+    BEDROCK_GENERATION_MODEL_ID    = var.llm_model_id
+    TOP_K_DEFAULT                  = "3"
+    TOP_K_MAX                      = "10"
+    MAX_CONTEXT_CHUNKS             = "3"
+    MAX_CONTEXT_CHARS              = "12000"
+    GEN_TEMPERATURE                = "0.2"
+    GEN_MAX_TOKENS                 = "800"
+    LOG_LEVEL                      = "INFO"
+    QDRANT_ANSWER_CACHE_COLLECTION = "kb-answers"
+    RETRIEVAL_BACKEND              = var.retrieval_backend # "local" searches the snapshot below in-process
+    VECTOR_SNAPSHOT_S3_URI         = local.vector_snapshot_s3_uri
+    AWS_LWA_INVOKE_MODE            = "response_stream" # Ref: https://github.com/awslabs/aws-lambda-web-adapter
   }
   vpc_enabled = true
   vpc_id      = module.vpc.vpc_id
@@ -25,6 +25,17 @@ variable "llm_model_id" {
   default     = "google.gemma-3-4b-it"
 }
 
+variable "retrieval_backend" {
+  description = "Retrieval backend of the API: 'qdrant', or 'local' to search vector snapshots in-process (the embedding Lambda then publishes them)"
+  type        = string
+  default     = "qdrant"
+
+  validation {
+    condition     = contains(["qdrant", "local"], var.retrieval_backend)
+    error_message = "retrieval_backend must be 'qdrant' or 'local'."
+  }
+}
+
 variable "vpc_cidr" {
   description = "(Optional) The IPv4 CIDR block for the VPC. CIDR can be explicitly set or it can be derived from IPAM using `ipv4_netmask_length` & `ipv4_ipam_pool_id`"
   type        = string